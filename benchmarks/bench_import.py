@@ -0,0 +1,128 @@
+"""
+Benchmark the startup cost of the package: the time and peak memory of the
+imports of each entry point, in a fresh interpreter per run, and whether they
+load the heavy optional dependencies (matplotlib, scipy).
+
+The results are compared against a baseline file as in `suite.py`, and the
+benchmark exits with status 1 on regressions.
+
+Usage:
+    python benchmarks/bench_import.py [-repeat 5]
+                                      [-baseline benchmarks/import_baseline.json]
+                                      [-update-baseline]
+"""
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+from suite import compare
+
+# Name: import statement timed in a fresh interpreter
+IMPORTS = {
+    'package': "import point_utils",
+    'settings': "from point_utils import ConfigSettings",
+    'pipeline': "from point_utils.pipeline import run_job",
+    'batch': "from point_utils.batch import run_batch",
+    'service': "from point_utils.service import make_server",
+    'offsetter': "from point_utils.offsetter import offset_factory",
+}
+HEAVY_MODULES = ("matplotlib", "scipy")
+
+_MEASURE = """
+import json, sys, time, tracemalloc
+if {trace}:
+    tracemalloc.start()
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    'time': elapsed,
+    'peak_memory': tracemalloc.get_traced_memory()[1],
+    'loaded': [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+
+def _run_import(statement: str, trace: bool) -> dict:
+    code = _MEASURE.format(statement=statement, heavy=HEAVY_MODULES, trace=trace)
+    output = subprocess.run([sys.executable, "-c", code],
+                            check=True,
+                            capture_output=True,
+                            text=True).stdout
+    return json.loads(output)
+
+
+def measure_import(statement: str, repeat: int) -> dict:
+    """
+    Best time of `repeat` fresh interpreters importing the statement, and the
+    peak traced memory and heavy modules loaded in an extra traced run.
+    """
+    times = [_run_import(statement, trace=False)['time'] for _ in range(repeat)]
+    traced = _run_import(statement, trace=True)
+    return {
+        'time': min(times),
+        'peak_memory': traced['peak_memory'],
+        'loaded': traced['loaded'],
+    }
+
+
+def parse_args(cmd=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(usage=__doc__)
+    parser.add_argument("-imports",
+                        nargs="+",
+                        default=list(IMPORTS),
+                        choices=list(IMPORTS))
+    parser.add_argument("-repeat", type=int, default=5)
+    parser.add_argument("-baseline",
+                        type=str,
+                        default=None,
+                        help="Path to the baseline JSON file.")
+    parser.add_argument("-update-baseline",
+                        action="store_true",
+                        help="Overwrite the baseline with the results.")
+    parser.add_argument("-time-threshold", type=float, default=0.2)
+    parser.add_argument("-memory-threshold", type=float, default=0.1)
+    parser.add_argument("-min-time", type=float, default=0.02)
+    return parser.parse_args(cmd)
+
+
+def main(cmd=None) -> int:
+    args = parse_args(cmd)
+    results = {}
+    print(f"{'import':>12} {'time [s]':>10} {'memory [MiB]':>13}  loaded")
+    for name in args.imports:
+        results[name] = measure_import(IMPORTS[name], args.repeat)
+        print(f"{name:>12} {results[name]['time']:>10.3f} "
+              f"{results[name]['peak_memory'] / 2**20:>13.1f}  "
+              f"{', '.join(results[name]['loaded']) or '-'}",
+              flush=True)
+
+    if args.baseline is None:
+        return 0
+    baseline_path = Path(args.baseline)
+    if args.update_baseline or not baseline_path.exists():
+        with open(baseline_path, "w") as fhandle:
+            json.dump({'results': results}, fhandle, indent=2)
+        print(f"Saved the baseline to {baseline_path}.")
+        return 0
+
+    with open(baseline_path, "r") as fhandle:
+        baseline = json.load(fhandle)
+    regressions = compare(results, baseline['results'], args.time_threshold,
+                          args.memory_threshold, args.min_time)
+    regressions += [
+        f"{name} (loads {', '.join(result['loaded'])})"
+        for name, result in results.items()
+        if set(result['loaded']) - set(baseline['results'].get(name, result)['loaded'])
+    ]
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    print("No regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+Benchmark the batched KDTreeOffsets.get_offset_vecs against the original
+per-point query loop.
+
+Usage:
+    python benchmarks/bench_kdtree.py [-sizes 10000 100000 ...] [-fraction 0.1]
+
+For large clouds the per-point loop is only timed on the first
+`-max-loop-points` selected points and extrapolated linearly.
+"""
+import argparse
+import time
+
+import numpy as np
+from scipy.spatial import KDTree
+
+from point_utils.offsetter import KDTreeOffsets
+
+
+def point_loop_offset_vecs(tree, all_coordinates, point_indices,
+                           offset_magnitude, num_neighbors):
+    """
+    The original implementation: one K-D Tree query per selected point.
+    """
+    offset_vectors = []
+    for idx in point_indices:
+        point = all_coordinates[idx]
+        _, nearest_neighbor_indices = tree.query(point, k=num_neighbors)
+        avg_displacement = np.mean(
+            all_coordinates[nearest_neighbor_indices] - point, axis=0)
+        norm = np.linalg.norm(avg_displacement)
+        offset_vectors.append(-avg_displacement / norm * offset_magnitude)
+    return np.array(offset_vectors)
+
+
+def parse_args(cmd=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(usage=__doc__)
+    parser.add_argument("-sizes",
+                        type=int,
+                        nargs="+",
+                        default=[10**4, 10**5, 10**6, 10**7])
+    parser.add_argument("-fraction",
+                        type=float,
+                        default=0.1,
+                        help="Fraction of the points selected for offsetting.")
+    parser.add_argument("-num-neighbors", type=int, default=10)
+    parser.add_argument("-workers", type=int, default=-1)
+    parser.add_argument("-max-loop-points", type=int, default=20_000)
+    parser.add_argument("-seed", type=int, default=0)
+    return parser.parse_args(cmd)
+
+
+def main(cmd=None):
+    args = parse_args(cmd)
+    rng = np.random.default_rng(args.seed)
+
+    print(f"{'points':>10} {'selected':>10} {'loop [s]':>10} "
+          f"{'batched [s]':>12} {'speedup':>8} {'match':>6}")
+    for size in args.sizes:
+        all_coordinates = rng.normal(size=(size, 3))
+        labels = np.where(rng.random(size) < args.fraction, 'B', 'A')
+        offsetter = KDTreeOffsets(all_coordinates=all_coordinates,
+                                  labels=labels,
+                                  data_label_to_offset='B',
+                                  offset_magnitude=1.0,
+                                  new_data_label='C')
+        num_selected = len(offsetter.point_indices)
+
+        start = time.perf_counter()
+        batched = offsetter.get_offset_vecs(num_neighbors=args.num_neighbors,
+                                            workers=args.workers)
+        batched_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        tree = KDTree(all_coordinates)
+        build_time = time.perf_counter() - start
+
+        loop_indices = offsetter.point_indices[:args.max_loop_points]
+        start = time.perf_counter()
+        loop = point_loop_offset_vecs(tree, all_coordinates, loop_indices,
+                                      1.0, args.num_neighbors)
+        loop_time = build_time + (time.perf_counter() - start) * num_selected / max(
+            len(loop_indices), 1)
+
+        match = np.array_equal(loop, batched[:len(loop_indices)],
+                               equal_nan=True)
+        print(f"{size:>10} {num_selected:>10} {loop_time:>10.3f} "
+              f"{batched_time:>12.3f} {loop_time / batched_time:>8.1f} "
+              f"{str(match):>6}")
+
+
+if __name__ == "__main__":
+    main()
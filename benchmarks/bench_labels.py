@@ -0,0 +1,47 @@
+"""
+Compare the memory and label selection time of numpy string labels with
+categorical labels (integer codes plus a list of categories).
+
+Usage:
+    python benchmarks/bench_labels.py [-size 10000000]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from point_utils.labels import CategoricalLabels
+
+
+def parse_args(cmd=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(usage=__doc__)
+    parser.add_argument("-size", type=int, default=10**7)
+    parser.add_argument("-categories",
+                        nargs="+",
+                        default=["ground", "building", "vegetation", "B"])
+    parser.add_argument("-seed", type=int, default=0)
+    return parser.parse_args(cmd)
+
+
+def main(cmd=None):
+    args = parse_args(cmd)
+    rng = np.random.default_rng(args.seed)
+    strings = np.array(args.categories)[rng.integers(len(args.categories),
+                                                     size=args.size)]
+    categorical = CategoricalLabels.from_strings(strings)
+
+    start = time.perf_counter()
+    np.where(strings == "B")[0]
+    string_time = time.perf_counter() - start
+    start = time.perf_counter()
+    categorical.select("B")
+    categorical_time = time.perf_counter() - start
+
+    print(f"{'labels':>12} {'memory [MB]':>12} {'select [s]':>11}")
+    print(f"{'strings':>12} {strings.nbytes / 1e6:>12.1f} {string_time:>11.4f}")
+    print(f"{'categorical':>12} {categorical.nbytes / 1e6:>12.1f} "
+          f"{categorical_time:>11.4f}")
+
+
+if __name__ == "__main__":
+    main()
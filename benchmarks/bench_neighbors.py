@@ -0,0 +1,69 @@
+"""
+Benchmark the neighbor search backends (K-D Tree and voxel grid) on point clouds
+of different densities: the time to build the index and to query the k nearest
+neighbors of a fraction of the points.
+
+Usage:
+    python benchmarks/bench_neighbors.py [-sizes 100000 1000000 ...]
+                                         [-generators uniform clustered ...]
+                                         [-fraction 0.1] [-num-neighbors 10]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from generators import GENERATORS
+from point_utils.neighbors import NEIGHBOR_BACKENDS, build_neighbor_index
+
+
+def parse_args(cmd=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(usage=__doc__)
+    parser.add_argument("-sizes",
+                        type=int,
+                        nargs="+",
+                        default=[10**5, 10**6])
+    parser.add_argument("-generators",
+                        nargs="+",
+                        choices=list(GENERATORS),
+                        default=list(GENERATORS))
+    parser.add_argument("-fraction",
+                        type=float,
+                        default=0.1,
+                        help="Fraction of the points queried.")
+    parser.add_argument("-num-neighbors", type=int, default=10)
+    parser.add_argument("-seed", type=int, default=0)
+    return parser.parse_args(cmd)
+
+
+def main(cmd=None):
+    args = parse_args(cmd)
+    rng = np.random.default_rng(args.seed)
+
+    print(f"{'cloud':>10} {'points':>10} {'backend':>8} {'build [s]':>10} "
+          f"{'query [s]':>10} {'match':>6}")
+    for name in args.generators:
+        for size in args.sizes:
+            coordinates = GENERATORS[name](size, rng)
+            queries = coordinates[rng.random(size) < args.fraction]
+
+            expected = None
+            for backend in NEIGHBOR_BACKENDS:
+                start = time.perf_counter()
+                index = build_neighbor_index(backend, coordinates)
+                build_time = time.perf_counter() - start
+
+                start = time.perf_counter()
+                distances, _ = index.query(queries, k=args.num_neighbors)
+                query_time = time.perf_counter() - start
+
+                distances = distances.reshape(len(queries), -1)
+                if expected is None:
+                    expected = distances
+                match = np.allclose(distances, expected)
+                print(f"{name:>10} {size:>10} {backend:>8} {build_time:>10.3f} "
+                      f"{query_time:>10.3f} {str(match):>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Measure the scaling of the process executor (add_offset_points with workers > 1)
+from 1 to N worker processes.
+
+Usage:
+    python benchmarks/bench_parallel.py [-size 1000000] [-max-workers 8]
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from point_utils.offsetter import offset_factory
+
+
+def parse_args(cmd=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(usage=__doc__)
+    parser.add_argument("-size", type=int, default=10**6)
+    parser.add_argument("-fraction",
+                        type=float,
+                        default=0.1,
+                        help="Fraction of the points selected for offsetting.")
+    parser.add_argument("-max-workers", type=int, default=os.cpu_count())
+    parser.add_argument(
+        "-methods",
+        nargs="+",
+        default=["KDTreeOffsets", "CentroidOffsets", "ConvexHullOffsets"])
+    parser.add_argument("-seed", type=int, default=0)
+    return parser.parse_args(cmd)
+
+
+def main(cmd=None):
+    args = parse_args(cmd)
+    rng = np.random.default_rng(args.seed)
+    all_coordinates = rng.normal(size=(args.size, 3))
+    labels = np.where(rng.random(args.size) < args.fraction, 'B', 'A')
+
+    workers_list = sorted({1, *[2**i for i in range(1, 10)
+                                if 2**i <= args.max_workers], args.max_workers})
+    print(f"{'method':>18} {'workers':>8} {'time [s]':>10} {'speedup':>8}")
+    for method in args.methods:
+        serial_time = None
+        for workers in workers_list:
+            offsetter = offset_factory(method,
+                                       all_coordinates=all_coordinates,
+                                       labels=labels,
+                                       data_label_to_offset='B',
+                                       offset_magnitude=1.0,
+                                       new_data_label='C',
+                                       workers=workers)
+            start = time.perf_counter()
+            offsetter.add_offset_points()
+            elapsed = time.perf_counter() - start
+            serial_time = serial_time or elapsed
+            print(f"{method:>18} {workers:>8} {elapsed:>10.3f} "
+                  f"{serial_time / elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Synthetic point cloud generators for the benchmarks.
+
+Each generator returns a numpy array of shape (size, 3) drawn from the given
+random number generator.
+"""
+import numpy as np
+
+
+def uniform(size: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Points uniformly distributed in the unit cube.
+    """
+    return rng.random((size, 3))
+
+
+def clustered(size: int,
+              rng: np.random.Generator,
+              num_clusters: int = 20) -> np.ndarray:
+    """
+    Gaussian clusters of different widths and populations, the density varies
+    over orders of magnitude.
+    """
+    centers = rng.random((num_clusters, 3)) * 10
+    widths = 10**rng.uniform(-2, 0, num_clusters)
+    weights = rng.dirichlet(np.ones(num_clusters))
+    cluster = rng.choice(num_clusters, size=size, p=weights)
+    return centers[cluster] + rng.normal(size=(size, 3)) * widths[cluster, None]
+
+
+def shell(size: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Points on a thin spherical shell, e.g. a scanned surface, almost all points
+    are on the convex hull.
+    """
+    directions = rng.normal(size=(size, 3))
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+    return directions * rng.normal(1., 1e-3, size=(size, 1))
+
+
+def solid(size: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Points filling a ball, a quarter of them on its sphere, e.g. a scanned
+    object with its interior. Most points are far from the convex hull.
+    """
+    directions = rng.normal(size=(size, 3))
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+    radii = rng.random((size, 1))**(1 / 3)
+    radii[:size // 4] = 1.
+    return directions * radii
+
+
+def lattice(size: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Points of a regular cubic lattice, a degenerate configuration with equidistant
+    neighbors and coplanar hull points.
+    """
+    side = int(np.ceil(size**(1 / 3)))
+    grid = np.stack(np.meshgrid(*[np.arange(side, dtype=float)] * 3,
+                                indexing="ij"),
+                    axis=-1).reshape(-1, 3)
+    return grid[rng.permutation(len(grid))[:size]]
+
+
+GENERATORS = {
+    'uniform': uniform,
+    'clustered': clustered,
+    'shell': shell,
+    'solid': solid,
+    'lattice': lattice,
+}
+
+
+def make_cloud(kind: str,
+               size: int,
+               fraction: float = 0.1,
+               seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Coordinates and labels of a synthetic point cloud, a random `fraction` of the
+    points is labeled 'B' (selected for offsetting), the others 'A'.
+    """
+    rng = np.random.default_rng(seed)
+    all_coordinates = GENERATORS[kind](size, rng)
+    labels = np.where(rng.random(size) < fraction, 'B', 'A')
+    return all_coordinates, labels
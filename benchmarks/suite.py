@@ -0,0 +1,241 @@
+"""
+Benchmark suite for the offset methods, point cloud I/O and visualization on
+synthetic point clouds (see `generators.py`).
+
+Every benchmark is timed (best of `-repeat` runs) and its peak memory is measured
+with tracemalloc in an extra run. The results are written as JSON and compared
+against a baseline file, the suite exits with status 1 if a benchmark is slower
+or uses more memory than the baseline by more than the thresholds. If the
+baseline file does not exist (or with `-update-baseline`), the results are saved
+as the new baseline instead.
+
+Usage:
+    python benchmarks/suite.py [-sizes 1000 10000 100000] [-clouds uniform shell]
+                               [-benchmarks KDTreeOffsets save_to_txt]
+                               [-baseline benchmarks/baseline.json]
+                               [-time-threshold 0.2] [-memory-threshold 0.1]
+"""
+import argparse
+import json
+import logging
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from generators import GENERATORS, make_cloud
+from point_utils.offsetter import offset_factory
+from point_utils.utils import get_data_from_txt, save_to_txt, visualize
+
+# Point budget of the plots, as the default of the `visualize_max_points` setting
+VISUALIZE_MAX_POINTS = 100_000
+
+# The lattice clouds warn about degenerate offset directions on every run
+logging.getLogger("point_utils.offsetter").setLevel(logging.ERROR)
+
+
+def _offsetter_benchmark(method):
+
+    def setup(all_coordinates, labels, tmp_dir):
+
+        def run():
+            offsetter = offset_factory(method,
+                                       all_coordinates=all_coordinates,
+                                       labels=labels,
+                                       data_label_to_offset='B',
+                                       offset_magnitude=1.0,
+                                       new_data_label='C',
+                                       seed=0)
+            offsetter.add_offset_points()
+
+        return run
+
+    return setup
+
+
+def _text_file(all_coordinates, labels, tmp_dir) -> Path:
+    path = Path(tmp_dir) / "input.txt"
+    if not path.exists():
+        save_to_txt(path, all_coordinates, labels)
+    return path
+
+
+def _read_benchmark(all_coordinates, labels, tmp_dir):
+    path = _text_file(all_coordinates, labels, tmp_dir)
+    return lambda: get_data_from_txt(path)
+
+
+def _save_benchmark(all_coordinates, labels, tmp_dir):
+    return lambda: save_to_txt(
+        Path(tmp_dir) / "output.txt", all_coordinates, labels)
+
+
+def _visualize_benchmark(all_coordinates, labels, tmp_dir):
+    path = _text_file(all_coordinates, labels, tmp_dir)
+
+    def run():
+        visualize(path,
+                  output_file=Path(tmp_dir) / "figure.png",
+                  max_points=VISUALIZE_MAX_POINTS,
+                  show=False)
+
+    return run
+
+
+# Name: (setup function returning the benchmarked function, maximum cloud size)
+BENCHMARKS = {
+    'KDTreeOffsets': (_offsetter_benchmark('KDTreeOffsets'), 10**7),
+    'PCANormalOffsets': (_offsetter_benchmark('PCANormalOffsets'), 10**7),
+    'ConvexHullOffsets': (_offsetter_benchmark('ConvexHullOffsets'), 10**7),
+    'CentroidOffsets': (_offsetter_benchmark('CentroidOffsets'), 10**7),
+    'get_data_from_txt': (_read_benchmark, 10**7),
+    'save_to_txt': (_save_benchmark, 10**7),
+    'visualize': (_visualize_benchmark, 10**7),
+}
+
+
+def measure(run, repeat: int) -> dict:
+    """
+    Best time of `repeat` runs and peak traced memory of one run.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        run()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'time': min(times), 'peak_memory': peak_memory}
+
+
+def run_suite(sizes, clouds, benchmarks, repeat: int, seed: int) -> dict:
+    results = {}
+    for cloud in clouds:
+        for size in sizes:
+            all_coordinates, labels = make_cloud(cloud, size, seed=seed)
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                for name in benchmarks:
+                    setup, max_size = BENCHMARKS[name]
+                    if size > max_size:
+                        continue
+                    key = f"{name}/{cloud}/{size}"
+                    results[key] = measure(
+                        setup(all_coordinates, labels, tmp_dir), repeat)
+                    print(f"{key:>40} {results[key]['time']:>10.4f} s "
+                          f"{results[key]['peak_memory'] / 2**20:>10.1f} MiB",
+                          flush=True)
+    return results
+
+
+def compare(results: dict, baseline: dict, time_threshold: float,
+            memory_threshold: float, min_time: float) -> list[str]:
+    """
+    Regressions of the results with respect to the baseline results.
+
+    :param time_threshold: Maximum relative increase of the time.
+    :param memory_threshold: Maximum relative increase of the peak memory.
+    :param min_time: Times below this are too noisy to compare, in seconds.
+    """
+    regressions = []
+    print(f"{'benchmark':>40} {'time':>8} {'memory':>8}  (ratio to baseline)")
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        base = baseline[key]
+        time_ratio = result['time'] / base['time']
+        memory_ratio = result['peak_memory'] / max(base['peak_memory'], 1)
+        flags = []
+        if (time_ratio > 1 + time_threshold and
+                max(result['time'], base['time']) >= min_time):
+            flags.append("time")
+        if memory_ratio > 1 + memory_threshold:
+            flags.append("memory")
+        print(f"{key:>40} {time_ratio:>8.2f} {memory_ratio:>8.2f}  "
+              f"{'REGRESSION: ' + ', '.join(flags) if flags else ''}")
+        if flags:
+            regressions.append(f"{key} ({', '.join(flags)})")
+    return regressions
+
+
+def parse_args(cmd=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(usage=__doc__)
+    parser.add_argument("-sizes",
+                        type=int,
+                        nargs="+",
+                        default=[10**3, 10**4, 10**5])
+    parser.add_argument("-clouds",
+                        nargs="+",
+                        default=list(GENERATORS),
+                        choices=list(GENERATORS))
+    parser.add_argument("-benchmarks",
+                        nargs="+",
+                        default=list(BENCHMARKS),
+                        choices=list(BENCHMARKS))
+    parser.add_argument("-repeat", type=int, default=3)
+    parser.add_argument("-seed", type=int, default=0)
+    parser.add_argument("-output",
+                        type=str,
+                        default=None,
+                        help="Path to write the results JSON file to.")
+    parser.add_argument("-baseline",
+                        type=str,
+                        default=None,
+                        help="Path to the baseline JSON file.")
+    parser.add_argument("-update-baseline",
+                        action="store_true",
+                        help="Overwrite the baseline with the results.")
+    parser.add_argument("-time-threshold", type=float, default=0.2)
+    parser.add_argument("-memory-threshold", type=float, default=0.1)
+    parser.add_argument("-min-time", type=float, default=0.005)
+    return parser.parse_args(cmd)
+
+
+def main(cmd=None) -> int:
+    args = parse_args(cmd)
+    report = {
+        'metadata': {
+            'date': datetime.now().isoformat(timespec="seconds"),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.platform(),
+        },
+        'results': run_suite(args.sizes, args.clouds, args.benchmarks,
+                             args.repeat, args.seed)
+    }
+    if args.output:
+        with open(args.output, "w") as fhandle:
+            json.dump(report, fhandle, indent=2)
+
+    if args.baseline is None:
+        return 0
+    baseline_path = Path(args.baseline)
+    if args.update_baseline or not baseline_path.exists():
+        with open(baseline_path, "w") as fhandle:
+            json.dump(report, fhandle, indent=2)
+        print(f"Saved the baseline to {baseline_path}.")
+        return 0
+
+    with open(baseline_path, "r") as fhandle:
+        baseline = json.load(fhandle)
+    regressions = compare(report['results'], baseline['results'],
+                          args.time_threshold, args.memory_threshold,
+                          args.min_time)
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    print("No regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
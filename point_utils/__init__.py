@@ -1,3 +1,48 @@
-from .utils import *
-from .settings import *
-from .offsetter import *
+"""
+The public names of `utils`, `settings` and `offsetter` are available from the
+package, imported on first access so `import point_utils` stays cheap.
+"""
+import importlib
+
+# Exported names and the submodule defining each, only that submodule is
+# imported when a name is first accessed
+_EXPORTS = {
+    'DEFAULT_OUT_TXT': 'utils',
+    'DEFAULT_FIG_NAME': 'utils',
+    'DEFAULT_FIG_TITLE': 'utils',
+    'BINARY_SUFFIX': 'utils',
+    'COMPRESSION_SUFFIXES': 'utils',
+    'DOWNSAMPLE_METHODS': 'utils',
+    'ProgressLog': 'utils',
+    'open_text': 'utils',
+    'get_data_from_txt': 'utils',
+    'save_to_txt': 'utils',
+    'write_txt_lines': 'utils',
+    'save_to_binary': 'utils',
+    'get_data_from_binary': 'utils',
+    'is_binary_file': 'utils',
+    'load_point_cloud': 'utils',
+    'save_point_cloud': 'utils',
+    'random_downsample': 'utils',
+    'voxel_downsample': 'utils',
+    'visualize': 'utils',
+    'INPUT_FILE_SUFFIXES': 'settings',
+    'KNN_OFFSET_METHODS': 'settings',
+    'OffsetRule': 'settings',
+    'ConfigSettings': 'settings',
+    'load_and_validate_config': 'settings',
+    'offset_factory': 'offsetter',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    if name in _EXPORTS:
+        module = importlib.import_module(f".{_EXPORTS[name]}", __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(__all__))
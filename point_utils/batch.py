@@ -0,0 +1,188 @@
+"""
+Batch runner for many offset jobs.
+
+A manifest lists the configurations of the jobs. Jobs are grouped by their input
+file, so each point cloud is read and its spatial indexes are built only once per
+group, and the groups are run on a pool of worker processes. A summary is written
+for every job, and a failing job does not abort the other jobs.
+
+The manifest is a YAML file holding a list of jobs, or a mapping with the list
+under `jobs`. Each job is the path to a YAML configuration file, relative to the
+manifest, or the configuration settings themselves. Plots of batch jobs are
+only saved, never shown.
+"""
+import json
+import logging
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional, Union
+
+import yaml
+
+from .index_cache import DEFAULT_CACHE_DIR, DEFAULT_CACHE_MAX_BYTES, IndexCache
+from .pipeline import run_job
+from .utils import load_point_cloud
+
+__all__ = ['load_manifest', 'run_batch']
+
+logger = logging.getLogger(__name__)
+
+
+def load_manifest(manifest_path: Union[str, Path]) -> list[tuple[str, dict]]:
+    """
+    Read the jobs of a manifest.
+
+    :return: List of (job ID, settings) pairs. The settings of a job whose
+             configuration file cannot be read hold the error under `error`.
+    """
+    manifest_path = Path(manifest_path)
+    with open(manifest_path, "r") as fhandle:
+        manifest = yaml.safe_load(fhandle) or []
+    if isinstance(manifest, dict):
+        manifest = manifest.get('jobs') or []
+    if not isinstance(manifest, list):
+        raise ValueError(
+            f"The manifest {manifest_path} must hold a list of jobs.")
+
+    jobs = []
+    for i, job in enumerate(manifest):
+        if isinstance(job, dict):
+            jobs.append((f"{i:04d}", job))
+            continue
+        config_path = manifest_path.parent / job
+        job_id = f"{i:04d}_{config_path.stem}"
+        try:
+            with open(config_path, "r") as fhandle:
+                settings = yaml.safe_load(fhandle)
+            if not isinstance(settings, dict):
+                raise ValueError(f"Invalid configuration file {config_path}.")
+            jobs.append((job_id, settings))
+        except Exception as e:
+            jobs.append((job_id, {'error': f"{type(e).__name__}: {e}"}))
+    return jobs
+
+
+def _failed(job_id: str, settings: dict, error: str) -> dict:
+    return {
+        'job_id': job_id,
+        'status': 'failed',
+        'input_file': settings.get('input_file'),
+        'error': error
+    }
+
+
+def _run_group(input_file: str, dtype: str,
+               jobs: list[tuple[str, dict]]) -> list[dict]:
+    """
+    Run the jobs sharing an input file and coordinate type, reading the point
+    cloud once.
+    """
+    start = time.perf_counter()
+    try:
+        all_coordinates, labels = load_point_cloud(input_file, dtype=dtype)
+    except Exception:
+        error = traceback.format_exc(limit=1)
+        return [_failed(job_id, settings, error) for job_id, settings in jobs]
+    load_time = time.perf_counter() - start
+    # Hashed once for the index cache lookups of all jobs
+    coordinates_key = IndexCache.coordinates_key(all_coordinates)
+
+    # The index cache settings of the first job apply to the whole group, the
+    # indexes are kept in memory for the other jobs in any case
+    settings = jobs[0][1]
+    index_cache = IndexCache(
+        settings.get('index_cache_dir', DEFAULT_CACHE_DIR)
+        if settings.get('index_cache', True) else None,
+        settings.get('index_cache_max_bytes', DEFAULT_CACHE_MAX_BYTES))
+
+    summaries = []
+    for job_id, settings in jobs:
+        try:
+            summary = run_job(settings,
+                              all_coordinates=all_coordinates,
+                              labels=labels,
+                              index_cache=index_cache,
+                              headless=True,
+                              coordinates_key=coordinates_key)
+        except Exception:
+            summaries.append(_failed(job_id, settings, traceback.format_exc()))
+            continue
+        summary['timings']['load'] = load_time
+        summaries.append({
+            'job_id': job_id,
+            'status': 'succeeded',
+            'input_file': input_file,
+            **summary
+        })
+    return summaries
+
+
+def run_batch(manifest_path: Union[str, Path],
+              workers: int = 1,
+              summary_dir: Optional[Union[str, Path]] = None) -> list[dict]:
+    """
+    Run all jobs of a manifest.
+
+    :param manifest_path: Path to the manifest YAML file.
+    :param workers: Number of worker processes, the jobs are run in the current
+                    process if 1.
+    :param summary_dir: Directory the summaries are written to, one `<job ID>.json`
+                        per job plus `summary.json` for the whole batch, next to
+                        the manifest if not provided.
+
+    :return: List of the job summaries, in the order of the manifest.
+    """
+    manifest_path = Path(manifest_path)
+    summary_dir = Path(summary_dir or manifest_path.with_suffix(".summary"))
+    summary_dir.mkdir(parents=True, exist_ok=True)
+
+    summaries = {}
+
+    def collect(group_summaries):
+        for summary in group_summaries:
+            summaries[summary['job_id']] = summary
+            with open(summary_dir / f"{summary['job_id']}.json", "w") as fhandle:
+                json.dump(summary, fhandle, indent=2)
+            if summary['status'] == 'failed':
+                logger.error(f"Job {summary['job_id']} failed: "
+                             f"{summary['error'].strip().splitlines()[-1]}")
+
+    groups = {}
+    for job_id, settings in load_manifest(manifest_path):
+        if 'error' in settings:
+            collect([_failed(job_id, settings, settings['error'])])
+        elif 'input_file' not in settings:
+            collect([_failed(job_id, settings, "Missing setting: input_file")])
+        else:
+            key = (str(Path(settings['input_file']).resolve()),
+                   settings.get('dtype', 'float64'))
+            groups.setdefault(key, []).append((job_id, settings))
+    logger.info(f"Running {sum(map(len, groups.values()))} job(s) on "
+                f"{len(groups)} point cloud(s).")
+
+    if workers == 1:
+        for (input_file, dtype), jobs in groups.items():
+            collect(_run_group(input_file, dtype, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(_run_group, input_file, dtype, jobs): jobs
+                for (input_file, dtype), jobs in groups.items()
+            }
+            for future, jobs in futures.items():
+                try:
+                    group_summaries = future.result()
+                except Exception as e:
+                    # E.g. a crashed worker process
+                    group_summaries = [
+                        _failed(job_id, settings, f"{type(e).__name__}: {e}")
+                        for job_id, settings in jobs
+                    ]
+                collect(group_summaries)
+
+    summaries = [summaries[job_id] for job_id in sorted(summaries)]
+    with open(summary_dir / "summary.json", "w") as fhandle:
+        json.dump(summaries, fhandle, indent=2)
+    return summaries
@@ -0,0 +1,165 @@
+"""
+Persistent on-disk cache of spatial indexes (K-D Trees, convex hulls).
+
+Indexes are keyed by the kind of index and a hash of the coordinate buffer
+they are built on, so the same point cloud reuses its indexes across runs and
+processes regardless of the file it was loaded from. Entries are pickled into
+the cache directory and evicted in least recently used order when the total
+size exceeds the limit. The most recently used indexes are also kept in memory,
+for jobs of the same process sharing a point cloud.
+"""
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+__all__ = ['IndexCache']
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = "~/.cache/point_utils"
+DEFAULT_CACHE_MAX_BYTES = 2**32
+# Number of rows hashed at once
+HASH_CHUNK_ROWS = 2**20
+# Default number of indexes kept in memory
+MEMORY_ITEMS = 4
+
+
+class IndexCache:
+    """
+    :ivar directory: Directory holding the cached indexes, the indexes are only
+                     kept in memory if None.
+    :ivar max_bytes: Maximum total size of the cached indexes.
+    :ivar memory_items: Number of most recently used indexes kept in memory.
+    :ivar hits: Number of indexes loaded from the cache.
+    :ivar misses: Number of indexes built because they were not cached.
+    """
+
+    def __init__(self,
+                 directory: Optional[str] = DEFAULT_CACHE_DIR,
+                 max_bytes: int = DEFAULT_CACHE_MAX_BYTES,
+                 memory_items: int = MEMORY_ITEMS):
+        self.directory = None
+        if directory is not None:
+            self.directory = Path(directory).expanduser()
+            self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        # Guards the in-memory indexes and counters for threads sharing the cache
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def coordinates_key(all_coordinates: np.ndarray) -> str:
+        """
+        Hash of the shape, dtype and content of a coordinate array.
+        """
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(f"{all_coordinates.shape}{all_coordinates.dtype}".encode())
+        for start in range(0, len(all_coordinates), HASH_CHUNK_ROWS):
+            chunk = np.ascontiguousarray(all_coordinates[start:start +
+                                                         HASH_CHUNK_ROWS])
+            digest.update(memoryview(chunk).cast("B"))
+        return digest.hexdigest()
+
+    def _path(self, kind: str, key: str) -> Path:
+        return self.directory / f"{kind}-{key}.pkl"
+
+    def get_or_build(self,
+                     kind: str,
+                     all_coordinates: np.ndarray,
+                     build: Callable[[], Any],
+                     key: Optional[str] = None) -> Any:
+        """
+        Load the index of the given kind for the coordinates from the cache, or
+        build it with `build()` and store it.
+
+        :param kind: Kind of index, e.g. 'kdtree'.
+        :param all_coordinates: Coordinates the index is built on.
+        :param build: Function building the index, the result must be picklable.
+        :param key: Precomputed `coordinates_key` of the coordinates.
+        """
+        key = key or self.coordinates_key(all_coordinates)
+        with self._lock:
+            if (kind, key) in self._memory:
+                self._memory.move_to_end((kind, key))
+                self.hits += 1
+                return self._memory[(kind, key)]
+
+        index = self._load(kind, key)
+        built = index is None
+        if built:
+            index = build()
+            if self.directory is not None:
+                self._store(self._path(kind, key), index)
+
+        with self._lock:
+            if built:
+                self.misses += 1
+            else:
+                self.hits += 1
+            self._memory[(kind, key)] = index
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+        return index
+
+    def _load(self, kind: str, key: str) -> Any:
+        if self.directory is None:
+            return None
+        path = self._path(kind, key)
+        try:
+            with open(path, "rb") as fhandle:
+                index = pickle.load(fhandle)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable cached index {path}: {e}")
+            return None
+        # Mark as recently used
+        os.utime(path)
+        return index
+
+    def _store(self, path: Path, index: Any):
+        # Write to a temporary file first, concurrent readers never see partial files
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fhandle:
+                pickle.dump(index, fhandle, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+        self.evict()
+
+    def evict(self):
+        """
+        Delete the least recently used entries until the cache fits `max_bytes`.
+        """
+        if self.directory is None:
+            return
+        entries = []
+        for path in self.directory.glob("*.pkl"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,229 @@
+"""
+Vectorized numerical kernels shared by the offset methods.
+"""
+from typing import Optional
+
+import numpy as np
+
+# Relative tolerance, with respect to the neighborhood radius, below which the
+# orientation of a normal is ambiguous
+ORIENTATION_RTOL = 1e-9
+# Default number of retry rounds of the offset points violating a minimum clearance
+DEFAULT_CLEARANCE_ROUNDS = 5
+
+
+def float_dtype(array: np.ndarray) -> np.dtype:
+    """
+    Floating point type of the computations on an array: float32 arrays stay in
+    single precision, anything else is computed in float64.
+    """
+    return np.result_type(array.dtype, np.float32)
+
+
+def row_norms(vecs: np.ndarray) -> np.ndarray:
+    """
+    Euclidean norms of the rows of an (M, 3) array. The batched inner product
+    reproduces `np.linalg.norm` applied to each row separately bit for bit,
+    which `np.linalg.norm(vecs, axis=1)` does not.
+    """
+    return np.sqrt(np.matmul(vecs[:, np.newaxis, :], vecs[:, :, np.newaxis])[:, 0, 0])
+
+
+def knn_offset_vecs(
+        tree, coordinates: np.ndarray, points: np.ndarray, num_neighbors: int,
+        offset_magnitude: float,
+        workers: int = 1,
+        eps: float = 0.) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Offset vectors pointing away from the mean displacement of each point to its
+    nearest neighbors.
+
+    :param tree: K-D Tree built on `coordinates`.
+    :param coordinates: Numpy array of shape (N, 3) the tree was built on.
+    :param points: Numpy array of shape (M, 3) with the points to offset.
+    :param num_neighbors: The number of nearest neighbors of each point.
+    :param offset_magnitude: Magnitude of the offset vectors.
+    :param workers: Number of threads used by the K-D Tree query.
+    :param eps: Approximation tolerance of the K-D Tree query, the returned k-th
+                neighbor is at most (1 + eps) times farther than the exact one.
+
+    :return: Tuple of the (M, 3) offset vectors, a boolean mask of the points whose
+             mean displacement is zero (their offset vectors are not finite), and
+             the distances of the points to their farthest neighbor.
+    """
+    # Find nearest neighbors to all points in one query
+    distances, nearest_neighbor_indices = tree.query(points,
+                                                     k=num_neighbors,
+                                                     eps=eps,
+                                                     workers=workers)
+    distances = distances.reshape(len(points), -1)
+    nearest_neighbor_indices = nearest_neighbor_indices.reshape(len(points), -1)
+
+    # Calculate mean displacement vectors from the points to their nearest neighbors
+    avg_displacements = np.mean(coordinates[nearest_neighbor_indices] -
+                                points[:, np.newaxis, :],
+                                axis=1)
+    norms = row_norms(avg_displacements)
+
+    # Flip the vectors to point away from densely populated space,
+    # normalize and scale by the input offset magnitude.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        offset_vectors = -avg_displacements / norms[:, np.newaxis] * offset_magnitude
+
+    return offset_vectors, np.isclose(norms, 0), distances[:, -1]
+
+
+def pca_normal_offset_vecs(
+        tree,
+        coordinates: np.ndarray,
+        points: np.ndarray,
+        num_neighbors: int,
+        offset_magnitude: float,
+        workers: int = 1,
+        eps: float = 0.,
+        centroid: Optional[np.ndarray] = None
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Offset vectors along the local surface normal of each point, estimated as the
+    eigenvector of the smallest eigenvalue of the covariance matrix of its
+    nearest neighbors, oriented away from the centroid of the neighbors.
+
+    The covariance matrices of all points are built as one (M, 3, 3) stack and
+    diagonalized by one batched `np.linalg.eigh` call.
+
+    :param tree: K-D Tree built on `coordinates`.
+    :param coordinates: Numpy array of shape (N, 3) the tree was built on.
+    :param points: Numpy array of shape (M, 3) with the points to offset.
+    :param num_neighbors: The number of nearest neighbors of each point.
+    :param offset_magnitude: Magnitude of the offset vectors.
+    :param workers: Number of threads used by the K-D Tree query.
+    :param eps: Approximation tolerance of the K-D Tree query, see `knn_offset_vecs`.
+    :param centroid: Centroid of the point cloud, normals whose orientation is
+                     ambiguous because the point is at the centroid of its
+                     neighbors are oriented away from it.
+
+    :return: Tuple of the (M, 3) offset vectors, a boolean mask of the points whose
+             orientation is ambiguous, and the distances of the points to their
+             farthest neighbor.
+    """
+    distances, nearest_neighbor_indices = tree.query(points,
+                                                     k=num_neighbors,
+                                                     eps=eps,
+                                                     workers=workers)
+    distances = distances.reshape(len(points), -1)
+    nearest_neighbor_indices = nearest_neighbor_indices.reshape(len(points), -1)
+
+    neighbors = coordinates[nearest_neighbor_indices]
+    local_centroids = neighbors.mean(axis=1)
+    centered = neighbors - local_centroids[:, np.newaxis, :]
+    covariances = np.matmul(centered.transpose(0, 2, 1), centered)
+    # Eigenvalues in ascending order, eigenvectors in the columns
+    _, eigenvectors = np.linalg.eigh(covariances)
+    normals = eigenvectors[:, :, 0]
+
+    dots = np.einsum('mi,mi->m', normals, points - local_centroids)
+    ambiguous = np.abs(dots) <= ORIENTATION_RTOL * distances[:, -1]
+    if centroid is not None and ambiguous.any():
+        dots[ambiguous] = np.einsum('mi,mi->m', normals[ambiguous],
+                                    points[ambiguous] - centroid)
+    # Without any preference, make the largest component of the normal positive
+    undecided = np.abs(dots) <= ORIENTATION_RTOL * distances[:, -1]
+    dots[undecided] = normals[undecided,
+                              np.argmax(np.abs(normals[undecided]), axis=1)]
+
+    signs = np.where(dots < 0, -offset_magnitude, offset_magnitude)
+    return normals * signs[:, np.newaxis], ambiguous, distances[:, -1]
+
+
+def _nearest(tree, points: np.ndarray,
+             workers: int = 1) -> tuple[np.ndarray, np.ndarray]:
+    distances, indices = tree.query(points, k=1, workers=workers)
+    return (distances.reshape(len(points), -1)[:, 0],
+            indices.reshape(len(points), -1)[:, 0])
+
+
+def clearance_offset_vecs(
+        tree,
+        coordinates: np.ndarray,
+        origins: np.ndarray,
+        offset_vectors: np.ndarray,
+        min_clearance: float,
+        growth: float = 1.,
+        max_rounds: int = DEFAULT_CLEARANCE_ROUNDS,
+        workers: int = 1) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Offset vectors whose offset points are at least `min_clearance` away from all
+    points of the point cloud.
+
+    All offset points are checked by one batched nearest-neighbor query. Only
+    the violating ones are retried, in vectorized rounds: each round steers the
+    direction away from the nearest point of the cloud, by adding the unit
+    vector from that point to the offset point, and multiplies the magnitude by
+    `growth`. Offset points still violating the clearance after `max_rounds`
+    keep the vector of their largest clearance.
+
+    :param tree: Neighbor search index built on `coordinates`.
+    :param coordinates: Numpy array of shape (N, 3) the index was built on.
+    :param origins: Numpy array of shape (M, 3) with the offset points' origins.
+    :param offset_vectors: Numpy array of shape (M, 3) with the offset vectors.
+    :param min_clearance: Minimum distance of the offset points to the cloud.
+    :param growth: Factor applied to the magnitude in every retry round, the
+                   magnitude is kept if 1.
+    :param max_rounds: Maximum number of retry rounds.
+    :param workers: Number of threads used by the neighbor queries.
+
+    :return: Tuple of the corrected (M, 3) offset vectors, a boolean mask of the
+             offset points which violated the clearance, and a boolean mask of
+             those still violating it.
+    """
+    vectors = np.array(offset_vectors)
+    if not len(origins):
+        # No offset points, e.g. no point carries the label to offset
+        no_points = np.zeros(0, dtype=bool)
+        return vectors, no_points, no_points
+    candidates = origins + vectors
+    distances, nearest = _nearest(tree, candidates, workers)
+    violated = distances < min_clearance
+
+    pending = np.flatnonzero(violated)
+    candidates, nearest = candidates[pending], nearest[pending]
+    best_distances = distances[pending]
+    magnitudes = row_norms(vectors[pending])
+    directions = np.divide(vectors[pending],
+                           magnitudes[:, np.newaxis],
+                           out=np.zeros_like(vectors[pending]),
+                           where=magnitudes[:, np.newaxis] > 0)
+    for _ in range(max_rounds):
+        if not len(pending):
+            break
+        away = candidates - coordinates[nearest]
+        away_norms = row_norms(away)
+        # Offset points on a point of the cloud keep their direction
+        away_norms[away_norms == 0] = np.inf
+        steered = directions + away / away_norms[:, np.newaxis]
+        steered_norms = row_norms(steered)
+        # Directions pointing straight at the nearest point turn around
+        opposite = steered_norms == 0
+        steered[opposite] = -directions[opposite]
+        steered_norms[opposite] = 1.
+        directions = steered / steered_norms[:, np.newaxis]
+        magnitudes = magnitudes * growth
+
+        trials = directions * magnitudes[:, np.newaxis]
+        candidates = origins[pending] + trials
+        distances, nearest = _nearest(tree, candidates, workers)
+        better = distances > best_distances
+        vectors[pending[better]] = trials[better]
+        best_distances[better] = distances[better]
+
+        remaining = distances < min_clearance
+        pending, candidates, nearest = (pending[remaining],
+                                        candidates[remaining],
+                                        nearest[remaining])
+        best_distances, magnitudes, directions = (best_distances[remaining],
+                                                  magnitudes[remaining],
+                                                  directions[remaining])
+
+    unresolved = np.zeros(len(vectors), dtype=bool)
+    unresolved[pending] = True
+    return vectors, violated, unresolved
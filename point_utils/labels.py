@@ -0,0 +1,110 @@
+"""
+Categorical point labels stored as small integer codes.
+"""
+from typing import Iterable, Union
+
+import numpy as np
+
+__all__ = ['CategoricalLabels', 'as_categorical']
+
+
+def code_dtype(num_categories: int) -> np.dtype:
+    """
+    Smallest unsigned integer dtype for the codes of `num_categories` categories.
+    """
+    return np.min_scalar_type(max(num_categories - 1, 0))
+
+
+class CategoricalLabels:
+    """
+    Labels of a point cloud stored as a small list of categories plus one
+    uint8/uint16 code per point, instead of one string per point.
+
+    Comparing with a label (`labels == 'B'`) returns a boolean mask, indexing
+    returns the label of a point or a `CategoricalLabels` subset, and the labels
+    convert to a numpy string array where a plain array is required.
+
+    :ivar codes: Numpy array of integer codes, one per point.
+    :ivar categories: Numpy string array of the distinct labels, indexed by the codes.
+    """
+
+    def __init__(self, codes: np.ndarray, categories: Iterable[str]):
+        self.codes = codes
+        self.categories = np.asarray(categories, dtype=str)
+
+    @classmethod
+    def from_strings(cls, labels: Iterable) -> "CategoricalLabels":
+        categories, codes = np.unique(np.asarray(labels).astype(str),
+                                      return_inverse=True)
+        return cls(codes.ravel().astype(code_dtype(len(categories))),
+                   categories)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @property
+    def shape(self) -> tuple:
+        return self.codes.shape
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.categories.nbytes
+
+    def code(self, label) -> int:
+        """
+        Code of a label, -1 if the label is not a category.
+        """
+        matches = np.flatnonzero(self.categories == str(label))
+        return int(matches[0]) if len(matches) else -1
+
+    def select(self, label) -> np.ndarray:
+        """
+        Indices of the points with the given label.
+        """
+        return np.flatnonzero(self == label)
+
+    def __eq__(self, label) -> np.ndarray:
+        code = self.code(label)
+        if code < 0:
+            return np.zeros(len(self), dtype=bool)
+        return self.codes == code
+
+    def __ne__(self, label) -> np.ndarray:
+        return ~(self == label)
+
+    __hash__ = None
+
+    def __getitem__(self, key) -> Union[str, "CategoricalLabels"]:
+        codes = self.codes[key]
+        if np.ndim(codes) == 0:
+            return str(self.categories[codes])
+        return CategoricalLabels(codes, self.categories)
+
+    def __iter__(self):
+        return iter(self.to_strings())
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        strings = self.to_strings()
+        return strings if dtype is None else strings.astype(dtype)
+
+    def __repr__(self) -> str:
+        return (f"CategoricalLabels({len(self)} points, "
+                f"categories={self.categories.tolist()})")
+
+    def to_strings(self) -> np.ndarray:
+        """
+        Decode the labels into a numpy string array.
+        """
+        return self.categories[self.codes]
+
+    def tolist(self) -> list[str]:
+        return self.to_strings().tolist()
+
+
+def as_categorical(labels) -> CategoricalLabels:
+    """
+    Convert labels to `CategoricalLabels` unless they already are.
+    """
+    if isinstance(labels, CategoricalLabels):
+        return labels
+    return CategoricalLabels.from_strings(labels)
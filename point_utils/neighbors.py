@@ -0,0 +1,233 @@
+"""
+Neighbor search backends of the nearest-neighbor offset methods.
+
+A backend is built on the coordinates of a point cloud and answers k nearest
+neighbor queries with the interface of `scipy.spatial.KDTree.query`, so the
+offset kernels (`point_utils.kernels`) work with any backend:
+
+- 'kdtree': `scipy.spatial.KDTree`, suited to any point distribution.
+- 'grid': `VoxelGrid`, a uniform grid of cells hashed to sorted integer keys,
+  which builds faster and queries with better memory locality for clouds of
+  nearly uniform density.
+"""
+import numpy as np
+
+from .kernels import float_dtype
+
+__all__ = ['VoxelGrid', 'build_neighbor_index', 'NEIGHBOR_BACKENDS']
+
+# Targeted mean number of points per occupied cell of a voxel grid
+DEFAULT_POINTS_PER_CELL = 4
+# Maximum number of (query point, cell) pairs processed per vectorized batch
+MAX_CUBE_ELEMENTS = 2**17
+# Maximum density of the searched cells relative to the mean occupancy, the
+# neighbors of query points in denser regions are found by a K-D Tree instead
+MAX_RELATIVE_DENSITY = 8
+# Maximum half-width in cells of the searched cube, farther neighbors are found by
+# a K-D Tree instead, e.g. for query points far outside the grid
+MAX_GRID_RADIUS = 4
+
+
+class VoxelGrid:
+    """
+    Uniform grid of cubic cells over a point cloud for k nearest neighbor queries.
+
+    The points are sorted by the integer key of their cell, the occupied cells
+    are the sorted unique keys with the offsets of their points in the sorted
+    order. A query searches the cube of cells around the cell of each query
+    point, all points of a batch at once, and widens the cube only for the points
+    whose k-th neighbor may be outside of it. The neighbors of the few query
+    points far from the points of the grid, or in much denser regions than
+    the mean, are found by a K-D Tree built on demand.
+
+    :ivar coordinates: Numpy array of shape (N, 3) the grid is built on, float32
+                       coordinates are kept in single precision.
+    :ivar lower: Lower corner of the bounding box of the points.
+    :ivar points_per_cell: Targeted mean number of points per cell.
+    :ivar cell_size: Edge length of the cells.
+    :ivar shape: Number of cells along each axis.
+    :ivar order: Indices of the points sorted by cell key.
+    :ivar cell_keys: Sorted keys of the occupied cells.
+    :ivar cell_starts: Offsets of the points of each occupied cell in `order`,
+                       with the total number of points appended.
+    """
+
+    def __init__(self,
+                 coordinates: np.ndarray,
+                 points_per_cell: int = DEFAULT_POINTS_PER_CELL):
+        coordinates = np.asarray(coordinates)
+        self.coordinates = coordinates.astype(float_dtype(coordinates),
+                                              copy=False).reshape(-1, 3)
+        if not len(self.coordinates):
+            raise ValueError("A voxel grid needs at least one point.")
+        self.points_per_cell = points_per_cell
+        self.lower = self.coordinates.min(axis=0).astype(float)
+        extent = self.coordinates.max(axis=0) - self.lower
+
+        # Cell size of the targeted occupancy, over the non-flat axes only
+        spread = extent > 1e-9 * max(extent.max(), 1e-300)
+        if spread.any():
+            dims = np.count_nonzero(spread)
+            self.cell_size = float(
+                (np.prod(extent[spread]) * points_per_cell /
+                 len(self.coordinates))**(1 / dims))
+        else:
+            self.cell_size = 1.
+        self.shape = (extent // self.cell_size).astype(np.int64) + 1
+        if np.prod(self.shape.astype(float)) >= 2**62:
+            raise ValueError("The point cloud is too sparse for a voxel grid.")
+
+        keys = self._keys(self._cells(self.coordinates))
+        self.order = np.argsort(keys, kind='stable')
+        self.cell_keys, counts = np.unique(keys[self.order], return_counts=True)
+        self.cell_starts = np.concatenate(([0], np.cumsum(counts)))
+        self._sorted_coordinates = self.coordinates[self.order]
+        self._fallback = None
+
+    def _cells(self, points: np.ndarray) -> np.ndarray:
+        return np.floor((points - self.lower) / self.cell_size).astype(np.int64)
+
+    def _keys(self, cells: np.ndarray) -> np.ndarray:
+        return (cells[..., 0] * self.shape[1] + cells[..., 1]) * self.shape[2] + cells[..., 2]
+
+    def query(self,
+              points: np.ndarray,
+              k: int = 1,
+              eps: float = 0.,
+              workers: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Find the k nearest neighbors of the query points, as `KDTree.query`.
+
+        :param points: Numpy array of shape (M, 3) of query points.
+        :param k: Number of nearest neighbors.
+        :param eps: Approximation tolerance, the returned k-th neighbor is at most
+                    (1 + eps) times farther than the exact one.
+        :param workers: Number of threads of the K-D Tree queries of the points
+                        without k neighbors near their cell, the grid queries are
+                        vectorized in the current thread.
+
+        :return: Tuple of the distances and indices of the neighbors of shape
+                 (M, k), sorted by distance. Missing neighbors have an infinite
+                 distance and the index N.
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 3)
+        distances = np.full((len(points), k), np.inf)
+        indices = np.full((len(points), k), len(self.coordinates), dtype=np.int64)
+        cells = self._cells(points)
+        pending = np.arange(len(points))
+        fallback = []
+        radius = 1
+        while len(pending) and radius <= MAX_GRID_RADIUS:
+            # Query points per batch, bounding the (points, cells) temporary arrays
+            rows = max(1, MAX_CUBE_ELEMENTS // (2 * radius + 1)**3)
+            exact = np.zeros(len(pending), dtype=bool)
+            done = np.zeros(len(pending), dtype=bool)
+            for start in range(0, len(pending), rows):
+                batch = pending[start:start + rows]
+                found_distances, found_indices, crowded = self._search_cube(
+                    points[batch], cells[batch], radius, k)
+                # Distance of the query points to the outside of the searched cube
+                local = points[batch] - self.lower - cells[batch] * self.cell_size
+                margins = radius * self.cell_size + np.minimum(
+                    local, self.cell_size - local).min(axis=1)
+                covers_all = np.all((cells[batch] - radius <= 0) &
+                                    (cells[batch] + radius >= self.shape - 1),
+                                    axis=1)
+                batch_exact = ~crowded & (covers_all | (
+                    found_distances[:, -1] <= (1 + eps) * margins))
+                distances[batch[batch_exact]] = found_distances[batch_exact]
+                indices[batch[batch_exact]] = found_indices[batch_exact]
+                exact[start:start + rows] = batch_exact
+                # Only the K-D Tree answers crowded query points
+                done[start:start + rows] = batch_exact | crowded
+            fallback.append(pending[~exact & done])
+            pending = pending[~done]
+            radius *= 2
+
+        pending = np.concatenate(fallback + [pending])
+        if len(pending):
+            if self._fallback is None:
+                self._fallback = _kdtree(self.coordinates)
+            fallback_distances, fallback_indices = self._fallback.query(
+                points[pending], k=k, eps=eps, workers=workers)
+            distances[pending] = fallback_distances.reshape(len(pending), -1)
+            indices[pending] = fallback_indices.reshape(len(pending), -1)
+        return distances, indices
+
+    def _search_cube(self, points: np.ndarray, cells: np.ndarray, radius: int,
+                     k: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        The k nearest neighbors of the query points among the points of the cube
+        of (2 * radius + 1)**3 cells centered at their cells, and the mask of the
+        query points whose cube is too crowded to be searched.
+        """
+        steps = np.arange(-radius, radius + 1)
+        offsets = np.stack(np.meshgrid(steps, steps, steps, indexing='ij'),
+                           axis=-1).reshape(-1, 3)
+        neighbor_cells = cells[:, np.newaxis, :] + offsets
+        inside = np.all((neighbor_cells >= 0) & (neighbor_cells < self.shape),
+                        axis=2)
+        keys = self._keys(neighbor_cells)
+        positions = np.searchsorted(self.cell_keys, keys)
+        positions[~inside] = 0
+        occupied = inside & (positions < len(self.cell_keys))
+        occupied[occupied] = self.cell_keys[positions[occupied]] == keys[occupied]
+        positions[~occupied] = 0
+
+        # Points of the occupied cells of each query point, padded to a rectangle
+        starts = np.where(occupied, self.cell_starts[positions], 0).ravel()
+        counts = np.where(occupied,
+                          self.cell_starts[positions + 1] - self.cell_starts[positions],
+                          0).ravel()
+        max_candidates = MAX_RELATIVE_DENSITY * self.points_per_cell * len(offsets)
+        crowded = counts.reshape(len(points), -1).sum(axis=1) > max_candidates
+        counts.reshape(len(points), -1)[crowded] = 0
+        rows = np.repeat(np.arange(len(counts)) // len(offsets), counts)
+        row_counts = np.bincount(rows, minlength=len(points))
+        first = np.repeat(np.cumsum(counts) - counts, counts)
+        within = np.arange(len(rows)) - first
+        sorted_positions = np.repeat(starts, counts) + within
+        columns = np.arange(len(rows)) - np.repeat(
+            np.cumsum(row_counts) - row_counts, row_counts)
+
+        # Distances on the contiguous blocks of the points sorted by cell
+        displacements = self._sorted_coordinates[sorted_positions] - points[rows]
+        width = max(k, int(row_counts.max(initial=0)))
+        candidates = np.zeros((len(points), width), dtype=np.int64)
+        candidates[rows, columns] = sorted_positions
+        candidate_distances = np.full((len(points), width), np.inf)
+        candidate_distances[rows, columns] = np.sqrt(
+            np.einsum('ij,ij->i', displacements, displacements))
+
+        nearest = np.argpartition(candidate_distances, k - 1, axis=1)[:, :k]
+        nearest_distances = np.take_along_axis(candidate_distances, nearest, axis=1)
+        order = np.argsort(nearest_distances, axis=1, kind='stable')
+        nearest_distances = np.take_along_axis(nearest_distances, order, axis=1)
+        nearest = np.take_along_axis(nearest, order, axis=1)
+        indices = self.order[np.take_along_axis(candidates, nearest, axis=1)]
+        # Padding of the points with fewer than k candidates
+        indices[np.isinf(nearest_distances)] = len(self.coordinates)
+        return nearest_distances, indices, crowded
+
+
+def _kdtree(coordinates: np.ndarray):
+    # scipy is only imported by the methods building K-D Trees
+    from scipy.spatial import KDTree
+    return KDTree(coordinates)
+
+
+NEIGHBOR_BACKENDS = {
+    'kdtree': _kdtree,
+    'grid': VoxelGrid,
+}
+
+
+def build_neighbor_index(backend: str, coordinates: np.ndarray):
+    """
+    Build the neighbor search index of a backend of `NEIGHBOR_BACKENDS` on the
+    coordinates of a point cloud.
+    """
+    if backend not in NEIGHBOR_BACKENDS:
+        raise ValueError(f"Neighbor backend {backend} is not supported, "
+                         f"use one of {list(NEIGHBOR_BACKENDS)}.")
+    return NEIGHBOR_BACKENDS[backend](coordinates)
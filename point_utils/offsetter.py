@@ -3,20 +3,50 @@ Module for calculating offset points for the selected points in a point cloud
 using different methods.
 """
 import logging
+import time
 from abc import ABC, abstractmethod
+from functools import partial
+from typing import TYPE_CHECKING, Callable, Optional, Union
 import numpy as np
-from scipy.spatial import KDTree
-from scipy.spatial import ConvexHull
+
+from .index_cache import IndexCache
+from .kernels import (DEFAULT_CLEARANCE_ROUNDS, clearance_offset_vecs,
+                      float_dtype, knn_offset_vecs, pca_normal_offset_vecs,
+                      row_norms)
+from .labels import CategoricalLabels
+from .neighbors import VoxelGrid, build_neighbor_index
+from .parallel import parallel_offset_vecs
+from .profiling import stage
+from .store import PointStore
+from .tiling import halo_knn_offset_vecs, tiled_knn_offset_vecs
+from .utils import load_point_cloud
+
+if TYPE_CHECKING:
+    # scipy is only imported by the methods building K-D Trees or convex hulls
+    from scipy.spatial import ConvexHull, KDTree
 
 __all__ = ['offset_factory']
 
+# Default number of selected points processed per vectorized batch
+DEFAULT_CHUNK_SIZE = 100_000
+# Maximum number of elements of temporary (points, facets) arrays
+MAX_CHUNK_ELEMENTS = 2**24
+# Convex hulls with at most this many distinct facet planes are searched exhaustively
+HULL_DENSE_PLANES = 1024
+# Number of nearest facet samples first searched for the closest hull facet
+HULL_NEAREST_SAMPLES = 16
+# Maximum number of facet samples searched for a point, the facets of points
+# farther from the hull boundary (e.g. deep inside a solid cloud) are bounded by
+# groups of planes with similar normals instead
+HULL_MAX_SAMPLES = 64
+# Maximum number of planes of the smallest groups of similar normals, and the
+# maximum nesting depth of the groups
+HULL_GROUP_PLANES = 32
+HULL_GROUP_DEPTH = 16
+# Maximum subdivision level of the facets searched through the K-D Tree of samples
+HULL_MAX_SUBDIVISION = 8
+
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-# Create StreamHandler for console output
-handler = logging.StreamHandler()
-handler.setFormatter(logging.Formatter(fmt='[%(name)s] %(message)s'))
-# Add the handler to the logger
-logger.addHandler(handler)
 
 
 class OffsetsInterface(ABC):
@@ -24,27 +54,127 @@ class OffsetsInterface(ABC):
     Abstract class for adding offset points at a fixed magnitude for selected
     points in a point cloud.
 
+    :ivar store: Growable store of the coordinates and labels of all points.
     :ivar all_coordinates: Numpy array of shape (N, 3) representing cartesian
                            coordinates of all points.
-    :ivar labels: List of labels for all points.
+    :ivar labels: Categorical labels of all points.
     :ivar data_label_to_offset: Label of the points to offset, these points are
                                 used to calculate offset directions.
     :ivar point_indices: List of indices into the point cloud for which to calculate
                          offset directions.
     :ivar offset_magnitude: Fixed magnitude of all offset vectors.
     :ivar new_data_label: Label for the new offset points.
+    :ivar seed: Seed of `rng`.
+    :ivar rng: Random number generator used for degenerate (zero-norm) directions,
+               seeded by the `seed` argument for reproducible runs.
+    :ivar workers: Number of worker processes used by `add_offset_points`, the
+                   offsets are computed in the current process if 1.
+    :ivar lazy: Keep the original points separately from the new offset points,
+                a contiguous array of all points is then only built when
+                `all_coordinates` or `labels` is accessed, e.g. for saving.
+    :ivar index_cache: Optional on-disk cache the spatial indexes (K-D Tree, convex
+                       hull) are loaded from instead of being rebuilt.
+    :ivar coordinates_key: Optional precomputed `IndexCache.coordinates_key` of
+                           `all_coordinates`, saves hashing the point cloud on
+                           every index cache lookup. It is only used until points
+                           are added.
+    :ivar neighbor_backend: Name of the neighbor search index of the nearest-neighbor
+                            methods and of the `min_clearance` check, see
+                            `point_utils.neighbors`.
+    :ivar min_clearance: Optional minimum distance of the new offset points to the
+                         points of the cloud, see `clearance_offset_vecs`.
+    :ivar clearance_growth: Factor applied to the magnitude of the offset vectors
+                            violating `min_clearance` in every retry round.
+    :ivar clearance_stats: Number of offset points checked, violating
+                           `min_clearance`, corrected and still violating it, in
+                           the last call adding offset points.
     """
 
     def __init__(self, all_coordinates: np.ndarray, labels: list[str],
                  data_label_to_offset: str, offset_magnitude: float,
-                 new_data_label: str):
-        self.all_coordinates = all_coordinates
-        self.labels = np.array(labels)
+                 new_data_label: str, seed: Optional[int] = None,
+                 workers: int = 1, lazy: bool = False,
+                 index_cache: Optional[IndexCache] = None,
+                 coordinates_key: Optional[str] = None,
+                 neighbor_backend: str = 'kdtree',
+                 min_clearance: Optional[float] = None,
+                 clearance_growth: float = 1.):
+        self.store = PointStore(all_coordinates, labels, lazy=lazy)
         self.offset_magnitude = offset_magnitude
         self.new_data_label = new_data_label
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.workers = workers
+        self.index_cache = index_cache
+        self.coordinates_key = coordinates_key
+        self.neighbor_backend = neighbor_backend
+        self.min_clearance = min_clearance
+        self.clearance_growth = clearance_growth
+        self.clearance_stats = None
+        # (number of points, state) for query_offset_vecs
+        self._query_state = None
+        # (number of points, index) of the last built neighbor index
+        self._neighbor_index = None
 
         # Collect indices of the points to offset
-        self.point_indices = np.where(self.labels == data_label_to_offset)[0]
+        self.point_indices = self.labels.select(data_label_to_offset)
+
+    @property
+    def all_coordinates(self) -> np.ndarray:
+        return self.store.coordinates
+
+    @property
+    def labels(self) -> CategoricalLabels:
+        return self.store.labels
+
+    @property
+    def new_coordinates(self) -> np.ndarray:
+        """
+        View of the coordinates of the offset points added so far.
+        """
+        return self.store.added_coordinates
+
+    @classmethod
+    def from_file(cls, filename: str, **settings) -> "OffsetsInterface":
+        """
+        Create the offset calculator for a point cloud file, text or binary
+        ('.pcb'). Binary point clouds are memory-mapped rather than copied.
+        """
+        all_coordinates, labels = load_point_cloud(filename)
+        return cls(all_coordinates=all_coordinates, labels=labels, **settings)
+
+    def get_neighbor_index(self) -> Union['KDTree', VoxelGrid]:
+        """
+        Neighbor search index of all points, built by `neighbor_backend` or
+        loaded from the index cache if available. The index is kept until
+        points are added.
+        """
+        all_coordinates = self.all_coordinates
+        if self._neighbor_index is not None and self._neighbor_index[0] == len(
+                all_coordinates):
+            return self._neighbor_index[1]
+        with stage('index_build', len(all_coordinates)):
+            if self.index_cache is None:
+                index = build_neighbor_index(self.neighbor_backend,
+                                             all_coordinates)
+            else:
+                index = self.index_cache.get_or_build(
+                    self.neighbor_backend,
+                    all_coordinates,
+                    lambda: build_neighbor_index(self.neighbor_backend,
+                                                 all_coordinates),
+                    key=self.index_key())
+        self._neighbor_index = (len(all_coordinates), index)
+        return index
+
+    def index_key(self) -> Optional[str]:
+        """
+        Precomputed index cache key of the current points, None once points are
+        added and the key of the original points no longer applies.
+        """
+        if len(self.store) == self.store.num_original:
+            return self.coordinates_key
+        return None
 
     @abstractmethod
     def get_offset_vecs(self, **kwargs) -> np.ndarray:
@@ -54,56 +184,239 @@ class OffsetsInterface(ABC):
         """
         pass
 
+    @abstractmethod
+    def partition_state(self, **kwargs) -> dict:
+        """
+        All subclasses must implement this method. It should return the small,
+        picklable state shared by all partitions of the selected points, computed
+        once from the whole point cloud, e.g. for the process executor.
+        """
+        pass
+
+    @staticmethod
+    @abstractmethod
+    def partition_offset_vecs(all_coordinates: np.ndarray,
+                              point_indices: np.ndarray,
+                              offset_magnitude: float, state: dict,
+                              **kwargs) -> np.ndarray:
+        """
+        All subclasses must implement this method. It should calculate the offset
+        vectors for a spatial partition of the selected points, given the state
+        returned by `partition_state`.
+        """
+        pass
+
+    def query_state(self, **kwargs) -> dict:
+        """
+        State computed once from the point cloud for `query_offset_vecs`, the
+        partition state by default.
+        """
+        return self.partition_state(**kwargs)
+
+    def get_query_state(self, **kwargs) -> dict:
+        """
+        The cached `query_state`, recomputed only when points were added.
+        """
+        if self._query_state is None or self._query_state[0] != len(
+                self.store):
+            self._query_state = (len(self.store), self.query_state(**kwargs))
+        return self._query_state[1]
+
+    def query_offset_vecs(self, points: np.ndarray, **kwargs) -> np.ndarray:
+        """
+        Calculate offset vectors for arbitrary query points against the point
+        cloud as the reference, e.g. points arriving in a stream. The index or
+        state of the reference cloud is built on the first call and reused.
+
+        :param points: Numpy array of shape (M, 3) of query points.
+        :param kwargs: Method-specific keyword arguments, as for `get_offset_vecs`.
+
+        :return: numpy array of shape (M, 3) containing offset vectors.
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 3)
+        return self.partition_offset_vecs(points,
+                                          np.arange(len(points)),
+                                          self.offset_magnitude,
+                                          self.get_query_state(**kwargs),
+                                          rng=self.rng,
+                                          **kwargs)
+
     def add_offset_points(self, **kwargs):
         """
-        Add new offset points to the original point cloud.
+        Add new offset points to the original point cloud. With more than one
+        worker, the offset vectors are computed by a pool of processes working on
+        spatial partitions of the selected points. With `min_clearance`, the
+        offset points too close to the point cloud are corrected first.
+        """
+        offset_vectors = self._compute_offset_vecs(**kwargs)
+        points = self.store.original_coordinates[self.point_indices]
+        if self.min_clearance is not None:
+            self.clearance_stats = None
+            offset_vectors = self._apply_clearance(self.get_neighbor_index(),
+                                                   self.all_coordinates,
+                                                   points, offset_vectors)
+        with stage('append', len(self.point_indices)):
+            new_points_coords = points + offset_vectors
+            # Add coordinates and labels of new points to the point cloud
+            self.store.append(new_points_coords, self.new_data_label)
+
+    def add_rule_offset_points(self, rules: list[tuple], **kwargs):
+        """
+        Add the offset points of several rules to the original point cloud. The
+        new points are the same, in the same order, as those of one offset
+        calculator per rule and magnitude run on the original point cloud.
+
+        The offset directions are computed once per source label, on the spatial
+        index built once for all labels (except in the tiled mode, which builds
+        its tiles per source label), and scaled to all magnitudes of its rules.
+
+        :param rules: List of (label of the points to offset, list of offset
+                      magnitudes, label of the new points) tuples.
+        :param kwargs: Method-specific keyword arguments, as for `get_offset_vecs`.
+        """
+        point_indices, offset_magnitude, rng = (self.point_indices,
+                                                self.offset_magnitude, self.rng)
+        # Unit offset vectors of the selected points of each source label, all
+        # computed before the first point is added
+        directions = {}
+        try:
+            self.offset_magnitude = 1.
+            for source_label, _, _ in rules:
+                if source_label in directions:
+                    continue
+                self.point_indices = self.store.original_labels.select(
+                    source_label)
+                # Same random directions as a separate run with the same seed
+                self.rng = np.random.default_rng(self.seed)
+                directions[source_label] = (self.point_indices,
+                                            self._compute_offset_vecs(**kwargs))
+        finally:
+            self.point_indices, self.offset_magnitude, self.rng = (
+                point_indices, offset_magnitude, rng)
+
+        if self.min_clearance is not None:
+            # Clearance to the points before the first append, as separate runs
+            self.clearance_stats = None
+            index, all_coordinates = self.get_neighbor_index(), self.all_coordinates
+
+        for source_label, magnitudes, new_label in rules:
+            indices, unit_vectors = directions[source_label]
+            points = self.store.original_coordinates[indices]
+            for magnitude in magnitudes:
+                offset_vectors = unit_vectors * magnitude
+                if self.min_clearance is not None:
+                    offset_vectors = self._apply_clearance(
+                        index, all_coordinates, points, offset_vectors)
+                with stage('append', len(indices)):
+                    self.store.append(points + offset_vectors, new_label)
+
+    def _apply_clearance(self, index, all_coordinates: np.ndarray,
+                         points: np.ndarray,
+                         offset_vectors: np.ndarray) -> np.ndarray:
         """
-        offset_vectors = self.get_offset_vecs(**kwargs)
-        new_points_coords = self.all_coordinates[
-            self.point_indices] + offset_vectors
-        # Add coordinates of new points to the original point cloud
-        self.all_coordinates = np.concatenate(
-            (self.all_coordinates, new_points_coords))
+        Correct the offset vectors violating `min_clearance` and add their counts
+        to `clearance_stats`.
+        """
+        with stage('clearance', len(points)):
+            offset_vectors, violated, unresolved = clearance_offset_vecs(
+                index,
+                all_coordinates,
+                points,
+                offset_vectors,
+                self.min_clearance,
+                growth=self.clearance_growth,
+                max_rounds=DEFAULT_CLEARANCE_ROUNDS,
+                workers=self.workers)
 
-        # Extend the labels list with the labels for new points
-        self.labels = np.concatenate(
-            (self.labels,
-             [self.new_data_label for _ in range(len(new_points_coords))]))
+        num_violations = int(np.count_nonzero(violated))
+        num_unresolved = int(np.count_nonzero(unresolved))
+        if num_unresolved:
+            logger.warning(
+                f"{num_unresolved} offset point(s) are still closer than "
+                f"{self.min_clearance} to the point cloud after "
+                f"{DEFAULT_CLEARANCE_ROUNDS} correction rounds.")
+        stats = self.clearance_stats or dict.fromkeys(
+            ('num_checked', 'num_violations', 'num_corrected', 'num_unresolved'), 0)
+        stats['num_checked'] += len(points)
+        stats['num_violations'] += num_violations
+        stats['num_corrected'] += num_violations - num_unresolved
+        stats['num_unresolved'] += num_unresolved
+        self.clearance_stats = stats
+        return offset_vectors
 
-        assert self.all_coordinates.shape[0] == len(self.labels), \
-            "The number of labels and coordinates mismatch."
+    def _compute_offset_vecs(self, **kwargs) -> np.ndarray:
+        """
+        Offset vectors of the selected points, computed by the process executor
+        with more than one worker.
+        """
+        with stage('offset', len(self.point_indices)):
+            if self.workers > 1:
+                return parallel_offset_vecs(self, self.workers, **kwargs)
+            return self.get_offset_vecs(**kwargs)
 
     @staticmethod
-    def normalizer(vec: np.ndarray) -> np.ndarray:
+    def normalize_rows(vecs: np.ndarray,
+                       rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        """
+        Normalize the rows of the input array. Rows with zero norm are replaced
+        by random unit vectors drawn from `rng`.
+
+        :param vecs: Numpy array of shape (M, 3) representing direction vectors.
+        :param rng: Random number generator for the zero-norm rows, a freshly
+                    seeded generator is used if not provided.
+
+        :return: Numpy array of shape (M, 3) with normalized direction vectors.
+        """
+        with stage('normalize', len(vecs)):
+            vecs = np.array(vecs, dtype=float_dtype(np.asarray(vecs)))
+            norms = row_norms(vecs)
+
+            degenerate = np.isclose(norms, 0., atol=1e-18)
+            num_degenerate = np.count_nonzero(degenerate)
+            if num_degenerate:
+                logger.warning(
+                    f"The norm of {num_degenerate} input vector(s) is zero. Use random unit vectors."
+                )
+                rng = np.random.default_rng() if rng is None else rng
+                vecs[degenerate] = rng.standard_normal((num_degenerate, 3))
+                norms[degenerate] = row_norms(vecs[degenerate])
+
+            return vecs / norms[:, np.newaxis]
+
+    @staticmethod
+    def normalizer(vec: np.ndarray,
+                   rng: Optional[np.random.Generator] = None) -> np.ndarray:
         """
         Normalize the input vector. If the norm of the input vector is zero,
         a random unit vector is returned.
 
         :param direction_vec: Numpy array of shape (1, 3) representing a direction vector.
+        :param rng: Random number generator for the zero-norm case.
 
         :return: Normalized direction vector.
         """
-        norm = np.linalg.norm(vec)
-
-        if np.isclose(norm, 0., atol=1e-18):
-            logger.warning(
-                "The norm of the input vector is zero. Use a random unit vector."
-            )
-            vec = np.random.randn(3)
-            norm = np.linalg.norm(vec)
-
-        return vec / norm
+        return OffsetsInterface.normalize_rows(np.reshape(vec, (1, 3)),
+                                               rng)[0]
 
 
 class KDTreeOffsets(OffsetsInterface):
 
     def __init__(self, **settings):
         super().__init__(**settings)
+        # (number of points, fraction, tree, coordinates) of the subsampled index
+        self._subsample_index = None
 
     def name(self):
         return self.__class__.__name__
 
-    def get_offset_vecs(self, num_neighbors: int = 10) -> np.ndarray:
+    def get_offset_vecs(self,
+                        num_neighbors: int = 10,
+                        workers: int = 1,
+                        chunk_size: int = DEFAULT_CHUNK_SIZE,
+                        tile_budget: Optional[int] = None,
+                        out: Optional[np.ndarray] = None,
+                        eps: float = 0.,
+                        subsample: float = 1.) -> np.ndarray:
         """
         Compute offset vectors for specified points using K-D Tree. To move away
         from the point cloud, for each point whose index is in point_indices, we
@@ -115,87 +428,774 @@ class KDTreeOffsets(OffsetsInterface):
         since the mean displacement vector for each point is zero, e.g.
         an infinite regular cubic lattice in 3D space.
 
+        All selected points are queried in batches of `chunk_size` points, so the
+        temporary (chunk_size, num_neighbors, 3) displacement array bounds the memory.
+        With `tile_budget`, the K-D Tree is built tile by tile instead of over the
+        whole point cloud (see `point_utils.tiling`), for point clouds that do not
+        fit into memory together with their tree.
+
+        For very large, dense point clouds, the approximate mode trades accuracy
+        for throughput: `eps` lets the K-D Tree query return neighbors up to
+        (1 + eps) times farther than the exact ones, and `subsample` builds the
+        tree on a random fraction of the points only. `approximation_report`
+        measures the resulting deviation of the offset directions.
+
         :param num_neighbors: The number of nearest neighbors to include when calculating
                               displacement vectors. Small values will have a localized offset
                               direction.
+        :param workers: Number of threads used by the K-D Tree query, -1 uses all cores.
+        :param chunk_size: Number of selected points queried per batch.
+        :param tile_budget: Maximum number of points loaded at once in the tiled mode,
+                            the whole point cloud is used if not provided.
+        :param out: Optional array of shape (len(point_indices), 3) the offset vectors
+                    are written to, e.g. a memory-mapped `.npy` file in the tiled mode.
+        :param eps: Approximation tolerance of the K-D Tree queries, exact if 0.
+        :param subsample: Fraction of the points the K-D Tree is built on, the
+                          whole point cloud if 1, not supported in the tiled mode.
 
         :return: numpy array of shape (len(point_indices), 3) containing offset vectors.
         """
-        tree = KDTree(self.all_coordinates)
+        if tile_budget is not None:
+            if subsample < 1:
+                raise ValueError("Subsampling is not supported in the tiled mode.")
+            offset_vectors, zero_norm_indices = tiled_knn_offset_vecs(
+                self.all_coordinates,
+                self.point_indices,
+                num_neighbors,
+                self.offset_magnitude,
+                tile_budget=tile_budget,
+                out=out,
+                workers=workers,
+                kernel=self.offset_kernel(eps),
+                backend=self.neighbor_backend)
+            self._warn_zero_norm(zero_norm_indices, num_neighbors)
+            return offset_vectors
 
-        offset_vectors = []
-        for idx in self.point_indices:
-            point = self.all_coordinates[idx]
+        tree, coordinates = self.get_index(subsample)
+        kernel = self.offset_kernel(eps)
 
-            # Find nearest neighbors to the current point
-            _, nearest_neighbor_indices = tree.query(point, k=num_neighbors)
+        if out is None:
+            out = np.empty((len(self.point_indices), 3),
+                           dtype=float_dtype(self.all_coordinates))
+        offset_vectors = out
+        zero_norm_indices = []
+        for start in range(0, len(self.point_indices), chunk_size):
+            indices = self.point_indices[start:start + chunk_size]
+            with stage('query', len(indices)):
+                vectors, zero_norm, _ = kernel(
+                    tree, coordinates, self.all_coordinates[indices],
+                    num_neighbors, self.offset_magnitude, workers)
+            offset_vectors[start:start + chunk_size] = vectors
+            zero_norm_indices.append(indices[zero_norm])
 
-            # Calculate mean displacement vector from the point to its nearest neighbors
-            avg_displacement = np.mean(
-                self.all_coordinates[nearest_neighbor_indices] - point, axis=0)
+        self._warn_zero_norm(
+            np.concatenate(zero_norm_indices or [[]]).astype(int),
+            num_neighbors)
+        return offset_vectors
 
-            norm = np.linalg.norm(avg_displacement)
-            if np.isclose(norm, 0):
-                logger.warning(
-                    f"The mean displacement vector for {num_neighbors} nearest neighbors of point {idx} is zero. "
-                    "Consider increasing the number of neighbors or using a different method."
-                )
+    def offset_kernel(self, eps: float = 0.) -> Callable:
+        """
+        Function computing the offset vectors of points from a K-D Tree of the
+        point cloud, see `knn_offset_vecs`. It is sent to the worker processes in
+        the process executor, so it must be picklable.
+
+        :param eps: Approximation tolerance of the K-D Tree queries.
+        """
+        return partial(knn_offset_vecs, eps=eps) if eps else knn_offset_vecs
+
+    def get_index(
+            self,
+            subsample: float = 1.
+    ) -> tuple[Union['KDTree', VoxelGrid], np.ndarray]:
+        """
+        Neighbor search index and the coordinates it is built on, all points or a
+        random fraction of them. The random fraction is drawn from the seed of the
+        offset calculator and kept until points are added.
+
+        :param subsample: Fraction of the points in the tree, in (0, 1].
+        """
+        if not 0 < subsample <= 1:
+            raise ValueError(
+                f"The subsampled fraction must be in (0, 1], got {subsample}.")
+        if subsample == 1:
+            return self.get_neighbor_index(), self.all_coordinates
+
+        num_points = len(self.store)
+        if self._subsample_index is None or self._subsample_index[:2] != (
+                num_points, subsample):
+            keep = np.random.default_rng(self.seed).random(num_points) < subsample
+            coordinates = self.all_coordinates[keep]
+            with stage('index_build', len(coordinates)):
+                self._subsample_index = (num_points, subsample,
+                                         build_neighbor_index(
+                                             self.neighbor_backend,
+                                             coordinates), coordinates)
+        return self._subsample_index[2:]
+
+    def approximation_report(self,
+                             num_neighbors: int = 10,
+                             eps: float = 0.,
+                             subsample: float = 1.,
+                             sample_size: int = 1000,
+                             workers: int = 1) -> dict:
+        """
+        Measure the error of the approximate mode of `get_offset_vecs`: the angular
+        deviation of the approximate offset directions from the exact ones, and
+        the query times of both, on a random sample of the selected points.
+
+        :param num_neighbors: The number of nearest neighbors of each point.
+        :param eps: Approximation tolerance of the K-D Tree queries.
+        :param subsample: Fraction of the points the K-D Tree is built on.
+        :param sample_size: Maximum number of selected points compared.
+        :param workers: Number of threads used by the K-D Tree queries.
+
+        :return: Dictionary with the number of compared points, the mean, 95th
+                 percentile and maximum angular deviation in degrees, and the
+                 exact and approximate query times in seconds.
+        """
+        rng = np.random.default_rng(self.seed)
+        sample = np.sort(
+            rng.choice(self.point_indices,
+                       size=min(sample_size, len(self.point_indices)),
+                       replace=False))
+        points = self.all_coordinates[sample]
+
+        vectors, times = [], []
+        for index, kernel in ((self.get_index(), self.offset_kernel()),
+                              (self.get_index(subsample),
+                               self.offset_kernel(eps))):
+            start = time.perf_counter()
+            vectors.append(kernel(*index, points, num_neighbors, 1., workers)[0])
+            times.append(time.perf_counter() - start)
+
+        # Angles between unit vectors, accurate for small angles unlike arccos,
+        # points without a defined direction are not compared
+        angles = np.degrees(
+            np.arctan2(row_norms(np.cross(vectors[0], vectors[1])),
+                       np.sum(vectors[0] * vectors[1], axis=1)))
+        angles = angles[np.isfinite(angles)]
+        if not len(angles):
+            angles = np.array([np.nan])
+        return {
+            'sample_size': len(sample),
+            'mean_deviation': float(np.mean(angles)),
+            'p95_deviation': float(np.percentile(angles, 95)),
+            'max_deviation': float(np.max(angles)),
+            'exact_query_time': times[0],
+            'approximate_query_time': times[1],
+        }
+
+    def query_state(self, eps: float = 0., subsample: float = 1., **kwargs) -> dict:
+        tree, coordinates = self.get_index(subsample)
+        return {
+            'tree': tree,
+            'coordinates': coordinates,
+            'kernel': self.offset_kernel(eps)
+        }
+
+    def query_offset_vecs(self,
+                          points: np.ndarray,
+                          num_neighbors: int = 10,
+                          workers: int = 1,
+                          eps: float = 0.,
+                          subsample: float = 1.) -> np.ndarray:
+        """
+        Offset vectors of query points from the mean displacement vector to their
+        nearest neighbors in the point cloud, see `OffsetsInterface.query_offset_vecs`.
+        The approximation options of the first call are kept, see `get_offset_vecs`.
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 3)
+        state = self.get_query_state(eps=eps, subsample=subsample)
+        with stage('query', len(points)):
+            offset_vectors, zero_norm, _ = state['kernel'](
+                state['tree'], state['coordinates'], points,
+                num_neighbors, self.offset_magnitude, workers)
+        self._warn_zero_norm(np.flatnonzero(zero_norm), num_neighbors)
+        return offset_vectors
+
+    def partition_state(self,
+                        num_neighbors: int = 10,
+                        eps: float = 0.,
+                        subsample: float = 1.,
+                        **kwargs) -> dict:
+        if kwargs.get('tile_budget') is not None:
+            raise ValueError(
+                "The tiled mode is not supported by the process executor.")
+        if subsample < 1:
+            raise ValueError(
+                "Subsampling is not supported by the process executor.")
+        lower = np.min(self.all_coordinates, axis=0)
+        upper = np.max(self.all_coordinates, axis=0)
+        # Initial halo width holding about num_neighbors points at the mean density
+        volume = np.prod(np.maximum(upper - lower, 1e-12))
+        halo = (num_neighbors * volume / len(self.all_coordinates))**(1 / 3)
+        return {
+            'lower': lower,
+            'upper': upper,
+            'halo': halo,
+            'kernel': self.offset_kernel(eps),
+            'neighbor_backend': self.neighbor_backend
+        }
 
-            # Flip the vector to point away from densely populated space,
-            # normalize and scale by the input offset magnitude.
-            offset_vector = -avg_displacement / norm * self.offset_magnitude
+    @staticmethod
+    def partition_offset_vecs(all_coordinates: np.ndarray,
+                              point_indices: np.ndarray,
+                              offset_magnitude: float,
+                              state: dict,
+                              num_neighbors: int = 10,
+                              workers: int = 1,
+                              **kwargs) -> np.ndarray:
+        """
+        Offset vectors of a spatial partition of the selected points, computed on a
+        K-D Tree of the bounding box of the partition plus a halo only.
+        """
+
+        def load_region(lower, upper):
+            inside = np.all((all_coordinates >= lower) &
+                            (all_coordinates <= upper),
+                            axis=1)
+            return all_coordinates[inside]
+
+        points = all_coordinates[point_indices]
+        offset_vectors, _ = halo_knn_offset_vecs(load_region, state['lower'],
+                                                 state['upper'],
+                                                 points.min(axis=0),
+                                                 points.max(axis=0), points,
+                                                 num_neighbors,
+                                                 offset_magnitude,
+                                                 state['halo'], workers,
+                                                 state['kernel'],
+                                                 state['neighbor_backend'])
+        return offset_vectors
+
+    @staticmethod
+    def _warn_zero_norm(zero_norm_indices: np.ndarray, num_neighbors: int):
+        """
+        Emit one warning for all points whose mean displacement vector is zero.
+        """
+        if len(zero_norm_indices):
+            shown = zero_norm_indices[:10].tolist()
+            logger.warning(
+                f"The mean displacement vector for {num_neighbors} nearest neighbors of "
+                f"{len(zero_norm_indices)} point(s) is zero, e.g. points {shown}. "
+                "Consider increasing the number of neighbors or using a different method."
+            )
 
-            offset_vectors.append(offset_vector)
 
-        return np.array(offset_vectors)
+class PCANormalOffsets(KDTreeOffsets):
+    """
+    Offset points along the local surface normals of the point cloud. The normal of
+    a point is the direction of least variance of its nearest neighbors, i.e. the
+    eigenvector of the smallest eigenvalue of their covariance matrix, oriented away
+    from the centroid of the neighbors. On a curved surface, the orientation follows
+    from the curvature within the neighborhood, which takes enough neighbors
+    (about 20) to dominate the sampling noise.
+
+    Unlike the mean displacement of `KDTreeOffsets`, the normal is well defined for
+    points with symmetric neighborhoods, e.g. on a flat regular grid. Normals whose
+    orientation is still ambiguous point away from the centroid of the point cloud.
+
+    The nearest neighbors of a chunk of points are found with one K-D Tree query and
+    all (chunk_size, 3, 3) covariance matrices are diagonalized with one batched
+    `np.linalg.eigh` call, the options of `KDTreeOffsets.get_offset_vecs` apply.
+    """
+
+    def offset_kernel(self, eps: float = 0.) -> Callable:
+        return partial(pca_normal_offset_vecs,
+                       eps=eps,
+                       centroid=np.mean(self.all_coordinates, axis=0, dtype=np.float64))
+
+    @staticmethod
+    def _warn_zero_norm(zero_norm_indices: np.ndarray, num_neighbors: int):
+        """
+        Emit one warning for all points whose normal orientation is ambiguous.
+        """
+        if len(zero_norm_indices):
+            shown = zero_norm_indices[:10].tolist()
+            logger.warning(
+                f"The normal orientation for {num_neighbors} nearest neighbors of "
+                f"{len(zero_norm_indices)} point(s) is ambiguous, e.g. points {shown}. "
+                "They were oriented away from the centroid of the point cloud.")
+
+
+def _subdivision_weights(level: int) -> np.ndarray:
+    """
+    Barycentric coordinates of the centroids of the level**2 triangles of a
+    regular subdivision of a triangle, as an array of shape (level**2, 3).
+    """
+    corners = np.array([(i, j, level - 1 - i - j)
+                        for i in range(level)
+                        for j in range(level - i)]).reshape(-1, 3)
+    weights = [corners + 1 / 3]
+    if level > 1:
+        inverted = np.array([(i, j, level - 2 - i - j)
+                             for i in range(level - 1)
+                             for j in range(level - 1 - i)])
+        weights.append(inverted + 2 / 3)
+    return np.concatenate(weights) / level
+
+
+def _expand_ranges(rows: np.ndarray, starts: np.ndarray,
+                   ends: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Pairs of each row with every integer of its range [start, end), as the
+    arrays of the rows and of the integers.
+    """
+    counts = ends - starts
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+    return np.repeat(rows, counts), np.arange(len(offsets)) + offsets
+
+
+class HullData:
+    """
+    Arrays of a computed convex hull. Unlike `ConvexHull`, it can be pickled,
+    e.g. into the index cache.
+    """
+
+    def __init__(self, hull: 'ConvexHull'):
+        self.equations = hull.equations
+        self.simplices = hull.simplices
+        self.neighbors = hull.neighbors
+        self.vertices = hull.vertices
+        self.min_bound = hull.min_bound
+        self.max_bound = hull.max_bound
+        self.area = hull.area
+        self.volume = hull.volume
 
 
 class ConvexHullOffsets(OffsetsInterface):
+    """
+    :ivar incremental: Build the convex hull in Qhull's incremental mode, new points
+                       appended to the point cloud are then added to the existing
+                       hull instead of rebuilding it from scratch.
+    """
 
-    def __init__(self, **settings):
+    def __init__(self, incremental: bool = False, **settings):
         super().__init__(**settings)
+        self.incremental = incremental
+        self._hull = None
+        self._num_hull_points = 0
 
     def name(self):
         return self.__class__.__name__
 
-    def get_offset_vecs(self, **kwargs):
+    def get_hull(self) -> Union['ConvexHull', HullData]:
+        """
+        Return the convex hull of the current point cloud, computing it only for
+        points which are not part of the cached hull yet. Non-incremental hulls
+        are loaded from the index cache if available, as `HullData`.
+        """
+        from scipy.spatial import ConvexHull
+
+        num_points = len(self.all_coordinates)
+        with stage('index_build', num_points):
+            if self._hull is None or (not self.incremental and
+                                      num_points != self._num_hull_points):
+                if self.index_cache is not None and not self.incremental:
+                    all_coordinates = self.all_coordinates
+                    self._hull = self.index_cache.get_or_build(
+                        'hull',
+                        all_coordinates,
+                        lambda: HullData(ConvexHull(all_coordinates)),
+                        key=self.index_key())
+                else:
+                    self._hull = ConvexHull(self.all_coordinates,
+                                            incremental=self.incremental)
+            elif num_points > self._num_hull_points:
+                self._hull.add_points(
+                    self.all_coordinates[self._num_hull_points:])
+        self._num_hull_points = num_points
+        return self._hull
+
+    def get_offset_vecs(self, chunk_size: int = DEFAULT_CHUNK_SIZE):
         """
         Calculates offset vector for each selected point in the direction of the
-        outward normal of the closest triangle/facet on the convex hull.
-        """
-        # Compute the convex hull of the point cloud
-        hull = ConvexHull(self.all_coordinates)
-        hull_points = self.all_coordinates[hull.vertices]
-        centroid = np.mean(self.all_coordinates[hull.vertices], axis=0)
-        tree = KDTree(hull_points)
-
-        offset_vectors = []
-        for idx in self.point_indices:
-            point = self.all_coordinates[idx]
-
-            # Find the nearest facet (triangle) of the convex hull
-            _, indices = tree.query(point.reshape(1, -1), k=3)
-            # Get the coordinates of the facet vertices
-            facet_coordinates = self.all_coordinates[indices[0]]
-            # Compute the outward normal vector of the facet
-            direction = np.cross(facet_coordinates[1] - facet_coordinates[0],
-                                 facet_coordinates[2] - facet_coordinates[0])
-            to_centroid = centroid - point
-            if np.dot(direction, to_centroid) > 0:
-                direction = -direction
-
-            # The following method doesn't work well, so commented out
-            # Approximate the outward normal vector of facet by the vector from
-            # the target point to the nearest hull vertex
-            # _, indices = tree.query(point.reshape(1, -1), k=1)
-            # nearest_vertex = hull_points[indices[0]]
-            # direction = point - nearest_vertex
-
-            # Normalize and scale the direction vector by the offset magnitude
-            offset_vectors.append(
-                self.normalizer(direction) * self.offset_magnitude)
-
-        return np.array(offset_vectors)
+        outward normal of the closest facet on the convex hull.
+
+        The facet planes are taken from `ConvexHull.equations`, whose rows
+        (n, d) hold the outward unit normal n and offset d with n.x + d <= 0
+        inside the hull. Qhull triangulates facets with more than three vertices
+        into coplanar simplices with the same equation, so the planes are
+        deduplicated first. For a point inside the hull the closest facet is the
+        one with the largest n.x + d, i.e. its distance to the hull boundary.
+        Points equidistant to several planes (e.g. points on a hull edge or
+        vertex) use the mean normal of those planes, unless the normals cancel out.
+
+        Hulls with many planes are searched through a K-D Tree of samples of the
+        facets: the planes of the nearest samples bound the distance to the
+        boundary from above, and only the facets with samples within that
+        distance plus the sample radius are checked, besides the few facets much
+        larger than the median. Points farther from the boundary, e.g. deep inside
+        a solid cloud, are close to many samples and check the planes of the
+        groups of similar normals whose bound of the distances reaches the
+        closest plane found so far instead.
+
+        :param chunk_size: Maximum number of selected points processed per batch,
+                           it is reduced for points checking many facets so that
+                           at most MAX_CHUNK_ELEMENTS distances are held in memory.
+
+        :return: numpy array of shape (len(point_indices), 3) containing offset vectors.
+        """
+        return self.partition_offset_vecs(self.all_coordinates,
+                                          self.point_indices,
+                                          self.offset_magnitude,
+                                          self.partition_state(),
+                                          chunk_size=chunk_size)
+
+    def query_state(self, **kwargs) -> dict:
+        """
+        The deduplicated facet planes, checked exhaustively since query points
+        may lie outside the hull, where the bound of the facet search fails.
+        """
+        from scipy.sparse import coo_matrix
+        from scipy.sparse.csgraph import connected_components
+
+        hull = self.get_hull()
+        # Coplanar simplices of a facet share its equation and are connected
+        # through the neighbors of the simplices
+        equations = hull.equations
+        simplices = np.repeat(np.arange(len(equations)), 3)
+        neighbors = hull.neighbors.reshape(-1)
+        coplanar = np.all(equations[simplices] == equations[neighbors], axis=1)
+        _, facet_planes = connected_components(coo_matrix(
+            (np.ones(coplanar.sum()), (simplices[coplanar], neighbors[coplanar])),
+            shape=(len(equations), len(equations))),
+                                               directed=False)
+        _, representatives = np.unique(facet_planes, return_index=True)
+        # Tolerance for points equidistant to several facets
+        atol = 1e-10 * np.max(hull.max_bound - hull.min_bound)
+        return {
+            'planes': equations[representatives],
+            'facet_planes': facet_planes,
+            'atol': atol
+        }
+
+    def partition_state(self, **kwargs) -> dict:
+        from scipy.spatial import cKDTree
+
+        state = self.query_state()
+        if len(state['planes']) <= HULL_DENSE_PLANES:
+            return state
+
+        # Facets are sampled at the centroids of a regular subdivision into
+        # level**2 triangles, so that the points of a facet lie within the median
+        # facet radius of a sample. Facets needing more samples are checked for
+        # all points instead.
+        hull = self.get_hull()
+        vertices = np.asarray(self.all_coordinates[hull.simplices],
+                              dtype=np.float64)
+        centroids = vertices.mean(axis=1)
+        radii = np.linalg.norm(vertices - centroids[:, np.newaxis],
+                               axis=2).max(axis=1)
+        levels = np.ceil(radii / np.median(radii)).astype(int).clip(min=1)
+        samples, sample_planes = [], []
+        for level in np.unique(levels[levels <= HULL_MAX_SUBDIVISION]):
+            facets = np.flatnonzero(levels == level)
+            samples.append(
+                np.einsum('sj,fjk->fsk', _subdivision_weights(level),
+                          vertices[facets]).reshape(-1, 3))
+            sample_planes.append(np.repeat(state['facet_planes'][facets], level**2))
+        state.update(tree=cKDTree(np.concatenate(samples)),
+                     tree_planes=np.concatenate(sample_planes),
+                     tree_radius=np.max(radii / levels, where=levels <=
+                                        HULL_MAX_SUBDIVISION, initial=0.),
+                     large_planes=np.unique(
+                         state['facet_planes'][levels > HULL_MAX_SUBDIVISION]))
+        state.update(self._plane_groups(state['planes'],
+                                        (hull.min_bound + hull.max_bound) / 2))
+        return state
+
+    @staticmethod
+    def _plane_groups(planes: np.ndarray, origin: np.ndarray) -> dict:
+        """
+        Nested groups of planes with similar normals, the cells of a quadtree on
+        each face of a cube map of the normal directions, split until they hold
+        at most HULL_GROUP_PLANES planes. For a point p, the signed distances
+        n.p + d of the planes of a cell are bounded by c.(p - o) + r |p - o| + D,
+        with the unit mean normal c of the cell, the largest distance r of its
+        normals to c and the largest signed distance D of its planes to the
+        origin o.
+        """
+        normals, offsets = planes[:, :3], planes[:, 3]
+        axis = np.argmax(np.abs(normals), axis=1)
+        major = normals[np.arange(len(planes)), axis]
+        minor = np.take_along_axis(normals, (axis[:, np.newaxis] + [1, 2]) % 3,
+                                   axis=1) / np.abs(major)[:, np.newaxis]
+        cells = np.minimum(((minor + 1) / 2 * 2**HULL_GROUP_DEPTH).astype(np.int64),
+                           2**HULL_GROUP_DEPTH - 1)
+        # Faces in the high bits, then the interleaved bits of the cell
+        # coordinates, so that the planes of a cell are contiguous at all levels
+        keys = 2 * axis.astype(np.int64) + (major < 0)
+        for bit in reversed(range(HULL_GROUP_DEPTH)):
+            keys = 4 * keys + 2 * ((cells[:, 0] >> bit) & 1) + (
+                (cells[:, 1] >> bit) & 1)
+
+        # Sorted by cell, then by decreasing signed distance to the origin
+        origin_distances = normals @ origin + offsets
+        order = np.lexsort((-origin_distances, keys))
+        keys, normals = keys[order], normals[order]
+        origin_distances = origin_distances[order]
+        levels = []
+        splitting = np.arange(len(planes))
+        for level in range(HULL_GROUP_DEPTH + 1):
+            _, first, sizes = np.unique(keys[splitting] >> 2 *
+                                        (HULL_GROUP_DEPTH - level),
+                                        return_index=True,
+                                        return_counts=True)
+            starts = splitting[first]
+            centers = np.add.reduceat(normals[splitting], first)
+            centers /= row_norms(centers)[:, np.newaxis]
+            leaves = (sizes <= HULL_GROUP_PLANES) | (level == HULL_GROUP_DEPTH)
+            levels.append({
+                'starts': starts,
+                'ends': starts + sizes,
+                'leaves': leaves,
+                'centers': centers,
+                'radii': np.maximum.reduceat(
+                    row_norms(normals[splitting] -
+                              np.repeat(centers, sizes, axis=0)), first),
+                'offsets': np.maximum.reduceat(origin_distances[splitting],
+                                               first)
+            })
+            splitting = splitting[np.repeat(~leaves, sizes)]
+            if not len(splitting):
+                break
+        # The cells of a level lie within the cells of the previous one which
+        # are not leaves
+        for parent, children in zip(levels[:-1], levels[1:]):
+            parent['first_child'] = np.searchsorted(children['starts'],
+                                                    parent['starts'])
+            parent['last_child'] = np.searchsorted(children['starts'],
+                                                   parent['ends'])
+        return {'group_planes': order, 'group_levels': levels, 'origin': origin}
+
+    @staticmethod
+    def partition_offset_vecs(all_coordinates: np.ndarray,
+                              point_indices: np.ndarray,
+                              offset_magnitude: float,
+                              state: dict,
+                              chunk_size: int = DEFAULT_CHUNK_SIZE,
+                              **kwargs) -> np.ndarray:
+        normals = state['planes'][:, :3]
+        offset_vectors = np.empty((len(point_indices), 3),
+                                  dtype=float_dtype(all_coordinates))
+        for start in range(0, len(point_indices), chunk_size):
+            points = all_coordinates[point_indices[start:start + chunk_size]]
+            with stage('query', len(points)):
+                if 'tree' in state:
+                    directions, closest = ConvexHullOffsets._nearby_plane_normals(
+                        points, state)
+                else:
+                    directions, closest = ConvexHullOffsets._all_plane_normals(
+                        points, state['planes'], state['atol'])
+                norms = row_norms(directions)
+                # Normals of opposite facets cancel out, e.g. at the center of a cube
+                degenerate = np.isclose(norms, 0)
+                directions[degenerate] = normals[closest[degenerate]]
+                norms[degenerate] = 1.
+                offset_vectors[start:start + len(points)] = (
+                    directions / norms[:, np.newaxis] * offset_magnitude)
+
+        return offset_vectors
+
+    @staticmethod
+    def _all_plane_normals(points: np.ndarray, planes: np.ndarray,
+                           atol: float) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Sum of the normals of the closest planes of each point and the lowest
+        index of its closest planes, from the signed distances to all planes.
+        """
+        normals, offsets = planes[:, :3], planes[:, 3]
+        directions = np.zeros((len(points), 3))
+        closest = np.empty(len(points), dtype=np.intp)
+        rows = max(1, MAX_CHUNK_ELEMENTS // len(planes))
+        for start in range(0, len(points), rows):
+            distances = points[start:start + rows] @ normals.T
+            distances += offsets
+            maxima = distances.max(axis=1)
+            # Only a few planes per point are within the tolerance of the closest
+            point_rows, nearest = np.nonzero(
+                distances >= maxima[:, np.newaxis] - atol)
+            np.add.at(directions, start + point_rows, normals[nearest])
+            # The first of them, as in the other searches
+            first = np.flatnonzero(np.diff(point_rows, prepend=-1))
+            closest[start:start + rows] = nearest[first]
+        return directions, closest
+
+    @staticmethod
+    def _candidate_plane_normals(
+            points: np.ndarray, candidates: np.ndarray, planes: np.ndarray,
+            atol: float) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        As `_all_plane_normals`, from an (M, K) array of candidate plane indices
+        of the points. Also returns the largest signed distance of each point.
+        """
+        distances = np.einsum('ijk,ik->ij', planes[candidates, :3],
+                              points) + planes[candidates, 3]
+        maxima = distances.max(axis=1)
+        nearest = np.where(distances >= maxima[:, np.newaxis] - atol, candidates,
+                           -1)
+        # Coplanar facets share their plane, whose normal is counted once
+        nearest.sort(axis=1)
+        first = (nearest >= 0) & (np.diff(nearest, axis=1, prepend=-1) != 0)
+        directions = np.einsum('ij,ijk->ik', first.astype(planes.dtype),
+                               planes[nearest, :3])
+        closest = nearest[np.arange(len(points)), np.argmax(nearest >= 0, axis=1)]
+        return directions, closest, maxima
+
+    @staticmethod
+    def _nearby_plane_normals(points: np.ndarray,
+                              state: dict) -> tuple[np.ndarray, np.ndarray]:
+        """
+        As `_all_plane_normals`, checking only the planes of the facets which can
+        be closest to the points inside the hull.
+
+        The closest candidate plane bounds the distance to the hull boundary, and
+        the facet containing the closest boundary point has a sample within that
+        distance plus the sample radius from the point. Points with farther
+        samples than their nearest candidates are searched again with more, up to
+        HULL_MAX_SAMPLES. The planes of points farther from the boundary, whose
+        bound covers more samples, are searched by `_grouped_plane_normals`.
+        """
+        planes, atol = state['planes'], state['atol']
+        tree, tree_planes = state['tree'], state['tree_planes']
+        large_planes = state['large_planes']
+
+        # Samples beyond the search radius are reported missing, with the index
+        # tree.n, and replaced by the first sample, whose plane is as valid a
+        # candidate as any
+        search_radius = np.sqrt(HULL_MAX_SAMPLES) * state['tree_radius']
+        tree_planes = np.append(tree_planes, tree_planes[:1])
+
+        directions = np.empty((len(points), 3))
+        closest = np.empty(len(points), dtype=np.intp)
+        lower = np.empty(len(points))
+        pending = np.arange(len(points))
+        far = []
+        num_samples = min(HULL_NEAREST_SAMPLES, tree.n)
+        while len(pending):
+            num_candidates = num_samples + len(large_planes)
+            rows = max(1, MAX_CHUNK_ELEMENTS // (3 * num_candidates))
+            unfinished = []
+            for start in range(0, len(pending), rows):
+                indices = pending[start:start + rows]
+                distances, samples = tree.query(
+                    points[indices],
+                    k=num_samples,
+                    distance_upper_bound=search_radius)
+                distances = distances.reshape(len(indices), -1)
+                candidates = np.concatenate([
+                    tree_planes[samples.reshape(len(indices), -1)],
+                    np.broadcast_to(large_planes, (len(indices), len(large_planes)))
+                ], axis=1)
+                chunk_directions, chunk_closest, maxima = (
+                    ConvexHullOffsets._candidate_plane_normals(
+                        points[indices], candidates, planes, atol))
+                radius = np.maximum(-maxima, 0.) + atol + state['tree_radius']
+                complete = (radius < search_radius) & (
+                    (num_samples == tree.n) | (distances[:, -1] > radius))
+                directions[indices[complete]] = chunk_directions[complete]
+                closest[indices[complete]] = chunk_closest[complete]
+                grouped = ~complete & ((radius >= search_radius) |
+                                       (2 * num_samples > HULL_MAX_SAMPLES))
+                lower[indices[grouped]] = maxima[grouped]
+                far.append(indices[grouped])
+                unfinished.append(indices[~complete & ~grouped])
+            pending = np.concatenate(unfinished)
+            num_samples = min(2 * num_samples, tree.n)
+
+        far = np.concatenate(far)
+        if len(far):
+            directions[far], closest[far] = (
+                ConvexHullOffsets._grouped_plane_normals(points[far], lower[far],
+                                                         state))
+        return directions, closest
+
+    @staticmethod
+    def _grouped_plane_normals(points: np.ndarray, lower: np.ndarray,
+                               state: dict) -> tuple[np.ndarray, np.ndarray]:
+        """
+        As `_all_plane_normals`, checking only the planes of the cells whose bound
+        of the signed distances (see `_plane_groups`) reaches the largest signed
+        distance of the points to a plane found so far. It starts at `lower` and
+        is raised by the first plane of each cell checked, from the largest cells
+        down to the smallest.
+        """
+        planes, atol = state['planes'], state['atol']
+        group_planes, levels = state['group_planes'], state['group_levels']
+        num_leaves = sum(int(level['leaves'].sum()) for level in levels)
+
+        directions = np.zeros((len(points), 3))
+        closest = np.empty(len(points), dtype=np.intp)
+        # Bounds the (point, cell) pairs of a batch
+        rows = max(1, MAX_CHUNK_ELEMENTS // (3 * num_leaves))
+        for start in range(0, len(points), rows):
+            chunk = points[start:start + rows]
+            relative = chunk - state['origin']
+            relative_norms = row_norms(relative)
+            chunk_lower = lower[start:start + rows].copy()
+            point_rows = np.repeat(np.arange(len(chunk)), len(levels[0]['starts']))
+            cells = np.tile(np.arange(len(levels[0]['starts'])), len(chunk))
+            leaf_rows, leaf_starts, leaf_ends = [], [], []
+            for level in levels:
+                # The pairs are sorted by point
+                first = np.flatnonzero(np.diff(point_rows, prepend=-1))
+                first_planes = planes[group_planes[level['starts'][cells]]]
+                distances = np.einsum('ij,ij->i', first_planes[:, :3],
+                                      chunk[point_rows]) + first_planes[:, 3]
+                chunk_lower[point_rows[first]] = np.maximum(
+                    chunk_lower[point_rows[first]],
+                    np.maximum.reduceat(distances, first))
+                bounds = (np.einsum('ij,ij->i', level['centers'][cells],
+                                    relative[point_rows]) +
+                          level['radii'][cells] * relative_norms[point_rows] +
+                          level['offsets'][cells])
+                keep = bounds >= chunk_lower[point_rows] - atol
+                point_rows, cells = point_rows[keep], cells[keep]
+                leaves = level['leaves'][cells]
+                leaf_rows.append(point_rows[leaves])
+                leaf_starts.append(level['starts'][cells[leaves]])
+                leaf_ends.append(level['ends'][cells[leaves]])
+                if 'first_child' not in level:
+                    break
+                point_rows, cells = _expand_ranges(
+                    point_rows[~leaves], level['first_child'][cells[~leaves]],
+                    level['last_child'][cells[~leaves]])
+                if not len(point_rows):
+                    break
+
+            # Planes of the remaining cells, in batches of whole points. Each
+            # point keeps at least the cell of its closest plane.
+            point_rows = np.concatenate(leaf_rows)
+            order = np.argsort(point_rows, kind='stable')
+            plane_rows, positions = _expand_ranges(
+                point_rows[order],
+                np.concatenate(leaf_starts)[order],
+                np.concatenate(leaf_ends)[order])
+            batch = MAX_CHUNK_ELEMENTS // 3
+            first_pair = 0
+            while first_pair < len(plane_rows):
+                # Batches end with the last plane of a point
+                last_pair = np.searchsorted(
+                    plane_rows,
+                    plane_rows[min(first_pair + batch, len(plane_rows)) - 1],
+                    side='right')
+                batch_rows = plane_rows[first_pair:last_pair]
+                candidates = group_planes[positions[first_pair:last_pair]]
+                first_pair = last_pair
+
+                distances = np.einsum('ij,ij->i', planes[candidates, :3],
+                                      chunk[batch_rows]) + planes[candidates, 3]
+                first = np.flatnonzero(np.diff(batch_rows, prepend=-1))
+                maxima = np.repeat(np.maximum.reduceat(distances, first),
+                                   np.diff(first, append=len(batch_rows)))
+                nearest = np.flatnonzero(distances >= maxima - atol)
+                np.add.at(directions, start + batch_rows[nearest],
+                          planes[candidates[nearest], :3])
+                first = np.flatnonzero(np.diff(batch_rows[nearest], prepend=-1))
+                closest[start + batch_rows[nearest[first]]] = np.minimum.reduceat(
+                    candidates[nearest], first)
+        return directions, closest
 
 
 class CentroidOffsets(OffsetsInterface):
@@ -206,30 +1206,51 @@ class CentroidOffsets(OffsetsInterface):
     def name(self):
         return self.__class__.__name__
 
-    def get_offset_vecs(self, **kwargs):
+    def get_offset_vecs(self, chunk_size: int = DEFAULT_CHUNK_SIZE):
         """
         Calculates offset vectors for the specified points that point away from
         the centroid of the entire point cloud.
-        """
-        # Compute the centroid of the point cloud
-        centroid = np.mean(self.all_coordinates, axis=0)
 
-        offset_vectors = []
+        :param chunk_size: Number of selected points processed per batch.
 
-        for idx in self.point_indices:
-            point = self.all_coordinates[idx]
-            # Compute the direction vector from the centroid to the point
-            direction = point - centroid
+        :return: numpy array of shape (len(point_indices), 3) containing offset vectors.
+        """
+        return self.partition_offset_vecs(self.all_coordinates,
+                                          self.point_indices,
+                                          self.offset_magnitude,
+                                          self.partition_state(),
+                                          rng=self.rng,
+                                          chunk_size=chunk_size)
 
-            # Normalize and scale the direction vector by the offset magnitude
-            offset_vectors.append(
-                self.normalizer(direction) * self.offset_magnitude)
+    def partition_state(self, **kwargs) -> dict:
+        # Compute the centroid of the point cloud, accumulated in float64
+        centroid = np.mean(self.all_coordinates, axis=0, dtype=np.float64)
+        return {'centroid': centroid.astype(float_dtype(self.all_coordinates))}
+
+    @staticmethod
+    def partition_offset_vecs(all_coordinates: np.ndarray,
+                              point_indices: np.ndarray,
+                              offset_magnitude: float,
+                              state: dict,
+                              rng: Optional[np.random.Generator] = None,
+                              chunk_size: int = DEFAULT_CHUNK_SIZE,
+                              **kwargs) -> np.ndarray:
+        offset_vectors = np.empty((len(point_indices), 3),
+                                  dtype=float_dtype(all_coordinates))
+        for start in range(0, len(point_indices), chunk_size):
+            indices = point_indices[start:start + chunk_size]
+            # Normalize the direction vectors from the centroid to the points
+            # and scale by the offset magnitude
+            offset_vectors[start:start + chunk_size] = OffsetsInterface.normalize_rows(
+                all_coordinates[indices] - state['centroid'],
+                rng) * offset_magnitude
 
-        return np.array(offset_vectors)
+        return offset_vectors
 
 
 OFFSET_METHOD_TO_CLASS = {
     'KDTreeOffsets': KDTreeOffsets,
+    'PCANormalOffsets': PCANormalOffsets,
     'ConvexHullOffsets': ConvexHullOffsets,
     'CentroidOffsets': CentroidOffsets
 }
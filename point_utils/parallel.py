@@ -0,0 +1,145 @@
+"""
+Process executor for the offset methods.
+
+The selected points are split into spatially compact partitions which are
+processed by a pool of worker processes. The coordinates of the point cloud are
+copied once into shared memory, which the workers attach to instead of receiving
+a pickled copy. Each offset method provides the state shared by all partitions,
+computed once from the whole point cloud (`OffsetsInterface.partition_state`),
+and the computation of one partition (`OffsetsInterface.partition_offset_vecs`).
+"""
+import logging
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from .kernels import float_dtype
+
+__all__ = ['parallel_offset_vecs', 'spatial_partitions']
+
+logger = logging.getLogger(__name__)
+
+# Number of partitions per worker process, more partitions balance the load better
+PARTITIONS_PER_WORKER = 4
+
+
+def spatial_partitions(points: np.ndarray, num_parts: int) -> list[np.ndarray]:
+    """
+    Split points into spatially compact partitions of about equal size by
+    recursive median bisection along the widest axis.
+
+    :param points: Numpy array of shape (M, 3).
+    :param num_parts: Number of partitions.
+
+    :return: List of arrays with the positions of the points of each partition,
+             every position appears in exactly one partition.
+    """
+    parts = [np.arange(len(points))]
+    while len(parts) < num_parts:
+        # Bisect the largest partition
+        largest = max(range(len(parts)), key=lambda i: len(parts[i]))
+        positions = parts.pop(largest)
+        if len(positions) < 2:
+            parts.append(positions)
+            break
+        coordinates = points[positions]
+        axis = np.argmax(np.ptp(coordinates, axis=0))
+        order = np.argpartition(coordinates[:, axis], len(positions) // 2)
+        parts += [
+            positions[order[:len(positions) // 2]],
+            positions[order[len(positions) // 2:]]
+        ]
+    return parts
+
+
+def _attach_shared_memory(name: str) -> SharedMemory:
+    """
+    Attach to an existing shared memory block without registering it with the
+    resource tracker, the creating process owns and unlinks it.
+    """
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name=name, track=False)
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args: None
+    try:
+        return SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+def _partition_worker(cls, shm_name: str, shape: tuple, dtype: str,
+                      point_indices: np.ndarray, offset_magnitude: float,
+                      state: dict, seed: int, kwargs: dict) -> np.ndarray:
+    shm = _attach_shared_memory(shm_name)
+    try:
+        all_coordinates = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        offset_vectors = cls.partition_offset_vecs(
+            all_coordinates,
+            point_indices,
+            offset_magnitude,
+            state,
+            rng=np.random.default_rng(seed),
+            **kwargs)
+        del all_coordinates
+    finally:
+        shm.close()
+    return offset_vectors
+
+
+def parallel_offset_vecs(offsetter, workers: int, **kwargs) -> np.ndarray:
+    """
+    Compute the offset vectors of the selected points of an offset calculator with
+    a pool of worker processes.
+
+    :param offsetter: `OffsetsInterface` instance.
+    :param workers: Number of worker processes.
+    :param kwargs: Method-specific keyword arguments, as for `get_offset_vecs`.
+
+    :return: numpy array of shape (len(point_indices), 3) containing offset vectors,
+             in the order of `point_indices`.
+    """
+    point_indices = offsetter.point_indices
+    all_coordinates = np.asarray(offsetter.all_coordinates)
+    offset_vectors = np.empty((len(point_indices), 3),
+                              dtype=float_dtype(all_coordinates))
+    if not len(point_indices):
+        return offset_vectors
+
+    state = offsetter.partition_state(**kwargs)
+    parts = spatial_partitions(all_coordinates[point_indices],
+                               workers * PARTITIONS_PER_WORKER)
+    # Independent random streams for the partitions, reproducible for a seeded offsetter
+    seeds = offsetter.rng.integers(2**63, size=len(parts))
+
+    shm = SharedMemory(create=True, size=max(all_coordinates.nbytes, 1))
+    try:
+        shared = np.ndarray(all_coordinates.shape,
+                            dtype=all_coordinates.dtype,
+                            buffer=shm.buf)
+        shared[:] = all_coordinates
+        del shared
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(_partition_worker, type(offsetter), shm.name,
+                                all_coordinates.shape, all_coordinates.dtype.str,
+                                point_indices[part], offsetter.offset_magnitude,
+                                state, seed, kwargs)
+                for part, seed in zip(parts, seeds)
+            ]
+            # Merge the partitions back into the order of point_indices
+            for part, future in zip(parts, futures):
+                offset_vectors[part] = future.result()
+    finally:
+        shm.close()
+        shm.unlink()
+
+    not_finite = point_indices[~np.isfinite(offset_vectors).all(axis=1)]
+    if len(not_finite):
+        logger.warning(
+            f"The offset vectors of {len(not_finite)} point(s) are not finite, "
+            f"e.g. points {not_finite[:10].tolist()}.")
+    return offset_vectors
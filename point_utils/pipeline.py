@@ -0,0 +1,178 @@
+"""
+Run one offset job, the steps of `scripts/main.py` for a single configuration.
+"""
+import logging
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from .index_cache import IndexCache
+from .offsetter import OFFSET_METHOD_TO_CLASS, KDTreeOffsets, offset_factory
+from .utils import (DEFAULT_OUT_TXT, is_binary_file, load_point_cloud,
+                    save_point_cloud, visualize)
+
+__all__ = ['run_job']
+
+logger = logging.getLogger(__name__)
+
+
+def run_job(settings: dict,
+            all_coordinates: Optional[np.ndarray] = None,
+            labels=None,
+            index_cache: Optional[IndexCache] = None,
+            headless: bool = False,
+            coordinates_key: Optional[str] = None) -> dict:
+    """
+    Add the offset points of a configuration and save the point cloud.
+
+    :param settings: Configuration settings, as read from the YAML file. With
+                     `offset_rules`, the offset points of all rules are added
+                     in one pass, see `OffsetsInterface.add_rule_offset_points`.
+    :param all_coordinates: Coordinates of the input point cloud, read from
+                            `settings['input_file']` if not provided. They are
+                            converted to the `dtype` of the settings.
+    :param labels: Labels of the input point cloud, with `all_coordinates`.
+    :param index_cache: Optional cache of the spatial indexes.
+    :param headless: Never show the plot, only save it.
+    :param coordinates_key: Optional precomputed `IndexCache.coordinates_key` of
+                            `all_coordinates`, for callers running several jobs
+                            on the same point cloud.
+
+    :return: Summary of the job with the output file, point counts, the time in
+             seconds spent in each step, with `knn_quality_sample` the
+             `approximation_report` of the offset calculator and with
+             `min_clearance` its `clearance_stats`.
+    """
+    timings = {}
+    start = time.perf_counter()
+    dtype = settings.get('dtype', 'float64')
+    if all_coordinates is None:
+        all_coordinates, labels = load_point_cloud(settings['input_file'],
+                                                   dtype=dtype)
+        timings['load'] = time.perf_counter() - start
+    else:
+        if np.asarray(all_coordinates).dtype != dtype:
+            # The key was computed on the coordinates before the conversion
+            coordinates_key = None
+        all_coordinates = np.asarray(all_coordinates, dtype=dtype)
+
+    rules = [(rule['data_label_to_offset'], rule['offset_magnitudes'],
+              rule['new_data_label'])
+             for rule in settings.get('offset_rules') or []]
+    if rules:
+        # Rules are applied by add_rule_offset_points, the first one is the default
+        data_label_to_offset, magnitudes, new_data_label = rules[0]
+        offset_magnitude = magnitudes[0]
+    else:
+        data_label_to_offset = settings['data_label_to_offset']
+        offset_magnitude = settings['offset_magnitude']
+        new_data_label = settings['new_data_label']
+
+    # Method-specific keyword arguments, the tiled mode and the approximate
+    # queries apply to the nearest-neighbor methods only
+    kwargs = {}
+    if settings.get('tile_budget'):
+        kwargs['tile_budget'] = settings['tile_budget']
+    if settings.get('knn_eps'):
+        kwargs['eps'] = settings['knn_eps']
+    if settings.get('knn_subsample', 1) < 1:
+        kwargs['subsample'] = settings['knn_subsample']
+    if kwargs and not issubclass(
+            OFFSET_METHOD_TO_CLASS.get(settings['offset_method'], object),
+            KDTreeOffsets):
+        logger.warning(f"The options {', '.join(kwargs)} are ignored by "
+                       f"{settings['offset_method']}.")
+        kwargs = {}
+
+    # Setup the offset calculator based on settings. In the tiled mode, the new
+    # points are kept separately so the point cloud is not copied.
+    offset_calculator = offset_factory(
+        offset_method=settings['offset_method'],
+        all_coordinates=all_coordinates,
+        labels=labels,
+        data_label_to_offset=data_label_to_offset,
+        offset_magnitude=offset_magnitude,
+        new_data_label=new_data_label,
+        seed=settings.get('seed'),
+        workers=settings.get('workers', 1),
+        index_cache=index_cache,
+        coordinates_key=coordinates_key,
+        neighbor_backend=settings.get('neighbor_backend', 'kdtree'),
+        min_clearance=settings.get('min_clearance'),
+        clearance_growth=settings.get('clearance_growth', 1.),
+        lazy='tile_budget' in kwargs)
+
+    approximation = None
+    if settings.get('knn_quality_sample') and isinstance(
+            offset_calculator, KDTreeOffsets):
+        approximation = offset_calculator.approximation_report(
+            eps=kwargs.get('eps', 0.),
+            subsample=kwargs.get('subsample', 1.),
+            sample_size=settings['knn_quality_sample'])
+        logger.info(f"Approximate offset directions: {approximation}")
+
+    # Calculate offset points for selected points
+    step = time.perf_counter()
+    if rules:
+        offset_calculator.add_rule_offset_points(rules, **kwargs)
+        source_labels = {rule[0] for rule in rules}
+        num_selected_points = sum(
+            len(offset_calculator.store.original_labels.select(label))
+            for label in source_labels)
+    else:
+        offset_calculator.add_offset_points(**kwargs)
+        num_selected_points = len(offset_calculator.point_indices)
+    timings['offset'] = time.perf_counter() - step
+
+    step = time.perf_counter()
+    out_file = Path(settings.get('output_file', DEFAULT_OUT_TXT))
+    out_path = out_file.resolve()
+    if settings.get('output_new_points_only', False):
+        # Only the new points are written, the original ones are in the file already
+        save_point_cloud(out_path,
+                         offset_calculator.store.added_coordinates,
+                         offset_calculator.store.added_labels,
+                         precision=settings.get('output_precision'),
+                         append=True)
+    elif offset_calculator.store.lazy and not is_binary_file(out_path):
+        # The original and the new points are written without joining them
+        save_point_cloud(out_path,
+                         offset_calculator.store.original_coordinates,
+                         offset_calculator.store.original_labels,
+                         precision=settings.get('output_precision'))
+        save_point_cloud(out_path,
+                         offset_calculator.store.added_coordinates,
+                         offset_calculator.store.added_labels,
+                         precision=settings.get('output_precision'),
+                         append=True)
+    else:
+        save_point_cloud(out_path,
+                         offset_calculator.all_coordinates,
+                         offset_calculator.labels,
+                         precision=settings.get('output_precision'))
+    timings['save'] = time.perf_counter() - step
+
+    if settings.get('visualize', True):
+        step = time.perf_counter()
+        visualize(out_file,
+                  output_file=out_file.with_suffix(".png"),
+                  max_points=settings.get('visualize_max_points', 100_000),
+                  downsample=settings.get('visualize_downsample', "voxel"),
+                  show=settings.get('visualize_show', True) and not headless)
+        timings['visualize'] = time.perf_counter() - step
+
+    timings['total'] = time.perf_counter() - start
+    summary = {
+        'output_file': str(out_path),
+        'num_input_points': len(all_coordinates),
+        'num_selected_points': num_selected_points,
+        'num_added_points': offset_calculator.store.num_added,
+        'timings': timings
+    }
+    if approximation is not None:
+        summary['approximation'] = approximation
+    if offset_calculator.clearance_stats is not None:
+        summary['clearance'] = offset_calculator.clearance_stats
+    return summary
@@ -0,0 +1,166 @@
+"""
+Stage-level instrumentation of the point cloud pipeline.
+
+The steps of the pipeline (loading, index building, queries, appending, saving,
+plotting) are wrapped in `stage` blocks. While at least one hook is registered,
+each stage records its wall time, CPU time, the peak resident set size of the
+process and the number of points it processed, and passes the record to the
+hooks. Without hooks a stage does nothing but check the hook list.
+
+Example:
+    with Profiler() as profiler:
+        offsetter.add_offset_points()
+    profiler.write_json("profile.json")
+"""
+import json
+import sys
+import threading
+import time
+from typing import Callable, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+__all__ = ['stage', 'add_hook', 'remove_hook', 'Profiler']
+
+_hooks = []
+_local = threading.local()
+
+
+def add_hook(hook: Callable[[dict], None]):
+    """
+    Register a function called with the record of every finished stage, a dict
+    with the keys 'name', 'path' (names of the enclosing stages and the stage,
+    joined by ';'), 'wall_time', 'cpu_time' (seconds), 'peak_rss' (bytes) and
+    'num_points'.
+    """
+    _hooks.append(hook)
+
+
+def remove_hook(hook: Callable[[dict], None]):
+    _hooks.remove(hook)
+
+
+def peak_rss() -> Optional[int]:
+    """
+    Peak resident set size of the process in bytes, None if unknown.
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+class stage:
+    """
+    Context manager recording a stage of the pipeline. The number of points can
+    be passed in or set on the stage within the block.
+
+    :ivar name: Name of the stage.
+    :ivar num_points: Number of points processed by the stage.
+    """
+    __slots__ = ('name', 'num_points', '_path', '_wall_start', '_cpu_start')
+
+    def __init__(self, name: str, num_points: Optional[int] = None):
+        self.name = name
+        self.num_points = num_points
+        self._path = None
+
+    def __enter__(self) -> "stage":
+        if not _hooks:
+            return self
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self.name)
+        self._path = ";".join(stack)
+        self._cpu_start = time.process_time()
+        self._wall_start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._path is None:
+            return
+        wall_time = time.perf_counter() - self._wall_start
+        cpu_time = time.process_time() - self._cpu_start
+        _local.stack.pop()
+        record = {
+            'name': self.name,
+            'path': self._path,
+            'wall_time': wall_time,
+            'cpu_time': cpu_time,
+            'peak_rss': peak_rss(),
+            'num_points': self.num_points
+        }
+        self._path = None
+        for hook in list(_hooks):
+            hook(record)
+
+
+class Profiler:
+    """
+    Hook aggregating the stage records by stage path, used as a context manager
+    to register it for the duration of a block.
+
+    :ivar records: The records of all finished stages.
+    """
+
+    def __init__(self):
+        self.records = []
+
+    def __call__(self, record: dict):
+        self.records.append(record)
+
+    def __enter__(self) -> "Profiler":
+        add_hook(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        remove_hook(self)
+
+    def report(self) -> dict:
+        """
+        Totals per stage path: number of calls, wall and CPU time, number of
+        points and maximum peak RSS, plus the self wall time excluding the
+        nested stages.
+        """
+        stages = {}
+        for record in self.records:
+            totals = stages.setdefault(
+                record['path'], {
+                    'calls': 0,
+                    'wall_time': 0.,
+                    'self_time': 0.,
+                    'cpu_time': 0.,
+                    'num_points': 0,
+                    'peak_rss': 0
+                })
+            totals['calls'] += 1
+            totals['wall_time'] += record['wall_time']
+            totals['self_time'] += record['wall_time']
+            totals['cpu_time'] += record['cpu_time']
+            totals['num_points'] += record['num_points'] or 0
+            totals['peak_rss'] = max(totals['peak_rss'], record['peak_rss']
+                                     or 0)
+        for path, totals in stages.items():
+            parent = path.rpartition(";")[0]
+            if parent in stages:
+                stages[parent]['self_time'] -= totals['wall_time']
+        return stages
+
+    def write_json(self, filename: str):
+        with open(filename, "w") as fhandle:
+            json.dump({'stages': self.report()}, fhandle, indent=2)
+
+    def write_folded(self, filename: str):
+        """
+        Write the self times in microseconds as folded stacks ('a;b;c 123'
+        lines), the input format of flamegraph tools.
+        """
+        with open(filename, "w") as fhandle:
+            for path, totals in self.report().items():
+                fhandle.write(
+                    f"{path} {max(round(totals['self_time'] * 1e6), 0)}\n")
@@ -0,0 +1,274 @@
+"""
+Long-lived local offset service, keeping point clouds and their spatial indexes
+in memory between requests.
+
+The service answers on localhost HTTP:
+
+- `POST /offset` with a JSON job configuration, as the YAML configuration of
+  `scripts/main.py`, runs the job (see `run_job`) and returns its summary.
+- `GET /stats` returns the request count, latency percentiles and the hits and
+  misses of the point cloud and index caches.
+
+Point clouds are cached by file path, modification time and size, indexes by a
+hash of the coordinates (see `IndexCache`), both in least recently used order.
+The hash is computed once when a point cloud is loaded. Requests are handled
+concurrently by one thread each.
+
+Jobs read and write files as the user running the service, so requests whose
+Host header is not a loopback address are rejected (403), e.g. from web pages
+resolving their own domain to 127.0.0.1, as are job requests whose content type
+is not JSON (415), which browsers send cross-origin without asking.
+"""
+import ipaddress
+import json
+import logging
+import threading
+import time
+import urllib.request
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from .index_cache import IndexCache
+from .labels import CategoricalLabels
+from .pipeline import run_job
+from .utils import load_point_cloud
+
+__all__ = ['OffsetService', 'make_server', 'request_offsets', 'request_stats']
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Default number of point clouds and indexes kept in memory
+DEFAULT_MAX_CLOUDS = 4
+DEFAULT_MAX_INDEXES = 8
+# Number of most recent request latencies the percentiles are computed on
+LATENCY_WINDOW = 10_000
+
+
+class OffsetService:
+    """
+    Offset jobs sharing in-memory caches of point clouds and spatial indexes.
+
+    :ivar max_clouds: Number of most recently used point clouds kept in memory.
+    :ivar index_cache: In-memory cache of the spatial indexes.
+    :ivar cloud_hits: Number of requests whose point cloud was cached.
+    :ivar cloud_misses: Number of requests which loaded their point cloud.
+    :ivar num_requests: Number of handled requests.
+    :ivar num_errors: Number of failed requests.
+    """
+
+    def __init__(self,
+                 max_clouds: int = DEFAULT_MAX_CLOUDS,
+                 max_indexes: int = DEFAULT_MAX_INDEXES):
+        self.max_clouds = max_clouds
+        self.index_cache = IndexCache(directory=None, memory_items=max_indexes)
+        self.cloud_hits = 0
+        self.cloud_misses = 0
+        self.num_requests = 0
+        self.num_errors = 0
+        self._clouds = OrderedDict()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    def load_cloud(
+            self,
+            filename: str,
+            dtype: str = 'float64'
+    ) -> tuple[np.ndarray, CategoricalLabels, str]:
+        """
+        Coordinates, labels and `IndexCache.coordinates_key` of a point cloud
+        file, loaded only if the file is not cached or changed since it was cached.
+        """
+        path = Path(filename).resolve()
+        stat = path.stat()
+        key = (str(path), stat.st_mtime_ns, stat.st_size, dtype)
+        with self._lock:
+            if key in self._clouds:
+                self._clouds.move_to_end(key)
+                self.cloud_hits += 1
+                return self._clouds[key]
+
+        all_coordinates, labels = load_point_cloud(path, dtype=dtype)
+        cloud = (all_coordinates, labels,
+                 IndexCache.coordinates_key(all_coordinates))
+        with self._lock:
+            self.cloud_misses += 1
+            self._clouds[key] = cloud
+            while len(self._clouds) > self.max_clouds:
+                self._clouds.popitem(last=False)
+        return cloud
+
+    def run(self, settings: dict) -> dict:
+        """
+        Run an offset job on the cached point cloud and indexes.
+
+        :param settings: Configuration settings of the job, with absolute paths.
+
+        :return: Summary of the job, see `run_job`.
+        """
+        start = time.perf_counter()
+        try:
+            all_coordinates, labels, coordinates_key = self.load_cloud(
+                settings['input_file'], settings.get('dtype', 'float64'))
+            return run_job(settings,
+                           all_coordinates=all_coordinates,
+                           labels=labels,
+                           index_cache=self.index_cache,
+                           headless=True,
+                           coordinates_key=coordinates_key)
+        except Exception:
+            with self._lock:
+                self.num_errors += 1
+            raise
+        finally:
+            with self._lock:
+                self.num_requests += 1
+                self._latencies.append(time.perf_counter() - start)
+
+    def stats(self) -> dict:
+        with self._lock:
+            latencies = np.array(self._latencies or [np.nan])
+            return {
+                'uptime': time.perf_counter() - self._start,
+                'num_requests': self.num_requests,
+                'num_errors': self.num_errors,
+                'latency_p50': float(np.percentile(latencies, 50)),
+                'latency_p95': float(np.percentile(latencies, 95)),
+                'latency_p99': float(np.percentile(latencies, 99)),
+                'cloud_cache': {
+                    'hits': self.cloud_hits,
+                    'misses': self.cloud_misses,
+                    'size': len(self._clouds)
+                },
+                'index_cache': self.index_cache.stats(),
+            }
+
+
+def make_server(host: str = DEFAULT_HOST,
+                port: int = DEFAULT_PORT,
+                service: Optional[OffsetService] = None) -> ThreadingHTTPServer:
+    """
+    HTTP server of an offset service, started with `serve_forever()`.
+
+    :param host: Address to listen on, only local clients can connect to the
+                 default loopback address. Requests naming another host are
+                 rejected on any address.
+    :param port: Port to listen on, a free port is chosen if 0.
+    :param service: Offset service answering the requests, a new one if not provided.
+    """
+    service = OffsetService() if service is None else service
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def _reply(self, status: int, body: dict):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _check_host(self) -> bool:
+            if not _is_loopback_host(self.headers.get("Host", "")):
+                self._reply(403, {'error': "Only local clients are served."})
+                return False
+            return True
+
+        def do_GET(self):
+            if not self._check_host():
+                return
+            if self.path == "/stats":
+                self._reply(200, service.stats())
+            else:
+                self._reply(404, {'error': f"Unknown path {self.path}"})
+
+        def do_POST(self):
+            if not self._check_host():
+                return
+            if self.path != "/offset":
+                self._reply(404, {'error': f"Unknown path {self.path}"})
+                return
+            if self.headers.get_content_type() != "application/json":
+                self._reply(415, {'error': "The request must be application/json."})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                settings = json.loads(self.rfile.read(length))
+                summary = service.run(settings)
+            except Exception as e:
+                logger.error(f"Request failed: {type(e).__name__}: {e}")
+                self._reply(400, {'error': f"{type(e).__name__}: {e}"})
+            else:
+                self._reply(200, summary)
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def _is_loopback_host(host: str) -> bool:
+    """
+    Whether the value of a Host header, with an optional port, names the local
+    machine.
+    """
+    if host.startswith("["):
+        name = host[1:host.find("]")]
+    elif host.count(":") == 1:
+        name = host.split(":")[0]
+    else:
+        name = host
+    if name.lower() == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(name).is_loopback
+    except ValueError:
+        return False
+
+
+def _request(url: str, data: Optional[dict] = None,
+             timeout: Optional[float] = None) -> dict:
+    body = None if data is None else json.dumps(data).encode()
+    request = urllib.request.Request(
+        url, data=body, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        raise RuntimeError(json.loads(e.read()).get('error', str(e))) from None
+
+
+def request_offsets(url: str,
+                    settings: dict,
+                    timeout: Optional[float] = None) -> dict:
+    """
+    Run an offset job on a service. Relative file paths of the settings are
+    resolved against the current directory, as for a local run.
+
+    :param url: URL of the service, e.g. 'http://127.0.0.1:8765'.
+    :param settings: Configuration settings of the job.
+    :param timeout: Timeout of the request in seconds.
+
+    :return: Summary of the job, see `run_job`.
+    """
+    settings = dict(settings)
+    for name in ('input_file', 'output_file'):
+        if name in settings:
+            settings[name] = str(Path(settings[name]).resolve())
+    return _request(url.rstrip("/") + "/offset", settings, timeout)
+
+
+def request_stats(url: str, timeout: Optional[float] = None) -> dict:
+    """
+    Statistics of a service, see `OffsetService.stats`.
+    """
+    return _request(url.rstrip("/") + "/stats", timeout=timeout)
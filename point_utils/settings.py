@@ -3,7 +3,25 @@ Schema for the configuration settings, function to load and validate the setting
 """
 import yaml
 from pathlib import Path
-from pydantic import BaseModel, Field, field_validator
+from typing import Literal, Optional, Union
+from pydantic import BaseModel, Field, field_validator, model_validator
+
+INPUT_FILE_SUFFIXES = (".txt", ".txt.gz", ".txt.zst", ".pcb")
+# Offset methods based on nearest-neighbor queries
+KNN_OFFSET_METHODS = ("KDTreeOffsets", "PCANormalOffsets")
+
+
+class OffsetRule(BaseModel):
+    """
+    Schema of one offset rule, the offset points of the points with one label at
+    one or more magnitudes.
+    """
+    data_label_to_offset: Union[str, float] = Field(
+        description="Label of the points to offset.")
+    offset_magnitudes: list[float] = Field(
+        min_length=1, description="Magnitudes of the offsets, one shell each.")
+    new_data_label: Union[str, float] = Field(
+        description="Label for the new offset points.")
 
 
 class ConfigSettings(BaseModel):
@@ -11,28 +29,154 @@ class ConfigSettings(BaseModel):
     Schema for the configuration settings.
     """
     # Required settings
-    input_file: str = Field(description="Path to the input text file.")
-    offset_magnitude: float = Field(description="Magnitude of the offset.")
-    data_label_to_offset: float = Field(
-        description="Label of the points to offset.")
-    new_data_label: float = Field(
-        description="Label for the new offset points.")
+    input_file: str = Field(
+        description="Path to the input text file, optionally compressed "
+        "(.txt.gz, .txt.zst), or binary (.pcb) point cloud.")
+
+    # Required settings unless offset_rules is set
+    offset_magnitude: Optional[float] = Field(
+        default=None, description="Magnitude of the offset.")
+    data_label_to_offset: Optional[Union[str, float]] = Field(
+        default=None, description="Label of the points to offset.")
+    new_data_label: Optional[Union[str, float]] = Field(
+        default=None, description="Label for the new offset points.")
 
     # Optional settings
+    offset_rules: Optional[list[OffsetRule]] = Field(
+        default=None,
+        description="Offset rules applied in one pass over the spatial index "
+        "instead of offset_magnitude, data_label_to_offset and new_data_label.")
     offset_method: str = Field(
         default="KDTreeOffsets",
         description="Method used for offset calculation.")
-    output_file: str = Field(default="output.txt",
-                             description="Path to the output text file.")
+    output_file: str = Field(
+        default="output.txt",
+        description="Path to the output file, '.pcb' writes a binary point cloud, "
+        "'.gz' or '.zst' a compressed text file.")
+    output_precision: Optional[int] = Field(
+        default=None,
+        ge=0,
+        description="Number of decimals of the coordinates in text output files, "
+        "by default the shortest exact representation.")
+    output_new_points_only: bool = Field(
+        default=False,
+        description="Append only the new offset points to the existing text output "
+        "file, e.g. the input file itself, instead of rewriting all points.")
     visualize: bool = Field(default=False,
                             description="Plot the final output point cloud.")
+    visualize_max_points: Optional[int] = Field(
+        default=100_000,
+        ge=1,
+        description="Maximum number of plotted points, larger point clouds are "
+        "downsampled. All points are plotted if not set.")
+    visualize_downsample: Literal["voxel", "random"] = Field(
+        default="voxel",
+        description="Downsampling method of the plot, 'voxel' keeps one point per "
+        "voxel and label, 'random' a random subset.")
+    visualize_show: bool = Field(
+        default=True,
+        description="Show the plot in a window, otherwise only save it.")
+    tile_budget: Optional[int] = Field(
+        default=None,
+        description="KDTreeOffsets and PCANormalOffsets only, maximum number of points loaded at once "
+        "in the out-of-core tiled mode, disabled if not set.")
+    neighbor_backend: Literal["kdtree", "grid"] = Field(
+        default="kdtree",
+        description="Neighbor search index of KDTreeOffsets and PCANormalOffsets "
+        "and of the min_clearance check, 'kdtree' for any point cloud or 'grid', "
+        "a voxel grid which builds faster but queries slower, for point clouds of "
+        "nearly uniform density with few points queried per build.")
+    knn_eps: float = Field(
+        default=0.,
+        ge=0,
+        description="KDTreeOffsets and PCANormalOffsets only, approximation "
+        "tolerance of the nearest-neighbor queries, neighbors may be up to "
+        "(1 + knn_eps) times farther than the exact ones.")
+    knn_subsample: float = Field(
+        default=1.,
+        gt=0,
+        le=1,
+        description="KDTreeOffsets and PCANormalOffsets only, fraction of the "
+        "points the K-D Tree is built on.")
+    knn_quality_sample: int = Field(
+        default=0,
+        ge=0,
+        description="Number of selected points on which the approximate offset "
+        "directions are compared to the exact ones, disabled if 0.")
+    min_clearance: Optional[float] = Field(
+        default=None,
+        gt=0,
+        description="Minimum distance of the new offset points to the point "
+        "cloud, closer offset points are steered away from their nearest point. "
+        "Not checked if not set.")
+    clearance_growth: float = Field(
+        default=1.,
+        ge=1,
+        description="Factor applied to the offset magnitude of the points "
+        "violating min_clearance in each correction round, 1 keeps the magnitude.")
+    dtype: Literal["float64", "float32"] = Field(
+        default="float64",
+        description="Floating point type of the coordinates, float32 halves the "
+        "memory of the point cloud, for data of limited precision (about 7 "
+        "significant digits).")
+    workers: int = Field(
+        default=1,
+        ge=1,
+        description="Number of worker processes computing the offset vectors.")
+    seed: Optional[int] = Field(
+        default=None,
+        description="Seed for the random directions of degenerate points.")
+    index_cache: bool = Field(
+        default=True,
+        description="Reuse the spatial indexes (K-D Tree, convex hull) of "
+        "previously processed point clouds, cached on disk.")
+    index_cache_dir: str = Field(
+        default="~/.cache/point_utils",
+        description="Directory of the spatial index cache.")
+    index_cache_max_bytes: int = Field(
+        default=2**32,
+        ge=0,
+        description="Maximum size of the spatial index cache, the least recently "
+        "used indexes are deleted beyond it.")
 
     @field_validator("input_file")
     def check_input_file(cls, input_file):
-        if Path(input_file).suffix != ".txt":
-            raise ValueError("Input file must be a text file.")
+        if not str(input_file).endswith(INPUT_FILE_SUFFIXES):
+            raise ValueError(
+                "Input file must be a text file (.txt) or a binary point cloud (.pcb). "
+                "Text files may be compressed (.txt.gz, .txt.zst).")
         return input_file
 
+    @model_validator(mode="after")
+    def check_offset_rule(self):
+        single_rule = (self.offset_magnitude, self.data_label_to_offset,
+                       self.new_data_label)
+        if self.offset_rules is None and None in single_rule:
+            raise ValueError(
+                "offset_magnitude, data_label_to_offset and new_data_label are "
+                "required unless offset_rules is set.")
+        return self
+
+    @model_validator(mode="after")
+    def check_knn_settings(self):
+        knn_settings = {
+            'tile_budget': self.tile_budget,
+            'knn_eps': self.knn_eps,
+            'knn_subsample': self.knn_subsample < 1
+        }
+        for name, enabled in knn_settings.items():
+            if enabled and self.offset_method not in KNN_OFFSET_METHODS:
+                raise ValueError(f"{name} is only supported by the offset methods "
+                                 f"{KNN_OFFSET_METHODS}.")
+        # Options the process executor and the tiled mode do not combine with
+        if self.knn_subsample < 1 and (self.workers > 1 or self.tile_budget):
+            raise ValueError("knn_subsample is not supported with more than one "
+                             "worker or with tile_budget.")
+        if self.tile_budget and self.workers > 1:
+            raise ValueError(
+                "tile_budget is not supported with more than one worker.")
+        return self
+
     @classmethod
     def write_default_config_to_yaml(cls, yaml_path: str):
         """
@@ -50,6 +194,8 @@ class ConfigSettings(BaseModel):
         default_strings = []
         for key, val_dict in schema["properties"].items():
             default_value = val_dict.get("default", ' ')
+            if default_value is None:
+                default_value = "null"
             default_strings.append(f"{key}: {default_value}")
 
         return "\n".join(default_strings)
@@ -0,0 +1,164 @@
+"""
+Growable storage of point coordinates and labels.
+"""
+import numpy as np
+
+from .labels import CategoricalLabels, as_categorical, code_dtype
+
+__all__ = ['PointStore']
+
+
+class PointStore:
+    """
+    Point coordinates and categorical labels which grow by appending new points, using
+    buffers whose capacity is doubled when full, so appending is amortized O(1)
+    instead of copying the whole point cloud on every append.
+
+    The original points are not copied until the first append. In the lazy mode
+    they are never copied into the buffers: the new points are stored separately,
+    and a contiguous array of all points is only built (and cached) when
+    `coordinates` or `labels` is accessed.
+
+    Note that arrays returned by the properties are views which may refer to a
+    previous buffer after the next append.
+
+    :ivar num_original: Number of points the store was created with.
+    :ivar lazy: Whether the original points are kept separately from the new ones.
+    """
+
+    def __init__(self, all_coordinates: np.ndarray, labels, lazy: bool = False):
+        if len(all_coordinates) != len(labels):
+            raise ValueError("The number of labels and coordinates mismatch.")
+        self._original_coordinates = all_coordinates
+        self._original_labels = as_categorical(labels)
+        self._categories = self._original_labels.categories
+        self.num_original = len(all_coordinates)
+        self.lazy = lazy
+
+        # Buffers hold all points (label codes), or only the new points in the lazy mode
+        self._coordinates = None
+        self._codes = None
+        self._size = 0
+        self._materialized = None
+
+    def __len__(self) -> int:
+        return self.num_original + self.num_added
+
+    @property
+    def num_added(self) -> int:
+        return self._size - (0 if self.lazy or self._coordinates is None else
+                             self.num_original)
+
+    @property
+    def original_coordinates(self) -> np.ndarray:
+        return self._original_coordinates
+
+    @property
+    def original_labels(self) -> CategoricalLabels:
+        return CategoricalLabels(self._original_labels.codes, self._categories)
+
+    @property
+    def added_coordinates(self) -> np.ndarray:
+        """
+        View of the coordinates of the points appended to the store.
+        """
+        if self._coordinates is None:
+            return np.empty((0, 3), dtype=self._original_coordinates.dtype)
+        return self._coordinates[self._size - self.num_added:self._size]
+
+    @property
+    def added_labels(self) -> CategoricalLabels:
+        if self._codes is None:
+            return CategoricalLabels(np.empty(0, dtype=np.uint8),
+                                     self._categories)
+        return CategoricalLabels(
+            self._codes[self._size - self.num_added:self._size],
+            self._categories)
+
+    @property
+    def coordinates(self) -> np.ndarray:
+        """
+        Coordinates of all points, the original ones followed by the new ones.
+        """
+        if self._coordinates is None:
+            return self._original_coordinates
+        if not self.lazy:
+            return self._coordinates[:self._size]
+        return self.materialize()[0]
+
+    @property
+    def labels(self) -> CategoricalLabels:
+        if self._codes is None:
+            return self.original_labels
+        if not self.lazy:
+            return CategoricalLabels(self._codes[:self._size], self._categories)
+        return self.materialize()[1]
+
+    def materialize(self) -> tuple[np.ndarray, CategoricalLabels]:
+        """
+        Contiguous arrays of the coordinates and labels of all points, built only
+        once until the next append.
+        """
+        if self._materialized is None:
+            self._materialized = (
+                np.concatenate(
+                    (self._original_coordinates, self.added_coordinates)),
+                CategoricalLabels(
+                    np.concatenate((self._original_labels.codes,
+                                    self.added_labels.codes)).astype(
+                                        code_dtype(len(self._categories))),
+                    self._categories))
+        return self._materialized
+
+    def append(self, coordinates: np.ndarray, label):
+        """
+        Append points sharing the same label.
+        """
+        coordinates = np.asarray(coordinates).reshape(-1, 3)
+        code = self.original_labels.code(label)
+        if code < 0:
+            self._categories = np.append(self._categories, str(label))
+            code = len(self._categories) - 1
+
+        self._reserve(self._size + len(coordinates), coordinates.dtype)
+        self._coordinates[self._size:self._size + len(coordinates)] = coordinates
+        self._codes[self._size:self._size + len(coordinates)] = code
+        self._size += len(coordinates)
+        self._materialized = None
+
+    def _reserve(self, size: int, dtype: np.dtype):
+        """
+        Make sure the buffers hold at least `size` points of the coordinate type
+        `dtype` and codes for all categories, doubling their capacity when they
+        are reallocated. Coordinates are stored as floating point numbers, so
+        integer original points do not truncate the appended ones.
+        """
+        if self._coordinates is None:
+            # Start the buffers, with the original points unless in the lazy mode
+            if self.lazy:
+                self._coordinates = np.empty(
+                    (0, 3), dtype=self._original_coordinates.dtype)
+                self._codes = np.empty(0, dtype=np.uint8)
+            else:
+                self._coordinates = self._original_coordinates
+                self._codes = self._original_labels.codes
+                self._size = self.num_original
+                size += self.num_original
+            capacity = 0
+        else:
+            capacity = len(self._coordinates)
+
+        new_dtype = np.result_type(self._coordinates.dtype, dtype, np.float32)
+        new_code_dtype = np.promote_types(self._codes.dtype,
+                                          code_dtype(len(self._categories)))
+        if (size <= capacity and new_dtype == self._coordinates.dtype
+                and new_code_dtype == self._codes.dtype):
+            return
+
+        if size > capacity:
+            capacity = max(size, 2 * capacity)
+        coordinates = np.empty((capacity, 3), dtype=new_dtype)
+        coordinates[:self._size] = self._coordinates[:self._size]
+        codes = np.empty(capacity, dtype=new_code_dtype)
+        codes[:self._size] = self._codes[:self._size]
+        self._coordinates, self._codes = coordinates, codes
@@ -0,0 +1,208 @@
+"""
+Streaming query mode: offset points for query points read from a stream, e.g.
+stdin or a growing file, against a fixed reference point cloud.
+
+The index of the reference cloud is built once by the offset calculator. Query
+points are read by a background thread into a bounded queue and processed in
+chunks of at most `chunk_size` points, so the memory stays flat however long the
+stream is. A chunk is processed when it is full, when the stream pauses for
+longer than `max_latency`, or at the end of the stream.
+
+Query lines hold `x y z` or `label x y z`, the label is ignored. Offset points
+are written as `label x y z` lines with the new label.
+"""
+import io
+import queue
+import threading
+import time
+from typing import Iterator, Optional
+
+import numpy as np
+
+from .labels import CategoricalLabels
+from .utils import write_txt_lines
+
+__all__ = ['iter_point_chunks', 'stream_offsets', 'StreamStats']
+
+DEFAULT_STREAM_CHUNK_SIZE = 10_000
+# Number of lines buffered between the reader thread and the processing
+QUEUE_LINES = 2**16
+_END = None
+
+
+def _read_lines(stream: io.TextIOBase, lines: queue.Queue, follow: bool,
+                poll_interval: float, stop: threading.Event):
+
+    def put(item) -> bool:
+        # Give up when the consumer stopped, instead of blocking on a full queue
+        while not stop.is_set():
+            try:
+                lines.put(item, timeout=poll_interval)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    while not stop.is_set():
+        line = stream.readline()
+        if not line:
+            if not follow:
+                break
+            # Wait for the file to grow
+            time.sleep(poll_interval)
+            continue
+        if not put((time.perf_counter(), line)):
+            return
+    put(_END)
+
+
+def _parse_lines(lines: list[str]) -> np.ndarray:
+    """
+    Coordinates of `x y z` or `label x y z` lines.
+    """
+    values = []
+    for line in lines:
+        tokens = line.split("#", 1)[0].split()
+        if len(tokens) == 4:
+            del tokens[0]
+        elif len(tokens) != 3:
+            raise ValueError(
+                f"Expected 3 (x y z) or 4 (label x y z) columns: {line!r}")
+        values += tokens
+    return np.array(values, dtype=np.float64).reshape(-1, 3)
+
+
+def iter_point_chunks(stream: io.TextIOBase,
+                      chunk_size: int = DEFAULT_STREAM_CHUNK_SIZE,
+                      max_latency: Optional[float] = None,
+                      follow: bool = False,
+                      poll_interval: float = 0.1
+                      ) -> Iterator[tuple[np.ndarray, float]]:
+    """
+    Read query points from a text stream in chunks.
+
+    :param stream: Text stream of `x y z` or `label x y z` lines.
+    :param chunk_size: Maximum number of points per chunk.
+    :param max_latency: Maximum time in seconds a read point waits for its chunk
+                        to fill up, chunks are only cut by size if not provided.
+    :param follow: Keep reading at the end of the stream, waiting for a growing
+                   file to be appended to, until interrupted.
+    :param poll_interval: Time in seconds between reads at the end of a followed file.
+
+    :return: Iterator of (coordinates of shape (M, 3), arrival time of the first
+             point of the chunk as `time.perf_counter()`).
+    """
+    lines = queue.Queue(maxsize=QUEUE_LINES)
+    stop = threading.Event()
+    reader = threading.Thread(target=_read_lines,
+                              args=(stream, lines, follow, poll_interval, stop),
+                              daemon=True)
+    reader.start()
+
+    chunk, first_arrival, done = [], None, False
+    try:
+        while not done:
+            timeout = None
+            if chunk and max_latency is not None:
+                timeout = max(first_arrival + max_latency - time.perf_counter(),
+                              0)
+            try:
+                item = lines.get(timeout=timeout)
+            except queue.Empty:
+                item = False
+            if item is _END:
+                done = True
+            elif item:
+                arrival, line = item
+                if not line.strip() or line.lstrip().startswith("#"):
+                    continue
+                if not chunk:
+                    first_arrival = arrival
+                chunk.append(line)
+                if len(chunk) < chunk_size:
+                    continue
+            if chunk:
+                yield _parse_lines(chunk), first_arrival
+                chunk = []
+    finally:
+        stop.set()
+
+
+class StreamStats:
+    """
+    Throughput and per-chunk latency of a stream.
+
+    :ivar num_chunks: Number of processed chunks.
+    :ivar num_points: Number of processed query points.
+    :ivar elapsed: Time in seconds from the start of the stream to the last chunk.
+    :ivar latencies: Time in seconds from the arrival of the first point of each
+                     chunk to the write of its offset points.
+    """
+
+    def __init__(self):
+        self.num_chunks = 0
+        self.num_points = 0
+        self.elapsed = 0.
+        self.latencies = []
+        self._start = time.perf_counter()
+
+    def add_chunk(self, num_points: int, arrival: float):
+        now = time.perf_counter()
+        self.num_chunks += 1
+        self.num_points += num_points
+        self.latencies.append(now - arrival)
+        self.elapsed = now - self._start
+
+    def summary(self) -> dict:
+        latencies = np.array(self.latencies or [np.nan])
+        return {
+            'num_chunks': self.num_chunks,
+            'num_points': self.num_points,
+            'elapsed': self.elapsed,
+            'throughput': self.num_points / self.elapsed if self.elapsed else 0.,
+            'latency_p50': float(np.percentile(latencies, 50)),
+            'latency_p95': float(np.percentile(latencies, 95)),
+            'latency_max': float(np.max(latencies)),
+        }
+
+
+def stream_offsets(offsetter,
+                   input_stream: io.TextIOBase,
+                   output_stream: io.TextIOBase,
+                   chunk_size: int = DEFAULT_STREAM_CHUNK_SIZE,
+                   max_latency: Optional[float] = None,
+                   follow: bool = False,
+                   precision: Optional[int] = None,
+                   stats: Optional[StreamStats] = None,
+                   **kwargs) -> StreamStats:
+    """
+    Write the offset points of the query points of a stream, chunk by chunk.
+
+    :param offsetter: `OffsetsInterface` instance of the reference point cloud.
+    :param input_stream: Text stream of query points.
+    :param output_stream: Text stream the offset points are written and flushed
+                          to after each chunk, labeled `offsetter.new_data_label`.
+    :param chunk_size: Maximum number of query points per chunk.
+    :param max_latency: See `iter_point_chunks`.
+    :param follow: See `iter_point_chunks`.
+    :param precision: Number of decimals of the written coordinates, see
+                      `save_to_txt`.
+    :param stats: Statistics updated after each chunk, e.g. to report them when
+                  a followed stream is interrupted.
+    :param kwargs: Method-specific keyword arguments, as for `get_offset_vecs`.
+
+    :return: Throughput and latency statistics.
+    """
+    # Build the index of the reference cloud before the first chunk arrives
+    offsetter.get_query_state(**kwargs)
+
+    stats = StreamStats() if stats is None else stats
+    for points, arrival in iter_point_chunks(input_stream, chunk_size,
+                                             max_latency, follow):
+        new_points = points + offsetter.query_offset_vecs(points, **kwargs)
+        labels = CategoricalLabels(np.zeros(len(points), dtype=np.uint8),
+                                   [offsetter.new_data_label])
+        write_txt_lines(output_stream, new_points, labels, precision)
+        output_stream.flush()
+        stats.add_chunk(len(points), arrival)
+    return stats
@@ -0,0 +1,336 @@
+"""
+Out-of-core K-D Tree offsets for point clouds larger than memory.
+
+The bounding box of the point cloud is split into tiles whose points are
+bucketed into temporary files in streaming passes, tiles in dense regions are
+split until they hold at most half of the tile budget. Each tile with
+selected points is then loaded together with a halo of the surrounding points,
+and the offsets of its selected points are computed on a K-D Tree of this
+region only. A result is accepted when the distance to the farthest of the k
+nearest neighbors is smaller than the distance of the point to the boundary of
+the loaded region, so no point outside the region can be a nearer neighbor.
+The remaining points are recomputed with a doubled halo. The offsets are
+therefore identical to those computed on the whole point cloud, up to the
+ordering of neighbors at exactly the same distance.
+"""
+import logging
+import tempfile
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+
+from .kernels import float_dtype, knn_offset_vecs
+from .neighbors import build_neighbor_index
+from .profiling import stage
+
+__all__ = ['tiled_knn_offset_vecs']
+
+logger = logging.getLogger(__name__)
+
+# Default maximum number of points loaded at once, tile plus halo
+DEFAULT_TILE_BUDGET = 2_000_000
+# Number of rows of the input streamed at once while bucketing points into tiles
+STREAM_CHUNK_ROWS = 1_000_000
+# Maximum number of times a tile is split into octants, limits the recursion
+# for clusters of identical points
+MAX_SPLIT_DEPTH = 20
+
+
+class TileSet:
+    """
+    Boxes ("tiles") covering the bounding box of a point cloud, with the points
+    of each tile stored in temporary files. The bounding box is first split into a
+    regular grid, tiles holding more than `points_per_tile` points are then split
+    into octants until they fit, so dense regions get smaller tiles.
+
+    :ivar lower: Lower corner of the bounding box.
+    :ivar upper: Upper corner of the bounding box.
+    :ivar tile_lowers: Lower corners of the tiles, shape (T, 3).
+    :ivar tile_uppers: Upper corners of the tiles, shape (T, 3).
+    :ivar counts: Number of points in each tile.
+    :ivar dtype: Floating point type of the stored coordinates.
+    """
+
+    def __init__(self, all_coordinates: np.ndarray, points_per_tile: int,
+                 directory: str):
+        self.directory = Path(directory)
+        self.points_per_tile = points_per_tile
+        self.dtype = float_dtype(all_coordinates)
+        self.lower, self.upper = self._bounds(all_coordinates)
+        self.tile_lowers, self.tile_uppers, self.counts = [], [], []
+
+        extent = self.upper - self.lower
+        num_tiles = max(1, int(np.ceil(len(all_coordinates) / points_per_tile)))
+        # Cubic tiles, collapsed axes (zero extent) get a single layer of tiles
+        active = extent > 0
+        volume = np.prod(extent[active]) if active.any() else 1.
+        tile_size = (volume / num_tiles)**(1 / max(active.sum(), 1))
+        shape = np.maximum(np.ceil(extent / tile_size), 1).astype(int)
+
+        tile_ids = self._split(self.lower, np.full(3, tile_size), shape,
+                               self._stream(all_coordinates))
+        for _ in range(MAX_SPLIT_DEPTH):
+            overfull = [i for i in tile_ids if self.counts[i] > points_per_tile]
+            if not overfull:
+                break
+            tile_ids = []
+            for tile_id in overfull:
+                tile_ids += self._split_tile(tile_id)
+
+        self.tile_lowers = np.array(self.tile_lowers)
+        self.tile_uppers = np.array(self.tile_uppers)
+        self.counts = np.array(self.counts)
+
+    @staticmethod
+    def _bounds(all_coordinates: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        lower = np.full(3, np.inf)
+        upper = np.full(3, -np.inf)
+        for start in range(0, len(all_coordinates), STREAM_CHUNK_ROWS):
+            chunk = all_coordinates[start:start + STREAM_CHUNK_ROWS]
+            lower = np.minimum(lower, chunk.min(axis=0))
+            upper = np.maximum(upper, chunk.max(axis=0))
+        return lower, upper
+
+    def _stream(self, all_coordinates: np.ndarray, indices: np.ndarray = None):
+        """
+        Yield chunks of coordinates and their global indices.
+        """
+        for start in range(0, len(all_coordinates), STREAM_CHUNK_ROWS):
+            chunk = np.asarray(all_coordinates[start:start + STREAM_CHUNK_ROWS],
+                               dtype=self.dtype)
+            if indices is None:
+                chunk_indices = np.arange(start, start + len(chunk))
+            else:
+                chunk_indices = np.asarray(indices[start:start + len(chunk)])
+            yield chunk, chunk_indices
+
+    def _paths(self, tile_id: int) -> tuple[Path, Path]:
+        return (self.directory / f"{tile_id}.xyz",
+                self.directory / f"{tile_id}.idx")
+
+    def _split(self, lower: np.ndarray, size: np.ndarray, shape: np.ndarray,
+               chunks) -> list[int]:
+        """
+        Create a regular grid of new tiles and append the streamed points to the
+        files of their tiles.
+
+        :return: Ids of the new tiles.
+        """
+        first_id = len(self.counts)
+        for cell in np.ndindex(*shape):
+            self.tile_lowers.append(lower + np.array(cell) * size)
+            self.tile_uppers.append(lower + (np.array(cell) + 1) * size)
+            self.counts.append(0)
+
+        for chunk, chunk_indices in chunks:
+            cells = np.clip(np.floor((chunk - lower) / size).astype(int), 0,
+                            shape - 1)
+            tile_ids = first_id + np.ravel_multi_index(cells.T, shape)
+            order = np.argsort(tile_ids, kind="stable")
+            unique_ids, first, counts = np.unique(tile_ids[order],
+                                                  return_index=True,
+                                                  return_counts=True)
+            for tile_id, begin, count in zip(unique_ids, first, counts):
+                rows = order[begin:begin + count]
+                coords_path, indices_path = self._paths(tile_id)
+                with open(coords_path, "ab") as fhandle:
+                    chunk[rows].tofile(fhandle)
+                with open(indices_path, "ab") as fhandle:
+                    chunk_indices[rows].astype(np.int64).tofile(fhandle)
+                self.counts[tile_id] += count
+
+        return list(range(first_id, len(self.counts)))
+
+    def _split_tile(self, tile_id: int) -> list[int]:
+        """
+        Split a tile into octants (quadrants for collapsed axes) and move its
+        points to the new tiles.
+        """
+        coords_path, indices_path = self._paths(tile_id)
+        coordinates = np.memmap(coords_path, dtype=self.dtype,
+                                mode="r").reshape(-1, 3)
+        indices = np.memmap(indices_path, dtype=np.int64, mode="r")
+
+        lower, upper = self.tile_lowers[tile_id], self.tile_uppers[tile_id]
+        shape = np.where(upper > lower, 2, 1)
+        tile_ids = self._split(lower, (upper - lower) / shape, shape,
+                               self._stream(coordinates, indices))
+
+        del coordinates, indices
+        coords_path.unlink()
+        indices_path.unlink()
+        self.counts[tile_id] = 0
+        return tile_ids
+
+    def load_tile(self, tile_id: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Coordinates and global indices of the points of a tile.
+        """
+        if self.counts[tile_id] == 0:
+            return np.empty((0, 3), dtype=self.dtype), np.empty(0, dtype=np.int64)
+        coords_path, indices_path = self._paths(tile_id)
+        return (np.fromfile(coords_path, dtype=self.dtype).reshape(-1, 3),
+                np.fromfile(indices_path, dtype=np.int64))
+
+    def load_region(self, lower: np.ndarray, upper: np.ndarray) -> np.ndarray:
+        """
+        Coordinates of all points inside the box [lower, upper].
+        """
+        overlapping = np.all((self.tile_lowers <= upper) &
+                             (self.tile_uppers >= lower),
+                             axis=1) & (self.counts > 0)
+        regions = [np.empty((0, 3), dtype=self.dtype)]
+        for tile_id in np.flatnonzero(overlapping):
+            coordinates, _ = self.load_tile(tile_id)
+            inside = np.all((coordinates >= lower) & (coordinates <= upper),
+                            axis=1)
+            regions.append(coordinates[inside])
+        return np.concatenate(regions)
+
+
+def halo_knn_offset_vecs(load_region: Callable[[np.ndarray, np.ndarray],
+                                               np.ndarray],
+                         cloud_lower: np.ndarray,
+                         cloud_upper: np.ndarray,
+                         box_lower: np.ndarray,
+                         box_upper: np.ndarray,
+                         points: np.ndarray,
+                         num_neighbors: int,
+                         offset_magnitude: float,
+                         halo: float,
+                         workers: int = 1,
+                         kernel: Callable = knn_offset_vecs,
+                         backend: str = 'kdtree'
+                         ) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Compute the K-D Tree offset vectors of points inside a box from the points of
+    the box plus a halo only. The halo is doubled for the points whose k nearest
+    neighbors in the region are not guaranteed to be the nearest in the whole
+    point cloud.
+
+    :param load_region: Function returning the coordinates of all points of the
+                        point cloud inside a box given by its lower and upper corners.
+    :param cloud_lower: Lower corner of the bounding box of the point cloud.
+    :param cloud_upper: Upper corner of the bounding box of the point cloud.
+    :param box_lower: Lower corner of the box containing the points.
+    :param box_upper: Upper corner of the box containing the points.
+    :param points: Numpy array of shape (M, 3) with the points to offset.
+    :param num_neighbors: The number of nearest neighbors of each point.
+    :param offset_magnitude: Magnitude of the offset vectors.
+    :param halo: Initial width of the halo.
+    :param workers: Number of threads used by the K-D Tree queries.
+    :param kernel: Function computing the offset vectors from a K-D Tree, with the
+                   signature and return value of `knn_offset_vecs`.
+    :param backend: Neighbor search backend of the regions, see
+                    `point_utils.neighbors`.
+
+    :return: Tuple of the (M, 3) offset vectors and the boolean mask of the points
+             with zero mean displacement.
+    """
+    offset_vectors = np.empty((len(points), 3), dtype=float_dtype(points))
+    zero_norm = np.zeros(len(points), dtype=bool)
+    pending = np.arange(len(points))
+    while len(pending):
+        lower, upper = box_lower - halo, box_upper + halo
+        halo *= 2
+        region = load_region(lower, upper)
+        logger.debug(f"Loaded a region of {len(region)} points.")
+
+        covers_all = np.all(lower <= cloud_lower) and np.all(
+            upper >= cloud_upper)
+        if len(region) < num_neighbors and not covers_all:
+            continue
+
+        with stage('index_build', len(region)):
+            tree = build_neighbor_index(backend, region)
+        with stage('query', len(pending)):
+            vectors, region_zero_norm, max_distances = kernel(
+                tree, region, points[pending], num_neighbors,
+                offset_magnitude, workers)
+
+        # Distance to the region boundary, ignoring faces outside the point cloud
+        margins = np.minimum(
+            np.where(lower > cloud_lower, points[pending] - lower, np.inf),
+            np.where(upper < cloud_upper, upper - points[pending],
+                     np.inf)).min(axis=1)
+        exact = max_distances < margins
+
+        offset_vectors[pending[exact]] = vectors[exact]
+        zero_norm[pending[exact]] = region_zero_norm[exact]
+        pending = pending[~exact]
+
+    return offset_vectors, zero_norm
+
+
+def tiled_knn_offset_vecs(
+        all_coordinates: np.ndarray,
+        point_indices: np.ndarray,
+        num_neighbors: int,
+        offset_magnitude: float,
+        tile_budget: int = DEFAULT_TILE_BUDGET,
+        out: Optional[np.ndarray] = None,
+        workers: int = 1,
+        tmp_dir: Optional[str] = None,
+        kernel: Callable = knn_offset_vecs,
+        backend: str = 'kdtree') -> tuple[np.ndarray, np.ndarray]:
+    """
+    Compute the K-D Tree offset vectors of the selected points tile by tile, see
+    `KDTreeOffsets.get_offset_vecs` for the method.
+
+    :param all_coordinates: Array of shape (N, 3), typically memory-mapped, it is
+                            only read in chunks.
+    :param point_indices: Sorted indices of the points to offset.
+    :param num_neighbors: The number of nearest neighbors of each point.
+    :param offset_magnitude: Magnitude of the offset vectors.
+    :param tile_budget: Targeted maximum number of points loaded at once, a tile
+                        holds about half of it to leave room for its halo.
+    :param out: Optional array of shape (len(point_indices), 3), e.g. created with
+                `np.lib.format.open_memmap`, the results are written to it tile by tile.
+    :param workers: Number of threads used by the K-D Tree queries.
+    :param tmp_dir: Directory for the temporary tile files.
+    :param kernel: See `halo_knn_offset_vecs`.
+    :param backend: See `halo_knn_offset_vecs`.
+
+    :return: Tuple of the offset vectors and the indices of the points with zero
+             mean displacement.
+    """
+    if out is None:
+        out = np.empty((len(point_indices), 3),
+                       dtype=float_dtype(all_coordinates))
+    if len(all_coordinates) < num_neighbors:
+        raise ValueError(
+            f"The point cloud has fewer than {num_neighbors} points.")
+
+    points_per_tile = max(num_neighbors, tile_budget // 2)
+    zero_norm_indices = []
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as directory:
+        tiles = TileSet(all_coordinates, points_per_tile, directory)
+
+        for tile_id in np.flatnonzero(tiles.counts):
+            coordinates, indices = tiles.load_tile(tile_id)
+            # Positions of the selected points of this tile in point_indices
+            positions = np.searchsorted(point_indices, indices)
+            selected = positions < len(point_indices)
+            selected[selected] = point_indices[positions[selected]] == indices[
+                selected]
+            if not selected.any():
+                continue
+            points, positions = coordinates[selected], positions[selected]
+
+            tile_lower = tiles.tile_lowers[tile_id]
+            tile_upper = tiles.tile_uppers[tile_id]
+            # Initial halo width holding about num_neighbors points at the tile density
+            volume = np.prod(np.maximum(tile_upper - tile_lower, 1e-12))
+            halo = (num_neighbors * volume / len(coordinates))**(1 / 3)
+
+            vectors, zero_norm = halo_knn_offset_vecs(
+                tiles.load_region, tiles.lower, tiles.upper, tile_lower,
+                tile_upper, points, num_neighbors, offset_magnitude, halo,
+                workers, kernel, backend)
+            out[positions] = vectors
+            zero_norm_indices.append(point_indices[positions[zero_norm]])
+
+    zero_norm_indices = np.sort(
+        np.concatenate(zero_norm_indices or [[]]).astype(int))
+    return out, zero_norm_indices
@@ -1,73 +1,516 @@
 """
 Utility functions/class for:
     - loading and validating configuration settings.
-    - read and write text data.
+    - read and write text data and binary point cloud containers.
     - visualize 3D data points with labels.
 """
+import gzip
+import io
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Callable, Optional
 import numpy as np
-import matplotlib.pyplot as plt
+
+from .labels import CategoricalLabels, as_categorical, code_dtype
+from .profiling import stage
+
+logger = logging.getLogger(__name__)
 
 DEFAULT_OUT_TXT = "output.txt"
+# Suffix of the binary point cloud container (a directory)
+BINARY_SUFFIX = ".pcb"
+BINARY_FORMAT_VERSION = 1
+# Number of bytes parsed at once when reading text files
+DEFAULT_READ_CHUNK_BYTES = 2**22
+# Minimum number of seconds between two progress log lines when reading
+PROGRESS_LOG_SECONDS = 2.0
+# Number of rows formatted at once when writing text files
+DEFAULT_WRITE_CHUNK_ROWS = 2**16
+# Buffer size of text files
+TEXT_BUFFER_BYTES = 2**22
+# Suffixes of compressed text files
+COMPRESSION_SUFFIXES = (".gz", ".zst")
+GZIP_COMPRESS_LEVEL = 6
 
 DEFAULT_FIG_NAME = "output.png"
 DEFAULT_FIG_TITLE = "3D Point Distribution"
+DOWNSAMPLE_METHODS = ("voxel", "random")
+# Maximum number of voxel size increases when downsampling for plots
+MAX_VOXEL_ROUNDS = 20
+
+# matplotlib.pyplot, imported by the first plot shown in a window
+plt = None
+
+
+# Bytes separating tokens in `str.split`, for counting the tokens of each line
+_WHITESPACE_BYTES = np.zeros(256, dtype=bool)
+_WHITESPACE_BYTES[[9, 10, 11, 12, 13, 28, 29, 30, 31, 32]] = True
+
+
+def _pyplot():
+    global plt
+    if plt is None:
+        import matplotlib.pyplot
+        plt = matplotlib.pyplot
+    return plt
+
+
+def open_text(filename: str, mode: str = "r") -> io.TextIOBase:
+    """
+    Open a text file for reading ('r'), writing ('w') or appending ('a'),
+    compressed with gzip or zstandard if the file name ends with '.gz' or '.zst'.
+    Appending to a compressed file adds a new gzip member or zstandard frame.
+    The zstandard format requires the optional `zstandard` package.
+    """
+    suffix = Path(filename).suffix
+    if suffix == ".gz":
+        return gzip.open(filename,
+                         mode + "t",
+                         compresslevel=GZIP_COMPRESS_LEVEL,
+                         encoding="utf-8")
+    if suffix == ".zst":
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError(
+                "The zstandard package is required for '.zst' files, "
+                "install it with `pip install zstandard`.")
+        raw = open(filename, mode + "b")
+        if mode == "r":
+            stream = zstandard.ZstdDecompressor().stream_reader(
+                raw, read_across_frames=True, closefd=True)
+        else:
+            stream = zstandard.ZstdCompressor().stream_writer(raw,
+                                                              closefd=True)
+        return io.TextIOWrapper(io.BufferedReader(stream) if mode == "r" else
+                                io.BufferedWriter(stream, TEXT_BUFFER_BYTES),
+                                encoding="utf-8")
+    return open(filename, mode, encoding="utf-8", buffering=TEXT_BUFFER_BYTES)
+
+
+class ProgressLog:
+    """
+    Progress callback of `get_data_from_txt` logging the number of lines and
+    characters read at INFO level, at most once every `interval` seconds.
+
+    :ivar filename: Name of the file read, included in the log lines.
+    :ivar interval: Minimum number of seconds between two log lines.
+    """
+
+    def __init__(self, filename: str, interval: float = PROGRESS_LOG_SECONDS):
+        self.filename = filename
+        self.interval = interval
+        self._last_time = time.perf_counter()
+
+    def __call__(self, num_lines: int, num_chars: int):
+        now = time.perf_counter()
+        if now - self._last_time >= self.interval:
+            self._last_time = now
+            logger.info(f"Reading {self.filename}: {num_lines} lines, "
+                        f"{num_chars / 2**20:.1f} MiB")
+
+
+def _line_token_counts(text: str) -> np.ndarray:
+    """
+    Number of whitespace separated tokens on each line of `text`, counted on the
+    UTF-8 bytes. Whitespace outside ASCII is not recognized, so a count can be
+    lower than that of `str.split` but never higher.
+    """
+    data = np.frombuffer(text.encode(), dtype=np.uint8)
+    space = _WHITESPACE_BYTES[data]
+    # A token starts at a non-whitespace byte following whitespace
+    token_starts = np.empty(len(data), dtype=bool)
+    token_starts[:1] = ~space[:1]
+    np.less(space[1:], space[:-1], out=token_starts[1:])
+    line_starts = np.flatnonzero(data == ord("\n")) + 1
+    line_starts = np.concatenate(([0], line_starts[line_starts < len(data)]))
+    return np.add.reduceat(token_starts.view(np.uint8),
+                           line_starts,
+                           dtype=np.intp)
+
+
+def get_data_from_txt(
+    filename: str,
+    chunk_size: int = DEFAULT_READ_CHUNK_BYTES,
+    progress: Optional[Callable[[int, int], None]] = None,
+    dtype: np.dtype = np.float64
+) -> tuple[np.ndarray, CategoricalLabels]:
+    """
+    Read data from a text file and return the cartesian coordinates and
+    categorical labels as a tuple.
+
+    Each line holds a label and three coordinates separated by whitespace. The
+    file is parsed in blocks of about `chunk_size` bytes directly into an array
+    of shape (N, 3) and an array of label codes. Both grow geometrically, in place
+    where the allocator allows, and are trimmed to the lines read at the end.
+    Lines without exactly 4 columns, besides empty and comment lines, raise a
+    `ValueError` naming the line.
+
+    :param filename: Path to the text file, optionally compressed ('.gz', '.zst').
+    :param chunk_size: Approximate number of bytes parsed per block.
+    :param progress: Optional callback called after each block with the number of
+                     lines and characters read so far, see `ProgressLog`.
+    :param dtype: Floating point type of the coordinates, e.g. float32 for
+                  point clouds of limited precision, at half the memory.
+    """
+    try:
+        all_coordinates = np.empty((0, 3), dtype=dtype)
+        codes = np.empty(0, dtype=np.uint8)
+        category_codes = {}
+        num_rows = 0
+        num_lines_read = 0
+        num_chars_read = 0
+        with open_text(filename) as fhandle:
+            while lines := fhandle.readlines(chunk_size):
+                text = "".join(lines)
+                num_chars_read += len(text)
+                if "#" in text:
+                    lines = [
+                        line.split("#", 1)[0] + "\n" if "#" in line else line
+                        for line in lines
+                    ]
+                    text = "".join(lines)
+                tokens = text.split()
+                # The text is split once, the columns of each line are counted
+                # on its bytes and checked against the tokens
+                num_tokens = _line_token_counts(text)
+                if num_tokens.sum() != len(tokens):
+                    # Whitespace outside ASCII, count on the lines instead
+                    num_tokens = np.fromiter(map(len, map(str.split, lines)),
+                                             dtype=np.intp,
+                                             count=len(lines))
+                invalid = np.flatnonzero((num_tokens != 4) & (num_tokens != 0))
+                if len(invalid):
+                    raise ValueError(
+                        "Expected 4 columns (label x y z) in line "
+                        f"{num_lines_read + invalid[0] + 1}: "
+                        f"{lines[invalid[0]].strip()!r}")
+                num_lines_read += len(lines)
+                chunk_categories, chunk_codes = np.unique(tokens[0::4],
+                                                          return_inverse=True)
+                del tokens[0::4]
+
+                # Map the categories of the block to the codes of the file
+                chunk_categories = np.array([
+                    category_codes.setdefault(category, len(category_codes))
+                    for category in chunk_categories.tolist()
+                ])
+                if len(category_codes) > np.iinfo(codes.dtype).max + 1:
+                    codes = codes.astype(code_dtype(len(category_codes)))
+
+                num_new_rows = len(tokens) // 3
+                if num_rows + num_new_rows > len(codes):
+                    # Grow the buffers geometrically, in place where possible
+                    capacity = max(num_rows + num_new_rows, 2 * len(codes))
+                    all_coordinates.resize((capacity, 3), refcheck=False)
+                    codes.resize(capacity, refcheck=False)
+                codes[num_rows:num_rows + num_new_rows] = chunk_categories[
+                    chunk_codes.ravel()]
+                all_coordinates[num_rows:num_rows + num_new_rows] = np.array(
+                    tokens, dtype=np.float64).reshape(-1, 3)
+                num_rows += num_new_rows
+                if progress is not None:
+                    progress(num_lines_read, num_chars_read)
+    except Exception as e:
+        raise ValueError(f"Error reading data from file: {e}")
+
+    all_coordinates.resize((num_rows, 3), refcheck=False)
+    codes.resize(num_rows, refcheck=False)
+    return all_coordinates, CategoricalLabels(codes, list(category_codes))
+
+
+def save_to_txt(filename: str,
+                all_coordinates: np.ndarray,
+                labels,
+                precision: Optional[int] = None,
+                append: bool = False,
+                chunk_size: int = DEFAULT_WRITE_CHUNK_ROWS):
+    """
+    Save the cartesian coordinates and labels to a text file, one `label x y z`
+    line per point.
+
+    The lines are formatted in blocks of `chunk_size` points and streamed to the
+    file through a large buffer, so only one block is held as text in memory.
 
+    :param filename: Path to the text file, compressed with gzip or zstandard if
+                     it ends with '.gz' or '.zst'.
+    :param all_coordinates: Numpy array of shape (N, 3).
+    :param labels: Labels of the points.
+    :param precision: Number of decimals of the coordinates. By default the
+                      shortest representation which reads back to the same
+                      float is written, in the precision of the coordinates.
+    :param append: Append the points to the end of an existing file, e.g. only the
+                   new offset points to a copy of the original point cloud.
+    :param chunk_size: Number of points formatted per block.
+    """
+    with open_text(filename, "a" if append else "w") as fhandle:
+        write_txt_lines(fhandle, all_coordinates, labels, precision,
+                        chunk_size)
+
+
+def write_txt_lines(fhandle: io.TextIOBase,
+                    all_coordinates: np.ndarray,
+                    labels,
+                    precision: Optional[int] = None,
+                    chunk_size: int = DEFAULT_WRITE_CHUNK_ROWS):
+    """
+    Write `label x y z` lines of points to an open text file, see `save_to_txt`.
+    """
+    labels = as_categorical(labels)
+    categories = np.array(labels.categories.tolist(), dtype=object)
+    # Shortest representations of float32 coordinates, which %r would print
+    # with the digits of their float64 conversion
+    shortest_float32 = precision is None and np.asarray(
+        all_coordinates[:1]).dtype == np.float32
+    if precision is not None:
+        float_format = f"%.{precision}f"
+    else:
+        float_format = "%s" if shortest_float32 else "%r"
+    line_format = f"%s {float_format} {float_format} {float_format}\n"
 
-def get_data_from_txt(filename: str) -> tuple[np.ndarray, list[str]]:
+    for start in range(0, len(all_coordinates), chunk_size):
+        block = np.asarray(all_coordinates[start:start + chunk_size])
+        # Interleave the labels and coordinates for one format operation
+        values = [None] * (4 * len(block))
+        values[0::4] = categories[labels.codes[start:start +
+                                               chunk_size]].tolist()
+        for axis in range(3):
+            column = block[:, axis]
+            values[axis + 1::4] = (column.astype(str) if shortest_float32 else
+                                   column).tolist()
+        fhandle.write((line_format * len(block)) % tuple(values))
+
+
+def save_to_binary(dirname: str, all_coordinates: np.ndarray, labels):
     """
-    Read data from a text file and return the cartesian coordinates and labels
-    as a tuple.
+    Save the cartesian coordinates and labels to a binary point cloud container.
+
+    The container is a directory holding the coordinates as `coordinates.npy`,
+    the labels as integer codes into the label categories in `label_codes.npy`
+    and a small JSON header `metadata.json`.
     """
+    path = Path(dirname)
+    path.mkdir(parents=True, exist_ok=True)
+
+    labels = as_categorical(labels)
+    categories = labels.categories
+    np.save(path / "coordinates.npy", np.ascontiguousarray(all_coordinates))
+    np.save(path / "label_codes.npy",
+            labels.codes.astype(code_dtype(len(categories)), copy=False))
+
+    metadata = {
+        "version": BINARY_FORMAT_VERSION,
+        "num_points": len(all_coordinates),
+        "dtype": str(np.asarray(all_coordinates).dtype),
+        "categories": categories.tolist(),
+    }
+    (path / "metadata.json").write_text(json.dumps(metadata, indent=2))
+
+
+def get_data_from_binary(
+        dirname: str,
+        mmap: bool = True,
+        dtype: Optional[np.dtype] = None) -> tuple[np.ndarray, CategoricalLabels]:
+    """
+    Read a binary point cloud container and return the cartesian coordinates
+    and categorical labels as a tuple. With `mmap`, the coordinates and label
+    codes are read-only memory-mapped views of the files and are not copied
+    into memory, unless the coordinates are converted to another `dtype`.
+    """
+    path = Path(dirname)
     try:
-        data = np.genfromtxt(filename, dtype=None, encoding="utf-8", delimiter=" ")
-        data = np.column_stack([data['f0'], data['f1'], data['f2'], data['f3']])
-        labels = data[:, 0]
-        all_coordinates = data[:, 1:].astype(float)
+        metadata = json.loads((path / "metadata.json").read_text())
+        if metadata["version"] > BINARY_FORMAT_VERSION:
+            raise ValueError(
+                f"unsupported format version {metadata['version']}.")
+        mmap_mode = "r" if mmap else None
+        all_coordinates = np.load(path / "coordinates.npy", mmap_mode=mmap_mode)
+        codes = np.load(path / "label_codes.npy", mmap_mode=mmap_mode)
     except Exception as e:
         raise ValueError(f"Error reading data from file: {e}")
 
+    if len(all_coordinates) != metadata["num_points"] or len(codes) != len(
+            all_coordinates):
+        raise ValueError(
+            f"Error reading data from file: corrupted point cloud {dirname}.")
+
+    if dtype is not None and all_coordinates.dtype != dtype:
+        all_coordinates = all_coordinates.astype(dtype)
+    labels = CategoricalLabels(codes, metadata["categories"])
+    return all_coordinates, labels
+
+
+def is_binary_file(filename: str) -> bool:
+    """
+    Whether the file name refers to a binary point cloud container.
+    """
+    return Path(filename).suffix == BINARY_SUFFIX
+
+
+def load_point_cloud(filename: str,
+                     **kwargs) -> tuple[np.ndarray, CategoricalLabels]:
+    """
+    Read a point cloud in the format given by the file suffix, '.pcb' for the
+    binary container and text for anything else. The progress of reading a text
+    file is logged by a `ProgressLog` unless another `progress` callback is
+    passed.
+    """
+    with stage('load') as load_stage:
+        if is_binary_file(filename):
+            all_coordinates, labels = get_data_from_binary(filename, **kwargs)
+        else:
+            kwargs.setdefault('progress', ProgressLog(filename))
+            all_coordinates, labels = get_data_from_txt(filename, **kwargs)
+        load_stage.num_points = len(all_coordinates)
+    logger.info(f"Read {len(all_coordinates)} points from {filename}")
     return all_coordinates, labels
 
 
-def save_to_txt(filename: str, all_coordinates: np.ndarray, labels: list[str]):
+def save_point_cloud(filename: str,
+                     all_coordinates: np.ndarray,
+                     labels,
+                     precision: Optional[int] = None,
+                     append: bool = False):
     """
-    Save the cartesian coordinates and labels to a text file.
+    Save a point cloud in the format given by the file suffix, '.pcb' for the
+    binary container and text for anything else. `precision` and `append` apply
+    to text files only, see `save_to_txt`.
     """
-    data = np.column_stack([labels, all_coordinates])
-    np.savetxt(filename, data, fmt='%s', delimiter=' ')
+    with stage('save', len(all_coordinates)):
+        if is_binary_file(filename):
+            if append:
+                raise ValueError(
+                    "Appending is not supported for binary point clouds.")
+            save_to_binary(filename, all_coordinates, labels)
+        else:
+            save_to_txt(filename,
+                        all_coordinates,
+                        labels,
+                        precision=precision,
+                        append=append)
 
 
-def visualize(input_file: str, output_file: str = DEFAULT_FIG_NAME,
-              fig_title: str = DEFAULT_FIG_TITLE):
-    coordinates, labels = get_data_from_txt(input_file)
+def random_downsample(num_points: int,
+                      max_points: int,
+                      rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """
+    Sorted indices of a random subset of at most `max_points` of the points.
+    """
+    if num_points <= max_points:
+        return np.arange(num_points)
+    rng = np.random.default_rng(0) if rng is None else rng
+    return np.sort(rng.choice(num_points, size=max_points, replace=False))
+
+
+def voxel_downsample(coordinates: np.ndarray,
+                     codes: np.ndarray,
+                     max_points: int,
+                     rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """
+    Sorted indices of at most `max_points` of the points, keeping one point per
+    label in each cell of a voxel grid. Unlike random sampling, sparse regions and
+    rare labels stay visible next to dense regions. The voxel size is grown until
+    the number of occupied voxels fits the budget, remaining excess points are
+    dropped at random.
+
+    :param coordinates: Numpy array of shape (N, 3).
+    :param codes: Integer label codes of the points.
+    :param max_points: Point budget.
+    """
+    if len(coordinates) <= max_points:
+        return np.arange(len(coordinates))
+    lower = coordinates.min(axis=0)
+    extent = np.maximum(coordinates.max(axis=0) - lower, 1e-12)
+    num_codes = int(codes.max()) + 1
+    # Start with voxels holding one point each at a uniform density
+    voxel_size = (np.prod(extent) / max_points)**(1 / 3)
+
+    for _ in range(MAX_VOXEL_ROUNDS):
+        shape = np.floor(extent / voxel_size).astype(np.int64) + 1
+        cells = np.minimum(
+            ((coordinates - lower) / voxel_size).astype(np.int64), shape - 1)
+        keys = ((codes.astype(np.int64) * shape[0] + cells[:, 0]) * shape[1] +
+                cells[:, 1]) * shape[2] + cells[:, 2]
+        _, indices = np.unique(keys, return_index=True)
+        if len(indices) <= max_points:
+            break
+        # The number of occupied voxels scales about with the inverse voxel volume
+        voxel_size *= max((len(indices) / max_points)**(1 / 3), 1.1)
+    del keys, cells
+
+    indices = np.sort(indices)
+    if len(indices) > max_points:
+        indices = indices[random_downsample(len(indices), max_points, rng)]
+    return indices
+
+
+def visualize(input_file: str,
+              output_file: str = DEFAULT_FIG_NAME,
+              fig_title: str = DEFAULT_FIG_TITLE,
+              max_points: Optional[int] = None,
+              downsample: str = "voxel",
+              show: bool = True):
+    """
+    Plot a point cloud file in 3D with one color per label, and save the plot.
+
+    :param input_file: Text or binary ('.pcb') point cloud file.
+    :param output_file: Filename of the figure.
+    :param fig_title: Title of the figure.
+    :param max_points: Maximum number of plotted points, larger point clouds are
+                       downsampled. All points are plotted if not provided.
+    :param downsample: Downsampling method, 'voxel' (one point per voxel and label)
+                       or 'random'.
+    :param show: Show the plot in a window. Otherwise the figure is only rendered
+                 to the file by the Agg backend, without pyplot, e.g. on
+                 headless nodes.
+    """
+    if downsample not in DOWNSAMPLE_METHODS:
+        raise ValueError(f"Downsampling method must be one of "
+                         f"{DOWNSAMPLE_METHODS}, got '{downsample}'.")
 
-    # Map labels to different colors
-    unique_labels = np.unique(labels)
-    color_map = {label: f'C{i}' for i, label in enumerate(unique_labels)}
+    with stage('plot') as plot_stage:
+        coordinates, labels = load_point_cloud(input_file)
+        coordinates = np.asarray(coordinates)
+        labels = as_categorical(labels)
+        plot_stage.num_points = len(coordinates)
 
-    # Create a 3D plot and use add_subplot with projection
-    fig = plt.figure()
-    ax = fig.add_subplot(111, projection='3d')
+        if max_points is not None and len(coordinates) > max_points:
+            if downsample == "voxel":
+                indices = voxel_downsample(coordinates, labels.codes, max_points)
+            else:
+                indices = random_downsample(len(coordinates), max_points)
+            coordinates, labels = coordinates[indices], labels[indices]
 
-    # Plot each point with its corresponding color
-    for label, coord in zip(labels, coordinates):
-        ax.scatter(coord[0],
-                   coord[1],
-                   coord[2],
-                   c=color_map[label],
-                   label=label)
+        # Create a 3D plot and use add_subplot with projection
+        if show:
+            fig = _pyplot().figure()
+        else:
+            from matplotlib.figure import Figure
+            fig = Figure()
+        ax = fig.add_subplot(111, projection='3d')
 
-    # Add labels and title
-    ax.set_xlabel('X')
-    ax.set_ylabel('Y')
-    ax.set_zlabel('Z')
-    plt.title(fig_title)
+        # One scatter per label, colored in the alphabetical order of the labels
+        for color, code in enumerate(np.argsort(labels.categories)):
+            points = coordinates[labels.codes == code]
+            if len(points):
+                ax.scatter(points[:, 0],
+                           points[:, 1],
+                           points[:, 2],
+                           c=f'C{color}',
+                           label=labels.categories[code])
 
-    # Show the legend
-    handles, labels = plt.gca().get_legend_handles_labels()
-    by_label = dict(zip(labels, handles))
-    plt.legend(by_label.values(), by_label.keys())
+        # Add labels, title and legend
+        ax.set_xlabel('X')
+        ax.set_ylabel('Y')
+        ax.set_zlabel('Z')
+        ax.set_title(fig_title)
+        ax.legend()
 
-    plt.savefig(output_file)
-    plt.show()
-    print(f'Saved plot to {output_file}.')
\ No newline at end of file
+        if show:
+            plt.savefig(output_file)
+            plt.show()
+        else:
+            fig.savefig(output_file)
+    print(f'Saved plot to {output_file}.')
@@ -0,0 +1,31 @@
+"""
+Script to convert point clouds between the text format ("label x y z" lines)
+and the binary point cloud container (a '.pcb' directory). The formats are
+chosen from the file suffixes.
+
+Usage:
+    python convert.py <input_file> <output_file>
+"""
+import argparse
+from point_utils.utils import load_point_cloud, save_point_cloud
+
+
+def parse_args(cmd=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(usage=__doc__)
+
+    parser.add_argument("input_file",
+                        help="Point cloud to convert, text or binary ('.pcb').")
+    parser.add_argument("output_file",
+                        help="Converted point cloud, text or binary ('.pcb').")
+    return parser.parse_args(cmd)
+
+
+def main(cmd=None):
+    args = parse_args(cmd)
+    all_coordinates, labels = load_point_cloud(args.input_file)
+    save_point_cloud(args.output_file, all_coordinates, labels)
+    print(f'Converted {len(labels)} points to {args.output_file}.')
+
+
+if __name__ == "__main__":
+    main()
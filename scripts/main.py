@@ -1,12 +1,17 @@
 import yaml
 import pprint
+import logging
 import argparse
 from pathlib import Path
+from typing import Optional
 
-from point_utils import DEFAULT_OUT_TXT
-from point_utils import ConfigSettings
-from point_utils.utils import get_data_from_txt, save_to_txt, visualize
-from point_utils.offsetter import offset_factory
+from point_utils.batch import run_batch
+from point_utils.index_cache import (DEFAULT_CACHE_DIR, DEFAULT_CACHE_MAX_BYTES,
+                                     IndexCache)
+from point_utils.pipeline import run_job
+from point_utils.profiling import Profiler, stage
+from point_utils.service import (DEFAULT_HOST, DEFAULT_PORT, make_server,
+                                 request_offsets, request_stats)
 
 
 def _parse_args():
@@ -22,10 +27,40 @@ def _parse_args():
     group.add_argument('-write-default-config',
                        type=str,
                        help="Write the default configuration file")
+    group.add_argument("-batch",
+                       type=str,
+                       help="Path to the YAML manifest of a batch of jobs")
+    group.add_argument("-serve",
+                       type=str,
+                       nargs="?",
+                       const=f"{DEFAULT_HOST}:{DEFAULT_PORT}",
+                       metavar="HOST:PORT",
+                       help="Run an offset service keeping point clouds and "
+                       f"indexes in memory (default {DEFAULT_HOST}:{DEFAULT_PORT})")
+    group.add_argument("-server-stats",
+                       type=str,
+                       metavar="URL",
+                       help="Print the statistics of an offset service")
+    parser.add_argument("-server",
+                        type=str,
+                        metavar="URL",
+                        help="Run the -config job on the offset service at "
+                        "this URL, e.g. http://127.0.0.1:8765")
+    parser.add_argument("-batch-workers",
+                        type=int,
+                        default=1,
+                        help="Number of worker processes running batch jobs")
+    parser.add_argument(
+        "-profile",
+        type=str,
+        help="Write the time and memory of each stage of the run to this JSON "
+        "file, and as folded stacks for flame graphs to a '.folded' file")
     return parser.parse_args()
 
 
-def run(config_path: str):
+def run(config_path: str,
+        profile: Optional[str] = None,
+        server: Optional[str] = None):
     if not Path(config_path).exists():
         raise FileNotFoundError(f"Configuration file not found: {config_path}")
 
@@ -36,41 +71,86 @@ def run(config_path: str):
     print(f"Settings:")
     pprint.pprint(settings)
 
-    all_coordinates, labels = get_data_from_txt(settings['input_file'])
-
-    # Setup the offset calculator based on settings
-    offset_calculator = offset_factory(
-        offset_method=settings['offset_method'],
-        all_coordinates=all_coordinates,
-        labels=labels,
-        data_label_to_offset=settings['data_label_to_offset'],
-        offset_magnitude=settings['offset_magnitude'],
-        new_data_label=settings['new_data_label'])
-
-    # Set method-specific keyword arguments (if any)
-    kwargs = {}
-
-    # Calculate offset points for selected points
-    offset_calculator.add_offset_points(**kwargs)
-
-    out_file = Path(settings.get('output_file', DEFAULT_OUT_TXT))
-    out_path = out_file.resolve()
-    save_to_txt(out_path, offset_calculator.all_coordinates,
-                offset_calculator.labels)
-    print(f"Save data to {out_path}.")
+    if server:
+        summary = request_offsets(server, settings)
+        print(f"Timings: {summary['timings']}")
+        print(f"Save data to {summary['output_file']}.")
+        return
 
-    if settings.get('visualize', True):
-        print("Visualizing the data.")
-        visualize(out_file, output_file=out_file.with_suffix(".png"))
+    index_cache = None
+    if settings.get('index_cache', True):
+        index_cache = IndexCache(
+            settings.get('index_cache_dir', DEFAULT_CACHE_DIR),
+            settings.get('index_cache_max_bytes', DEFAULT_CACHE_MAX_BYTES))
+
+    if profile:
+        with Profiler() as profiler, stage('run'):
+            summary = run_job(settings, index_cache=index_cache)
+        profiler.write_json(profile)
+        profiler.write_folded(Path(profile).with_suffix(".folded"))
+        print(f"Save profile to {profile}.")
+    else:
+        summary = run_job(settings, index_cache=index_cache)
+    if index_cache is not None:
+        print(f"Index cache: {index_cache.stats()}")
+    if 'approximation' in summary:
+        print("Approximate nearest neighbors:")
+        pprint.pprint(summary['approximation'])
+    if 'clearance' in summary:
+        print(f"Minimum clearance: {summary['clearance']}")
+    print(f"Save data to {summary['output_file']}.")
+
+
+def run_batch_manifest(manifest_path: str, workers: int):
+    if not Path(manifest_path).exists():
+        raise FileNotFoundError(f"Manifest file not found: {manifest_path}")
+
+    summaries = run_batch(manifest_path, workers=workers)
+    num_failed = sum(summary['status'] == 'failed' for summary in summaries)
+    print(f"Finished {len(summaries)} job(s), {num_failed} failed.")
+
+
+def serve(address: str):
+    host, _, port = address.rpartition(":")
+    server = make_server(host or DEFAULT_HOST, int(port))
+    print(f"Serving offset requests on http://{host or DEFAULT_HOST}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pprint.pprint(server.service.stats())
+
+
+def _configure_logging():
+    # Print the messages of the package on the console
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(fmt='[%(name)s] %(message)s'))
+    package_logger = logging.getLogger('point_utils')
+    package_logger.setLevel(logging.INFO)
+    package_logger.addHandler(handler)
 
 
 def main():
     args = _parse_args()
+    _configure_logging()
     if args.write_default_config:
+        # pydantic is only imported to write the default configuration
+        from point_utils.settings import ConfigSettings
         ConfigSettings.write_default_config_to_yaml(args.write_default_config)
         return
+    if args.batch:
+        run_batch_manifest(args.batch, args.batch_workers)
+        return
+    if args.serve:
+        serve(args.serve)
+        return
+    if args.server_stats:
+        pprint.pprint(request_stats(args.server_stats))
+        return
 
-    run(args.config)
+    run(args.config, args.profile, args.server)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,113 @@
+"""
+Script to compute offset points for query points read from a stream (stdin or a
+growing file) against a fixed reference point cloud, writing the offset points as
+the query points arrive.
+
+Usage:
+    python stream.py <reference_file> -magnitude <offset_magnitude>
+                     [-method KDTreeOffsets] [-new-label C]
+                     [-i <query_file>|-] [-o <output_file>|-]
+                     [-chunk-size 10000] [-max-latency 0.5] [-follow]
+
+Example:
+    tail -f queries.txt | python stream.py examples/cdd.txt -magnitude 2 -max-latency 0.1
+"""
+import argparse
+import json
+import sys
+
+from point_utils.offsetter import (OFFSET_METHOD_TO_CLASS, KDTreeOffsets,
+                                   offset_factory)
+from point_utils.streaming import (DEFAULT_STREAM_CHUNK_SIZE, StreamStats,
+                                   stream_offsets)
+from point_utils.utils import load_point_cloud, open_text
+
+
+def parse_args(cmd=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(usage=__doc__)
+    parser.add_argument("reference_file",
+                        help="Text or binary (.pcb) reference point cloud.")
+    parser.add_argument("-magnitude",
+                        type=float,
+                        required=True,
+                        help="Magnitude of the offset.")
+    parser.add_argument("-method",
+                        choices=list(OFFSET_METHOD_TO_CLASS),
+                        default="KDTreeOffsets")
+    parser.add_argument("-new-label",
+                        default="C",
+                        help="Label of the offset points.")
+    parser.add_argument("-i",
+                        dest="input_file",
+                        default="-",
+                        help="File of query points, '-' for stdin.")
+    parser.add_argument("-o",
+                        dest="output_file",
+                        default="-",
+                        help="File of the offset points, '-' for stdout.")
+    parser.add_argument("-chunk-size",
+                        type=int,
+                        default=DEFAULT_STREAM_CHUNK_SIZE,
+                        help="Maximum number of query points per chunk.")
+    parser.add_argument(
+        "-max-latency",
+        type=float,
+        default=None,
+        help="Maximum time in seconds a query point waits for its chunk to fill up.")
+    parser.add_argument("-follow",
+                        action="store_true",
+                        help="Wait for the query file to grow, as `tail -f`.")
+    parser.add_argument("-num-neighbors",
+                        type=int,
+                        default=10,
+                        help="KDTreeOffsets and PCANormalOffsets only, number of nearest neighbors.")
+    parser.add_argument("-precision",
+                        type=int,
+                        default=None,
+                        help="Number of decimals of the written coordinates.")
+    parser.add_argument("-seed", type=int, default=None)
+    return parser.parse_args(cmd)
+
+
+def main(cmd=None):
+    args = parse_args(cmd)
+    all_coordinates, labels = load_point_cloud(args.reference_file)
+    offsetter = offset_factory(args.method,
+                               all_coordinates=all_coordinates,
+                               labels=labels,
+                               data_label_to_offset=None,
+                               offset_magnitude=args.magnitude,
+                               new_data_label=args.new_label,
+                               seed=args.seed)
+    kwargs = {}
+    if isinstance(offsetter, KDTreeOffsets):
+        kwargs['num_neighbors'] = args.num_neighbors
+
+    input_stream = sys.stdin if args.input_file == "-" else open_text(
+        args.input_file)
+    output_stream = sys.stdout if args.output_file == "-" else open_text(
+        args.output_file, "w")
+    stats = StreamStats()
+    try:
+        stream_offsets(offsetter,
+                       input_stream,
+                       output_stream,
+                       chunk_size=args.chunk_size,
+                       max_latency=args.max_latency,
+                       follow=args.follow,
+                       precision=args.precision,
+                       stats=stats,
+                       **kwargs)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for stream in (input_stream, output_stream):
+            if stream not in (sys.stdin, sys.stdout):
+                stream.close()
+
+    # Report on stderr, stdout may hold the offset points
+    print(json.dumps(stats.summary(), indent=2), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,11 @@
 Script to visualize 3D data points with labels for data from a text file, and save the plot to disk.
 
 Usage:
-    python visualize.py <input_file> [-o <output_file>]
+    python visualize.py <input_file> [-o <output_file>] [-max-points 100000]
+                        [-downsample voxel|random] [-headless]
 """
 import argparse
-from point_utils.utils import visualize, DEFAULT_FIG_NAME
+from point_utils.utils import visualize, DEFAULT_FIG_NAME, DOWNSAMPLE_METHODS
 
 def parse_args(cmd=None) -> argparse.Namespace:
     parser = argparse.ArgumentParser(usage=__doc__)
@@ -22,12 +23,28 @@ def parse_args(cmd=None) -> argparse.Namespace:
         help=
         f"Filename of the output figure. Default is '{DEFAULT_FIG_NAME}' if not provided"
     )
+    parser.add_argument(
+        "-max-points",
+        type=int,
+        default=None,
+        help="Maximum number of plotted points, larger point clouds are downsampled.")
+    parser.add_argument("-downsample",
+                        choices=DOWNSAMPLE_METHODS,
+                        default="voxel",
+                        help="Downsampling method. Default is 'voxel'.")
+    parser.add_argument("-headless",
+                        action="store_true",
+                        help="Only save the figure, without showing it.")
     return parser.parse_args(cmd)
 
 
 def main(cmd=None):
     args = parse_args(cmd)
-    visualize(args.input_file, args.out_file)
+    visualize(args.input_file,
+              args.out_file,
+              max_points=args.max_points,
+              downsample=args.downsample,
+              show=not args.headless)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,116 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pytest
+import yaml
+
+from point_utils.batch import run_batch
+from point_utils.pipeline import run_job
+from point_utils.utils import get_data_from_txt
+
+DATA_FILE = str(Path(__file__).parent / "data" / "cdd.txt")
+
+
+def _settings(tmp_path, name, **settings):
+    return {
+        'input_file': DATA_FILE,
+        'offset_method': 'KDTreeOffsets',
+        'data_label_to_offset': 'B',
+        'offset_magnitude': 2,
+        'new_data_label': 'C',
+        'output_file': str(tmp_path / f"{name}.txt"),
+        'visualize': False,
+        'index_cache': False,
+        **settings
+    }
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_run_batch(tmp_path, workers):
+    with open(tmp_path / "config.yaml", "w") as fhandle:
+        yaml.safe_dump(_settings(tmp_path, "from_file"), fhandle)
+    manifest = [
+        "config.yaml",
+        _settings(tmp_path, "hull", offset_method='ConvexHullOffsets'),
+        _settings(tmp_path, "invalid", offset_method='InvalidOffsets'),
+        "missing.yaml",
+    ]
+    with open(tmp_path / "manifest.yaml", "w") as fhandle:
+        yaml.safe_dump({'jobs': manifest}, fhandle)
+
+    summaries = run_batch(tmp_path / "manifest.yaml",
+                          workers=workers,
+                          summary_dir=tmp_path / "summary")
+
+    assert [summary['status'] for summary in summaries
+           ] == ['succeeded', 'succeeded', 'failed', 'failed']
+    assert "InvalidOffsets" in summaries[2]['error']
+    assert summaries[1]['num_added_points'] == summaries[1][
+        'num_selected_points'] > 0
+    with open(tmp_path / "summary" / f"{summaries[0]['job_id']}.json") as fhandle:
+        assert json.load(fhandle) == summaries[0]
+
+    # Same output as a single run
+    expected = run_job(_settings(tmp_path, "single"))
+    assert expected['num_added_points'] == summaries[0]['num_added_points']
+    np.testing.assert_array_equal(
+        get_data_from_txt(tmp_path / "from_file.txt")[0],
+        get_data_from_txt(tmp_path / "single.txt")[0])
+
+
+def test_run_job_new_points_only(tmp_path):
+    # Appending the new points to a copy of the input gives the full output
+    output_file = tmp_path / "appended.txt"
+    output_file.write_text(Path(DATA_FILE).read_text())
+    run_job(
+        _settings(tmp_path, "appended", output_file=str(output_file),
+                  output_new_points_only=True))
+    run_job(_settings(tmp_path, "full"))
+
+    appended, appended_labels = get_data_from_txt(output_file)
+    full, full_labels = get_data_from_txt(tmp_path / "full.txt")
+    np.testing.assert_array_equal(appended, full)
+    assert appended_labels.tolist() == full_labels.tolist()
+
+
+def test_run_job_offset_rules(tmp_path):
+    rules = [{
+        'data_label_to_offset': 'B',
+        'offset_magnitudes': [1, 2],
+        'new_data_label': 'C'
+    }, {
+        'data_label_to_offset': 'A',
+        'offset_magnitudes': [2],
+        'new_data_label': 'D'
+    }]
+    summary = run_job(_settings(tmp_path, "rules", offset_rules=rules))
+    single = run_job(_settings(tmp_path, "single"))
+
+    assert summary['num_selected_points'] == summary['num_input_points']
+    coordinates, labels = get_data_from_txt(tmp_path / "rules.txt")
+    assert len(coordinates) == summary['num_input_points'] + summary[
+        'num_added_points']
+    # The magnitude 2 shell of the B points is the output of the single rule
+    expected, _ = get_data_from_txt(tmp_path / "single.txt")
+    num_b = single['num_added_points']
+    np.testing.assert_array_equal(
+        coordinates[labels == 'C'][num_b:], expected[-num_b:])
+    assert (labels == 'D').sum() == summary['num_input_points'] - num_b
+
+
+@pytest.mark.parametrize("offset_method", ["KDTreeOffsets", "CentroidOffsets"])
+def test_run_job_tile_budget(tmp_path, offset_method):
+    # The tiled mode gives the in-memory output, other methods ignore it as the
+    # approximate queries
+    run_job(_settings(tmp_path, "tiled", offset_method=offset_method,
+                      tile_budget=200))
+    if offset_method == "CentroidOffsets":
+        run_job(_settings(tmp_path, "tiled", offset_method=offset_method,
+                          knn_eps=0.5, knn_subsample=0.5))
+    run_job(_settings(tmp_path, "in_memory", offset_method=offset_method))
+
+    tiled, tiled_labels = get_data_from_txt(tmp_path / "tiled.txt")
+    in_memory, in_memory_labels = get_data_from_txt(tmp_path / "in_memory.txt")
+    np.testing.assert_allclose(tiled, in_memory)
+    assert tiled_labels.tolist() == in_memory_labels.tolist()
@@ -0,0 +1,72 @@
+import os
+
+import numpy as np
+import pytest
+
+from point_utils.index_cache import IndexCache
+from point_utils.offsetter import offset_factory
+
+
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(0)
+    all_coordinates = rng.normal(size=(200, 3))
+    labels = np.where(np.arange(200) % 4 == 0, 'B', 'A')
+    return all_coordinates, labels
+
+
+def _add_offset_points(method, points, index_cache):
+    all_coordinates, labels = points
+    offsetter = offset_factory(method,
+                               all_coordinates=all_coordinates,
+                               labels=labels,
+                               data_label_to_offset='B',
+                               offset_magnitude=1.0,
+                               new_data_label='C',
+                               index_cache=index_cache)
+    offsetter.add_offset_points()
+    return offsetter.new_coordinates
+
+
+@pytest.mark.parametrize("method", ["KDTreeOffsets", "ConvexHullOffsets"])
+def test_cached_indexes(method, points, tmp_path):
+    expected = _add_offset_points(method, points, None)
+
+    # A new cache instance stands for a new process
+    first = IndexCache(tmp_path)
+    np.testing.assert_array_equal(_add_offset_points(method, points, first),
+                                  expected)
+    assert first.stats() == {"hits": 0, "misses": 1}
+
+    second = IndexCache(tmp_path)
+    np.testing.assert_array_equal(_add_offset_points(method, points, second),
+                                  expected)
+    assert second.stats() == {"hits": 1, "misses": 0}
+
+
+def test_key_depends_on_content(points):
+    all_coordinates, _ = points
+    key = IndexCache.coordinates_key(all_coordinates)
+    assert IndexCache.coordinates_key(all_coordinates.copy()) == key
+
+    moved = all_coordinates.copy()
+    moved[0, 0] += 1e-12
+    assert IndexCache.coordinates_key(moved) != key
+    assert IndexCache.coordinates_key(all_coordinates.astype(np.float32)) != key
+
+
+def test_lru_eviction(tmp_path):
+    cache = IndexCache(tmp_path, max_bytes=6000)
+    arrays = [np.full((100, 3), i, dtype=float) for i in range(3)]
+    for i, array in enumerate(arrays[:2]):
+        cache.get_or_build('array', array, lambda: array)
+        # Make the first entry the least recently used one
+        path = cache._path('array', cache.coordinates_key(array))
+        os.utime(path, (i, i))
+    cache.get_or_build('array', arrays[2], lambda: arrays[2])
+
+    cached = {path.name for path in tmp_path.glob("*.pkl")}
+    assert cached == {
+        cache._path('array', cache.coordinates_key(array)).name
+        for array in arrays[1:]
+    }
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from point_utils.labels import CategoricalLabels, as_categorical
+
+
+def test_from_strings():
+    labels = CategoricalLabels.from_strings(['B', 'A', 'B', 'C'])
+
+    assert labels.codes.dtype == np.uint8
+    assert labels.categories.tolist() == ['A', 'B', 'C']
+    assert labels.tolist() == ['B', 'A', 'B', 'C']
+    np.testing.assert_array_equal(labels == 'B', [True, False, True, False])
+    np.testing.assert_array_equal(labels.select('C'), [3])
+    assert not (labels == 'missing').any()
+    assert labels[1] == 'A'
+    assert labels[labels == 'B'].tolist() == ['B', 'B']
+    np.testing.assert_array_equal(np.asarray(labels), ['B', 'A', 'B', 'C'])
+
+
+def test_many_categories():
+    labels = as_categorical([f'label_{i}' for i in range(300)])
+    assert labels.codes.dtype == np.uint16
+    assert as_categorical(labels) is labels
+
+
+def test_numeric_labels():
+    labels = as_categorical(np.array([1., 2., 1.]))
+    assert labels.tolist() == ['1.0', '2.0', '1.0']
+    np.testing.assert_array_equal(labels == 2., [False, True, False])
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+from scipy.spatial import KDTree
+
+from point_utils.index_cache import IndexCache
+from point_utils.neighbors import VoxelGrid, build_neighbor_index
+from point_utils.offsetter import offset_factory
+
+
+def _clouds():
+    rng = np.random.default_rng(0)
+    return {
+        'uniform': rng.random((5000, 3)),
+        # A dense blob in a sparse box, crowded cells fall back to a K-D Tree
+        'clustered': np.concatenate(
+            [rng.normal(size=(2000, 3)) * 0.01,
+             rng.random((3000, 3)) * 10]),
+        'plane': np.c_[rng.random((5000, 2)), np.zeros(5000)],
+    }
+
+
+@pytest.mark.parametrize("cloud", ["uniform", "clustered", "plane"])
+@pytest.mark.parametrize("k", [1, 10])
+def test_voxel_grid_matches_kdtree(cloud, k):
+    coordinates = _clouds()[cloud]
+    rng = np.random.default_rng(1)
+    # Points of the cloud and points far outside of its bounding box
+    queries = np.concatenate(
+        [coordinates[::7], rng.random((50, 3)) * 40 - 20])
+
+    distances, indices = VoxelGrid(coordinates).query(queries, k=k)
+    expected_distances, expected_indices = KDTree(coordinates).query(queries,
+                                                                     k=k)
+    np.testing.assert_allclose(distances,
+                               expected_distances.reshape(len(queries), -1))
+    np.testing.assert_allclose(
+        np.linalg.norm(coordinates[indices] - queries[:, np.newaxis], axis=2),
+        distances)
+
+    approximate, _ = VoxelGrid(coordinates).query(queries, k=k, eps=1.)
+    assert np.all(approximate[:, -1] <= 2 * distances[:, -1] * (1 + 1e-12))
+
+
+def test_voxel_grid_missing_neighbors():
+    distances, indices = VoxelGrid(np.zeros((2, 3))).query(np.ones((1, 3)), k=3)
+    np.testing.assert_array_equal(indices, [[0, 1, 2]])
+    assert np.isinf(distances[0, 2])
+
+    with pytest.raises(ValueError, match="not supported"):
+        build_neighbor_index('octree', np.zeros((2, 3)))
+
+
+@pytest.mark.parametrize("kwargs", [{}, {'tile_budget': 600}])
+@pytest.mark.parametrize("offset_method", ["KDTreeOffsets", "PCANormalOffsets"])
+def test_grid_backend_offsets(offset_method, kwargs):
+    coordinates = _clouds()['uniform']
+    settings = {
+        'all_coordinates': coordinates,
+        'labels': np.where(np.arange(len(coordinates)) % 4 == 0, 'B', 'A'),
+        'data_label_to_offset': 'B',
+        'offset_magnitude': 1.,
+        'new_data_label': 'C',
+    }
+    expected = offset_factory(offset_method, **settings).get_offset_vecs(**kwargs)
+    offset_vectors = offset_factory(offset_method,
+                                    neighbor_backend='grid',
+                                    **settings).get_offset_vecs(**kwargs)
+    np.testing.assert_allclose(offset_vectors, expected, atol=1e-9)
+
+
+def test_grid_backend_clearance(tmp_path):
+    coordinates = _clouds()['uniform']
+    settings = {
+        'all_coordinates': coordinates,
+        'labels': np.where(np.arange(len(coordinates)) % 4 == 0, 'B', 'A'),
+        'data_label_to_offset': 'B',
+        'offset_magnitude': 0.05,
+        'new_data_label': 'C',
+        'min_clearance': 0.03,
+        'clearance_growth': 1.5,
+    }
+    expected = offset_factory("CentroidOffsets", **settings)
+    expected.add_offset_points()
+
+    # The grid is built once and loaded from the cache by the second run
+    index_cache = IndexCache(tmp_path)
+    for _ in range(2):
+        offset_calculator = offset_factory("CentroidOffsets",
+                                           neighbor_backend='grid',
+                                           index_cache=index_cache,
+                                           **settings)
+        assert isinstance(offset_calculator.get_neighbor_index(), VoxelGrid)
+        offset_calculator.add_offset_points()
+        assert offset_calculator.clearance_stats == expected.clearance_stats
+        np.testing.assert_allclose(offset_calculator.new_coordinates,
+                                   expected.new_coordinates)
+    assert expected.clearance_stats['num_violations'] > 0
+    assert index_cache.hits == 1
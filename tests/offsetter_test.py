@@ -1,8 +1,12 @@
+import logging
 from pathlib import Path
+import numpy as np
 import pytest
+from scipy.spatial import KDTree
 
-from point_utils import offset_factory, get_data_from_txt
-from point_utils.offsetter import OFFSET_METHOD_TO_CLASS
+from point_utils import offset_factory, get_data_from_txt, save_point_cloud
+from point_utils.offsetter import (OFFSET_METHOD_TO_CLASS, KDTreeOffsets,
+                                   OffsetsInterface)
 
 
 @pytest.fixture
@@ -12,7 +16,8 @@ def data_dir():
 
 
 @pytest.mark.parametrize(
-    "offset_method", ["KDTreeOffsets", "CentroidOffsets", "ConvexHullOffsets"])
+    "offset_method",
+    ["KDTreeOffsets", "PCANormalOffsets", "CentroidOffsets", "ConvexHullOffsets"])
 def test_offset_factory(data_dir, offset_method):
     inp_file = data_dir / "cdd.txt"
     all_coordinates, labels = get_data_from_txt(inp_file)
@@ -39,3 +44,496 @@ def test_offset_factory(data_dir, offset_method):
         labels) + expected_num_new_points
     assert offset_calculator.labels.shape[0] == len(
         labels) + expected_num_new_points
+
+
+@pytest.mark.parametrize("num_neighbors, chunk_size", [(2, 5), (5, 3), (10, 100)])
+def test_kdtree_batched_matches_point_loop(data_dir, num_neighbors, chunk_size):
+    all_coordinates, labels = get_data_from_txt(data_dir / "cdd.txt")
+    offset_calculator = offset_factory("KDTreeOffsets",
+                                       all_coordinates=all_coordinates,
+                                       labels=labels,
+                                       data_label_to_offset='B',
+                                       offset_magnitude=2.0,
+                                       new_data_label='C')
+    offset_vectors = offset_calculator.get_offset_vecs(
+        num_neighbors=num_neighbors, workers=-1, chunk_size=chunk_size)
+
+    # Reference: one query per selected point
+    tree = KDTree(all_coordinates)
+    expected = []
+    for idx in offset_calculator.point_indices:
+        point = all_coordinates[idx]
+        _, nn_indices = tree.query(point, k=num_neighbors)
+        avg_displacement = np.mean(all_coordinates[nn_indices] - point, axis=0)
+        expected.append(-avg_displacement / np.linalg.norm(avg_displacement) *
+                        2.0)
+
+    np.testing.assert_array_equal(offset_vectors, np.array(expected))
+
+
+def test_kdtree_zero_norm_single_warning(caplog):
+    # Interior points of a cubic lattice have a zero mean displacement
+    lattice = np.stack(np.meshgrid(*[np.arange(5.)] * 3), axis=-1).reshape(-1, 3)
+    offset_calculator = offset_factory("KDTreeOffsets",
+                                       all_coordinates=lattice,
+                                       labels=['B'] * len(lattice),
+                                       data_label_to_offset='B',
+                                       offset_magnitude=1.0,
+                                       new_data_label='C')
+    with caplog.at_level(logging.WARNING, logger="point_utils.offsetter"):
+        offset_vectors = offset_calculator.get_offset_vecs(num_neighbors=7)
+
+    assert len(caplog.records) == 1
+    assert "27 point(s)" in caplog.text
+    assert np.isnan(offset_vectors).any(axis=1).sum() == 27
+
+
+def test_pca_normals_sphere_and_plane():
+    # Points on a unit sphere: the normals are radial and point outwards
+    rng = np.random.default_rng(0)
+    sphere = rng.normal(size=(2000, 3))
+    sphere /= np.linalg.norm(sphere, axis=1, keepdims=True)
+    offset_calculator = offset_factory("PCANormalOffsets",
+                                       all_coordinates=sphere,
+                                       labels=['B'] * len(sphere),
+                                       data_label_to_offset='B',
+                                       offset_magnitude=2.0,
+                                       new_data_label='C')
+    offset_vectors = offset_calculator.get_offset_vecs(num_neighbors=20,
+                                                       chunk_size=300)
+    np.testing.assert_allclose(np.linalg.norm(offset_vectors, axis=1), 2.0)
+    assert np.min(np.sum(offset_vectors * sphere, axis=1)) > 1.9
+
+    # Chunked, single-batch and query results agree
+    np.testing.assert_array_equal(
+        offset_vectors,
+        offset_calculator.get_offset_vecs(num_neighbors=20, chunk_size=5000))
+    np.testing.assert_allclose(
+        offset_calculator.query_offset_vecs(sphere, num_neighbors=20),
+        offset_vectors)
+
+
+def test_pca_normals_symmetric_grid(caplog):
+    # A flat regular grid, where the mean displacement of interior points is zero:
+    # the normals are along z, oriented away from the centroid of the cloud
+    grid = np.stack(np.meshgrid(np.arange(10.), np.arange(10.), [0.]),
+                    axis=-1).reshape(-1, 3)
+    bump = np.array([[4.5, 4.5, -3.]])
+    offset_calculator = offset_factory("PCANormalOffsets",
+                                       all_coordinates=np.concatenate([grid, bump]),
+                                       labels=['B'] * len(grid) + ['A'],
+                                       data_label_to_offset='B',
+                                       offset_magnitude=1.0,
+                                       new_data_label='C')
+    with caplog.at_level(logging.WARNING, logger="point_utils.offsetter"):
+        offset_vectors = offset_calculator.get_offset_vecs(num_neighbors=9)
+
+    assert np.isfinite(offset_vectors).all()
+    interior = np.all((grid[:, :2] >= 2) & (grid[:, :2] <= 7), axis=1)
+    np.testing.assert_allclose(offset_vectors[interior], [[0., 0., 1.]] *
+                               interior.sum(),
+                               atol=1e-12)
+    assert len(caplog.records) == 1
+    assert "ambiguous" in caplog.text
+
+
+@pytest.mark.parametrize("workers, min_clearance", [(1, None), (2, None), (1, 1.)])
+@pytest.mark.parametrize(
+    "offset_method",
+    ["KDTreeOffsets", "PCANormalOffsets", "CentroidOffsets", "ConvexHullOffsets"])
+def test_rule_offsets_match_separate_runs(data_dir, offset_method, workers,
+                                          min_clearance):
+    all_coordinates, labels = get_data_from_txt(data_dir / "cdd.txt")
+    rules = [('B', [0.5, 1., 2.], 'C'), ('A', [1.5], 'D'), ('B', [3.], 'E')]
+    offset_calculator = offset_factory(offset_method,
+                                       all_coordinates=all_coordinates,
+                                       labels=labels,
+                                       data_label_to_offset='B',
+                                       offset_magnitude=1.,
+                                       new_data_label='C',
+                                       seed=0,
+                                       workers=workers,
+                                       min_clearance=min_clearance)
+    offset_calculator.add_rule_offset_points(rules)
+
+    expected_coordinates, expected_labels = [], []
+    for source_label, magnitudes, new_label in rules:
+        for magnitude in magnitudes:
+            separate = offset_factory(offset_method,
+                                      all_coordinates=all_coordinates,
+                                      labels=labels,
+                                      data_label_to_offset=source_label,
+                                      offset_magnitude=magnitude,
+                                      new_data_label=new_label,
+                                      seed=0,
+                                      workers=workers,
+                                      min_clearance=min_clearance)
+            separate.add_offset_points()
+            expected_coordinates.append(separate.new_coordinates)
+            expected_labels += [new_label] * len(separate.new_coordinates)
+
+    np.testing.assert_array_equal(offset_calculator.new_coordinates,
+                                  np.concatenate(expected_coordinates))
+    assert offset_calculator.store.added_labels.tolist() == expected_labels
+    # The attributes of the default rule are restored
+    np.testing.assert_array_equal(offset_calculator.point_indices,
+                                  np.flatnonzero(labels == 'B'))
+    assert offset_calculator.offset_magnitude == 1.
+
+
+@pytest.mark.parametrize(
+    "offset_method",
+    ["KDTreeOffsets", "PCANormalOffsets", "CentroidOffsets", "ConvexHullOffsets"])
+def test_min_clearance_without_points(data_dir, offset_method):
+    all_coordinates, labels = get_data_from_txt(data_dir / "cdd.txt")
+    offset_calculator = offset_factory(offset_method,
+                                       all_coordinates=all_coordinates,
+                                       labels=labels,
+                                       data_label_to_offset='absent',
+                                       offset_magnitude=1.,
+                                       new_data_label='C',
+                                       min_clearance=1.)
+    offset_calculator.add_offset_points()
+    assert len(offset_calculator.labels) == len(labels)
+    assert offset_calculator.clearance_stats['num_checked'] == 0
+
+    # A rule matching no point adds nothing besides the other rules' points
+    offset_calculator.add_rule_offset_points([('absent', [1.], 'C'),
+                                              ('B', [1.], 'D')])
+    num_selected = np.count_nonzero(labels == 'B')
+    assert offset_calculator.store.added_labels.tolist() == ['D'] * num_selected
+
+
+def test_kdtree_approximate_mode():
+    rng = np.random.default_rng(0)
+    all_coordinates = rng.uniform(size=(20_000, 3)) * [10., 10., 1.]
+    offset_calculator = offset_factory("KDTreeOffsets",
+                                       all_coordinates=all_coordinates,
+                                       labels=['B'] * len(all_coordinates),
+                                       data_label_to_offset='B',
+                                       offset_magnitude=2.0,
+                                       new_data_label='C',
+                                       seed=0)
+    exact = offset_calculator.get_offset_vecs(num_neighbors=20)
+    np.testing.assert_array_equal(
+        offset_calculator.get_offset_vecs(num_neighbors=20, eps=0.),
+        exact)
+
+    approximate = offset_calculator.get_offset_vecs(num_neighbors=20,
+                                                    eps=0.5,
+                                                    subsample=0.5)
+    np.testing.assert_allclose(np.linalg.norm(approximate, axis=1), 2.0)
+    assert not np.array_equal(approximate, exact)
+
+    report = offset_calculator.approximation_report(num_neighbors=20,
+                                                    eps=0.5,
+                                                    subsample=0.5,
+                                                    sample_size=500)
+    assert report['sample_size'] == 500
+    assert 0 < report['mean_deviation'] <= report['p95_deviation'] <= report[
+        'max_deviation'] <= 180
+    assert offset_calculator.approximation_report(
+        num_neighbors=20, sample_size=500)['max_deviation'] == 0
+
+    with pytest.raises(ValueError, match="tiled mode"):
+        offset_calculator.get_offset_vecs(tile_budget=1000, subsample=0.5)
+    with pytest.raises(ValueError, match=r"\(0, 1\]"):
+        offset_calculator.get_offset_vecs(subsample=0.)
+
+
+def test_convex_hull_facet_normals():
+    # Unit cube corners plus interior points close to the +x, -z faces and
+    # one point on the (+x, +y) edge
+    corners = np.stack(np.meshgrid(*[[0., 1.]] * 3), axis=-1).reshape(-1, 3)
+    selected = np.array([[0.9, 0.5, 0.5], [0.5, 0.4, 0.05], [1., 1., 0.5]])
+    offset_calculator = offset_factory(
+        "ConvexHullOffsets",
+        all_coordinates=np.concatenate([corners, selected]),
+        labels=['A'] * len(corners) + ['B'] * len(selected),
+        data_label_to_offset='B',
+        offset_magnitude=2.0,
+        new_data_label='C')
+
+    offset_vectors = offset_calculator.get_offset_vecs(chunk_size=2)
+
+    expected = np.array([[2., 0., 0.], [0., 0., -2.],
+                         [np.sqrt(2.), np.sqrt(2.), 0.]])
+    np.testing.assert_allclose(offset_vectors, expected, atol=1e-12)
+
+
+def test_convex_hull_coplanar_facets():
+    # Unit cube with the (1, 1, 1) corner cut off: the +x face is a pentagon of
+    # three coplanar triangles, the -y face a square of two
+    corners = np.stack(np.meshgrid(*[[0., 1.]] * 3), axis=-1).reshape(-1, 3)[:-1]
+    cut = np.array([[0.5, 1., 1.], [1., 0.5, 1.], [1., 1., 0.5]])
+    offset_calculator = offset_factory(
+        "ConvexHullOffsets",
+        all_coordinates=np.concatenate([corners, cut, [[1., 0., 0.5]]]),
+        labels=['A'] * (len(corners) + len(cut)) + ['B'],
+        data_label_to_offset='B',
+        offset_magnitude=2.0,
+        new_data_label='C')
+
+    # The point on the edge of both faces is offset along their mean normal
+    np.testing.assert_allclose(offset_calculator.get_offset_vecs(),
+                               [[np.sqrt(2.), -np.sqrt(2.), 0.]],
+                               atol=1e-12)
+
+
+def test_convex_hull_facet_search():
+    # A sphere with enough facets to be searched through the facet samples,
+    # and interior points, compared with checking all facets
+    rng = np.random.default_rng(0)
+    surface = rng.normal(size=(3000, 3))
+    surface /= np.linalg.norm(surface, axis=1)[:, np.newaxis]
+    all_coordinates = np.concatenate(
+        [surface * [3., 1., 0.5],
+         rng.uniform(-0.3, 0.3, size=(1000, 3))])
+    offset_calculator = offset_factory(
+        "ConvexHullOffsets",
+        all_coordinates=all_coordinates,
+        labels=['B'] * len(all_coordinates),
+        data_label_to_offset='B',
+        offset_magnitude=2.0,
+        new_data_label='C')
+
+    state = offset_calculator.partition_state()
+    assert 'tree' in state
+    np.testing.assert_allclose(
+        offset_calculator.get_offset_vecs(chunk_size=700),
+        offset_calculator.query_offset_vecs(all_coordinates),
+        atol=1e-12)
+
+
+@pytest.mark.parametrize("axes", [[1., 1., 1.], [3., 1., 0.5]])
+def test_convex_hull_solid_cloud(axes):
+    # Most points deep inside the hull, searched through the groups of similar
+    # plane normals, compared with checking all facets
+    rng = np.random.default_rng(0)
+    directions = rng.normal(size=(6000, 3))
+    directions /= np.linalg.norm(directions, axis=1)[:, np.newaxis]
+    radii = rng.random((6000, 1))**(1 / 3)
+    radii[:1500] = 1.
+    all_coordinates = directions * radii * axes
+    offset_calculator = offset_factory(
+        "ConvexHullOffsets",
+        all_coordinates=all_coordinates,
+        labels=['B'] * len(all_coordinates),
+        data_label_to_offset='B',
+        offset_magnitude=2.0,
+        new_data_label='C')
+
+    assert 'group_levels' in offset_calculator.partition_state()
+    np.testing.assert_allclose(offset_calculator.get_offset_vecs(),
+                               offset_calculator.query_offset_vecs(all_coordinates),
+                               atol=1e-12)
+
+
+def test_convex_hull_incremental(data_dir):
+    all_coordinates, labels = get_data_from_txt(data_dir / "cdd.txt")
+    settings = {
+        "all_coordinates": all_coordinates,
+        "labels": labels,
+        "data_label_to_offset": 'B',
+        "offset_magnitude": 2.0,
+        "new_data_label": 'C',
+    }
+    incremental = offset_factory("ConvexHullOffsets", incremental=True,
+                                 **settings)
+    incremental.add_offset_points()
+    hull = incremental.get_hull()
+    incremental.add_offset_points()
+
+    # The hull is updated in place rather than rebuilt
+    assert incremental.get_hull() is hull
+    rebuilt = offset_factory("ConvexHullOffsets", **settings)
+    rebuilt.add_offset_points()
+    rebuilt.add_offset_points()
+    np.testing.assert_allclose(incremental.all_coordinates,
+                               rebuilt.all_coordinates)
+
+
+def test_partition_methods_are_abstract():
+
+    class UnitOffsets(OffsetsInterface):
+
+        def get_offset_vecs(self, **kwargs):
+            return np.ones((len(self.point_indices), 3))
+
+    with pytest.raises(TypeError, match="partition_offset_vecs, partition_state"):
+        UnitOffsets(all_coordinates=np.zeros((1, 3)),
+                    labels=['B'],
+                    data_label_to_offset='B',
+                    offset_magnitude=1.,
+                    new_data_label='C')
+
+
+def test_normalize_rows_seeded():
+    vecs = np.array([[3., 0., 4.], [0., 0., 0.], [1., 1., 1.], [0., 0., 0.]])
+    normalized = OffsetsInterface.normalize_rows(vecs,
+                                                 np.random.default_rng(7))
+
+    np.testing.assert_allclose(np.linalg.norm(normalized, axis=1), 1.)
+    np.testing.assert_array_equal(normalized[0], [0.6, 0., 0.8])
+    # Random fallback directions are reproducible for the same seed
+    np.testing.assert_array_equal(
+        normalized,
+        OffsetsInterface.normalize_rows(vecs, np.random.default_rng(7)))
+    np.testing.assert_array_equal(normalized[2],
+                                  OffsetsInterface.normalizer(vecs[2]))
+
+
+def test_centroid_offsets_chunked(data_dir):
+    all_coordinates, labels = get_data_from_txt(data_dir / "cdd.txt")
+    offset_calculator = offset_factory("CentroidOffsets",
+                                       all_coordinates=all_coordinates,
+                                       labels=labels,
+                                       data_label_to_offset='B',
+                                       offset_magnitude=2.0,
+                                       new_data_label='C')
+    offset_vectors = offset_calculator.get_offset_vecs(chunk_size=2)
+
+    directions = all_coordinates[offset_calculator.point_indices] - np.mean(
+        all_coordinates, axis=0)
+    expected = [d / np.linalg.norm(d) * 2.0 for d in directions]
+    np.testing.assert_array_equal(offset_vectors, expected)
+
+
+def test_centroid_offsets_integer_points():
+    all_coordinates = np.arange(30).reshape(10, 3)
+    offset_calculator = offset_factory("CentroidOffsets",
+                                       all_coordinates=all_coordinates,
+                                       labels=['A'] * 10,
+                                       data_label_to_offset='A',
+                                       offset_magnitude=0.3,
+                                       new_data_label='C')
+    offset_calculator.add_offset_points()
+
+    directions = all_coordinates - np.mean(all_coordinates, axis=0)
+    expected = all_coordinates + 0.3 * directions / np.linalg.norm(
+        directions, axis=1, keepdims=True)
+    np.testing.assert_allclose(offset_calculator.new_coordinates, expected)
+
+
+def test_offsets_from_binary_file(data_dir, tmp_path):
+    all_coordinates, labels = get_data_from_txt(data_dir / "cdd.txt")
+    save_point_cloud(tmp_path / "cdd.pcb", all_coordinates, labels)
+    settings = {
+        "data_label_to_offset": 'B',
+        "offset_magnitude": 2.0,
+        "new_data_label": 'C',
+    }
+
+    from_binary = KDTreeOffsets.from_file(tmp_path / "cdd.pcb", **settings)
+    from_text = KDTreeOffsets.from_file(data_dir / "cdd.txt", **settings)
+
+    np.testing.assert_array_equal(from_binary.get_offset_vecs(),
+                                  from_text.get_offset_vecs())
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_repeated_offset_rounds(data_dir, lazy):
+    all_coordinates, labels = get_data_from_txt(data_dir / "cdd.txt")
+    offset_calculator = offset_factory("CentroidOffsets",
+                                       all_coordinates=all_coordinates,
+                                       labels=labels,
+                                       data_label_to_offset='B',
+                                       offset_magnitude=2.0,
+                                       new_data_label='C',
+                                       lazy=lazy)
+    offset_calculator.add_offset_points()
+    first_round = offset_calculator.new_coordinates.copy()
+    offset_calculator.offset_magnitude = 4.0
+    offset_calculator.add_offset_points()
+
+    num_selected = len(offset_calculator.point_indices)
+    assert len(offset_calculator.labels) == len(labels) + 2 * num_selected
+    np.testing.assert_array_equal(offset_calculator.all_coordinates[:len(labels)],
+                                  all_coordinates)
+    np.testing.assert_array_equal(
+        offset_calculator.new_coordinates[:num_selected], first_round)
+
+
+@pytest.mark.parametrize(
+    "offset_method",
+    ["KDTreeOffsets", "PCANormalOffsets", "CentroidOffsets", "ConvexHullOffsets"])
+@pytest.mark.parametrize("neighbor_backend", ["kdtree", "grid"])
+def test_float32_directions_match_float64(offset_method, neighbor_backend):
+    # Sensor-like data at 1 mm precision, away from the origin
+    rng = np.random.default_rng(0)
+    all_coordinates = np.round(rng.normal(size=(5000, 3)) * 10 + 100, 3)
+    labels = np.where(rng.random(len(all_coordinates)) < 0.2, 'B', 'A')
+
+    offset_vectors = {}
+    for dtype in (np.float64, np.float32):
+        offset_calculator = offset_factory(offset_method,
+                                           all_coordinates=all_coordinates.astype(
+                                               dtype),
+                                           labels=labels,
+                                           data_label_to_offset='B',
+                                           offset_magnitude=2.0,
+                                           new_data_label='C',
+                                           seed=0,
+                                           neighbor_backend=neighbor_backend)
+        offset_vectors[dtype] = offset_calculator.get_offset_vecs()
+        offset_calculator.add_offset_points()
+        assert offset_calculator.all_coordinates.dtype == dtype
+    assert offset_vectors[np.float32].dtype == np.float32
+
+    exact, single = offset_vectors[np.float64], offset_vectors[np.float32]
+    deviations = np.degrees(
+        np.arctan2(np.linalg.norm(np.cross(exact, single), axis=1),
+                   np.einsum('ij,ij->i', exact, single)))
+    # Stated tolerance of the float32 mode, in degrees. Single points whose
+    # direction is ill-conditioned (tied neighbors, near-zero mean displacement)
+    # may deviate more.
+    assert np.percentile(deviations, 99) < 0.05
+
+
+def test_min_clearance(caplog):
+    # Horseshoe-shaped tube, its centroid is outside of the material
+    rng = np.random.default_rng(0)
+    angles = rng.uniform(0.25 * np.pi, 1.75 * np.pi, 5000)
+    radii = 10 + rng.normal(size=len(angles)) * 0.5
+    all_coordinates = np.c_[radii * np.cos(angles), radii * np.sin(angles),
+                            rng.normal(size=len(angles)) * 0.5]
+    labels = np.where(rng.random(len(angles)) < 0.3, 'B', 'A')
+    settings = dict(all_coordinates=all_coordinates,
+                    labels=labels,
+                    data_label_to_offset='B',
+                    offset_magnitude=1.0,
+                    new_data_label='C',
+                    seed=0)
+
+    unchecked = offset_factory("CentroidOffsets", **settings)
+    unchecked.add_offset_points()
+    assert unchecked.clearance_stats is None
+    tree = KDTree(all_coordinates)
+    violated = tree.query(unchecked.new_coordinates)[0] < 0.5
+
+    for growth in [1., 1.5]:
+        offset_calculator = offset_factory("CentroidOffsets",
+                                           min_clearance=0.5,
+                                           clearance_growth=growth,
+                                           **settings)
+        with caplog.at_level(logging.WARNING, logger="point_utils.offsetter"):
+            offset_calculator.add_offset_points()
+        stats = offset_calculator.clearance_stats
+        assert stats['num_checked'] == len(violated)
+        assert stats['num_violations'] == np.count_nonzero(violated)
+        assert stats['num_corrected'] + stats['num_unresolved'] == stats[
+            'num_violations']
+
+        new_coordinates = offset_calculator.new_coordinates
+        np.testing.assert_array_equal(new_coordinates[~violated],
+                                      unchecked.new_coordinates[~violated])
+        distances = tree.query(new_coordinates)[0]
+        assert np.count_nonzero(distances < 0.5) == stats['num_unresolved']
+        if growth == 1.:
+            # The magnitude is kept
+            np.testing.assert_allclose(
+                np.linalg.norm(new_coordinates - all_coordinates[labels == 'B'],
+                               axis=1), 1.)
+        else:
+            assert stats['num_unresolved'] < 0.01 * stats['num_violations']
+    assert "still closer than 0.5" in caplog.text
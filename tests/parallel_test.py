@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from point_utils.offsetter import offset_factory
+from point_utils.parallel import spatial_partitions
+
+
+@pytest.fixture
+def random_cloud():
+    rng = np.random.default_rng(1)
+    all_coordinates = rng.normal(size=(2000, 3)) * [3., 1., 0.5]
+    labels = np.where(rng.random(len(all_coordinates)) < 0.3, 'B', 'A')
+    return all_coordinates, labels
+
+
+def test_spatial_partitions(random_cloud):
+    all_coordinates, _ = random_cloud
+    parts = spatial_partitions(all_coordinates, 7)
+
+    assert len(parts) == 7
+    np.testing.assert_array_equal(np.sort(np.concatenate(parts)),
+                                  np.arange(len(all_coordinates)))
+    sizes = [len(part) for part in parts]
+    assert max(sizes) - min(sizes) <= len(all_coordinates) // 7
+
+
+@pytest.mark.parametrize(
+    "offset_method",
+    ["KDTreeOffsets", "PCANormalOffsets", "CentroidOffsets", "ConvexHullOffsets"])
+def test_process_executor_matches_serial(random_cloud, offset_method):
+    all_coordinates, labels = random_cloud
+    settings = {
+        "all_coordinates": all_coordinates,
+        "labels": labels,
+        "data_label_to_offset": 'B',
+        "offset_magnitude": 2.0,
+        "new_data_label": 'C',
+    }
+    serial = offset_factory(offset_method, **settings)
+    serial.add_offset_points()
+    parallel = offset_factory(offset_method, workers=2, **settings)
+    parallel.add_offset_points()
+
+    np.testing.assert_array_equal(parallel.all_coordinates,
+                                  serial.all_coordinates)
+    np.testing.assert_array_equal(parallel.labels, serial.labels)
+
+
+def test_process_executor_no_tiled_mode(random_cloud):
+    all_coordinates, labels = random_cloud
+    offset_calculator = offset_factory("KDTreeOffsets",
+                                       all_coordinates=all_coordinates,
+                                       labels=labels,
+                                       data_label_to_offset='B',
+                                       offset_magnitude=2.0,
+                                       new_data_label='C',
+                                       workers=2)
+    with pytest.raises(ValueError, match="tiled mode"):
+        offset_calculator.add_offset_points(tile_budget=100)
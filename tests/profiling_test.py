@@ -0,0 +1,69 @@
+import numpy as np
+
+from point_utils import profiling
+from point_utils.offsetter import offset_factory
+from point_utils.profiling import Profiler, stage
+
+
+def test_stage_without_hooks():
+    with stage('load', 10) as load_stage:
+        pass
+    assert load_stage._path is None
+
+
+def test_profiler_report(tmp_path):
+    with Profiler() as profiler:
+        with stage('run'):
+            with stage('load') as load_stage:
+                load_stage.num_points = 5
+            for _ in range(2):
+                with stage('query', 3):
+                    pass
+    assert not profiling._hooks
+
+    report = profiler.report()
+    assert set(report) == {'run', 'run;load', 'run;query'}
+    assert report['run;query']['calls'] == 2
+    assert report['run;query']['num_points'] == 6
+    assert report['run;load']['num_points'] == 5
+    assert report['run']['self_time'] <= report['run']['wall_time']
+
+    profiler.write_folded(tmp_path / "profile.folded")
+    lines = (tmp_path / "profile.folded").read_text().splitlines()
+    assert sorted(line.split()[0] for line in lines) == sorted(report)
+
+
+def test_offsetter_stages():
+    rng = np.random.default_rng(0)
+    offsetter = offset_factory('KDTreeOffsets',
+                               all_coordinates=rng.normal(size=(100, 3)),
+                               labels=np.where(np.arange(100) < 20, 'B', 'A'),
+                               data_label_to_offset='B',
+                               offset_magnitude=1.0,
+                               new_data_label='C')
+    with Profiler() as profiler:
+        offsetter.add_offset_points(chunk_size=8)
+
+    report = profiler.report()
+    assert report['offset;index_build']['num_points'] == 100
+    assert report['offset;query']['calls'] == 3
+    assert report['offset;query']['num_points'] == 20
+    assert report['append']['num_points'] == 20
+
+
+def test_rule_offsets_build_index_once():
+    rng = np.random.default_rng(0)
+    offsetter = offset_factory('KDTreeOffsets',
+                               all_coordinates=rng.normal(size=(100, 3)),
+                               labels=np.where(np.arange(100) < 20, 'B', 'A'),
+                               data_label_to_offset='B',
+                               offset_magnitude=1.0,
+                               new_data_label='C')
+    with Profiler() as profiler:
+        offsetter.add_rule_offset_points([('B', [1., 2.], 'C'),
+                                          ('A', [1.], 'D')])
+
+    report = profiler.report()
+    assert report['offset;index_build']['calls'] == 1
+    assert report['offset']['calls'] == 2
+    assert report['append']['num_points'] == 2 * 20 + 80
@@ -0,0 +1,106 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from point_utils.index_cache import IndexCache
+from point_utils.pipeline import run_job
+from point_utils.service import make_server, request_offsets, request_stats
+from point_utils.utils import get_data_from_txt
+
+DATA_FILE = str(Path(__file__).parent / "data" / "cdd.txt")
+
+
+def _settings(tmp_path, name, **settings):
+    return {
+        'input_file': DATA_FILE,
+        'offset_method': 'KDTreeOffsets',
+        'data_label_to_offset': 'B',
+        'offset_magnitude': 2,
+        'new_data_label': 'C',
+        'output_file': str(tmp_path / f"{name}.txt"),
+        'visualize': False,
+        **settings
+    }
+
+
+@pytest.fixture
+def server_url():
+    server = make_server(port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address
+    yield f"http://{host}:{port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_service_matches_local_runs(tmp_path, server_url):
+    methods = ['KDTreeOffsets', 'ConvexHullOffsets'] * 3
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        summaries = list(
+            executor.map(
+                lambda job: request_offsets(
+                    server_url,
+                    _settings(tmp_path, f"served{job[0]}", offset_method=job[1])),
+                enumerate(methods)))
+
+    for i, (method, summary) in enumerate(zip(methods, summaries)):
+        expected = run_job(_settings(tmp_path, f"local{i}", offset_method=method))
+        assert summary['num_added_points'] == expected['num_added_points']
+        coords, labels = get_data_from_txt(summary['output_file'])
+        expected_coords, expected_labels = get_data_from_txt(
+            expected['output_file'])
+        np.testing.assert_array_equal(coords, expected_coords)
+        assert list(labels) == list(expected_labels)
+
+    stats = request_stats(server_url)
+    assert stats['num_requests'] == len(methods)
+    assert stats['num_errors'] == 0
+    assert stats['cloud_cache']['misses'] + stats['cloud_cache']['hits'] == len(methods)
+    assert stats['cloud_cache']['size'] == 1
+    assert stats['index_cache']['hits'] >= 1
+    assert 0 < stats['latency_p50'] <= stats['latency_p99']
+
+
+def test_service_error(tmp_path, server_url):
+    with pytest.raises(RuntimeError, match="InvalidOffsets"):
+        request_offsets(server_url,
+                        _settings(tmp_path, "invalid", offset_method='InvalidOffsets'))
+    stats = request_stats(server_url)
+    assert stats['num_errors'] == 1
+
+
+@pytest.mark.parametrize("headers, status", [
+    ({'Content-Type': 'text/plain'}, 415),
+    ({'Content-Type': 'application/json', 'Host': 'example.com'}, 403),
+    ({'Content-Type': 'application/json', 'Host': '127.0.0.1.example.com:80'}, 403),
+])
+def test_service_rejects_foreign_requests(tmp_path, server_url, headers, status):
+    request = urllib.request.Request(
+        server_url + "/offset",
+        data=json.dumps(_settings(tmp_path, "rejected")).encode(),
+        headers=headers)
+    with pytest.raises(urllib.error.HTTPError) as excinfo:
+        urllib.request.urlopen(request)
+    assert excinfo.value.code == status
+    assert not (tmp_path / "rejected.txt").exists()
+    assert request_stats(server_url)['num_requests'] == 0
+
+
+def test_service_hashes_cloud_once(tmp_path, server_url, monkeypatch):
+    calls = []
+    coordinates_key = IndexCache.coordinates_key
+    monkeypatch.setattr(
+        IndexCache, 'coordinates_key',
+        staticmethod(lambda coords: calls.append(len(coords)) or
+                     coordinates_key(coords)))
+    for i, method in enumerate(['KDTreeOffsets', 'ConvexHullOffsets'] * 2):
+        request_offsets(server_url,
+                        _settings(tmp_path, f"served{i}", offset_method=method))
+    assert len(calls) == 1
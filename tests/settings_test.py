@@ -30,10 +30,62 @@ def tmp_cwd():
 def test_config_missing_required_setting():
     with pytest.raises(
             ValidationError,
-            match="4 validation errors for ConfigSettings") as exc_info:
+            match="1 validation error for ConfigSettings") as exc_info:
         config = ConfigSettings()
     assert "input_file" in str(exc_info.value)
-    assert "offset_magnitude" in str(exc_info.value)
+
+    with pytest.raises(ValidationError, match="offset_magnitude"):
+        config = ConfigSettings(input_file="data.txt", new_data_label=2)
+
+
+def test_config_offset_rules():
+    config = ConfigSettings(input_file="data.txt",
+                            offset_rules=[{
+                                "data_label_to_offset": "B",
+                                "offset_magnitudes": [1, 2.5],
+                                "new_data_label": "C"
+                            }])
+    assert config.offset_rules[0].offset_magnitudes == [1., 2.5]
+
+    # The single rule settings take the same labels as the offset rules
+    config = ConfigSettings(input_file="data.txt",
+                            offset_magnitude=2.0,
+                            data_label_to_offset="B",
+                            new_data_label="C")
+    assert (config.data_label_to_offset, config.new_data_label) == ("B", "C")
+
+    with pytest.raises(ValidationError, match="offset_magnitudes"):
+        ConfigSettings(input_file="data.txt",
+                       offset_rules=[{
+                           "data_label_to_offset": "B",
+                           "offset_magnitudes": [],
+                           "new_data_label": "C"
+                       }])
+
+
+def test_config_knn_settings():
+    config = ConfigSettings(input_file="data.txt",
+                            offset_magnitude=2.0,
+                            data_label_to_offset=1,
+                            new_data_label=2,
+                            offset_method="PCANormalOffsets",
+                            tile_budget=1000)
+    assert config.tile_budget == 1000
+
+    rule = {
+        "input_file": "data.txt",
+        "offset_magnitude": 2.0,
+        "data_label_to_offset": 1,
+        "new_data_label": 2
+    }
+    for name, value in [("tile_budget", 1000), ("knn_eps", 0.1),
+                        ("knn_subsample", 0.5)]:
+        with pytest.raises(ValidationError, match=f"{name} is only supported"):
+            ConfigSettings(**rule, offset_method="CentroidOffsets", **{name: value})
+    with pytest.raises(ValidationError, match="knn_subsample is not supported"):
+        ConfigSettings(**rule, knn_subsample=0.5, workers=2)
+    with pytest.raises(ValidationError, match="tile_budget is not supported"):
+        ConfigSettings(**rule, tile_budget=1000, workers=2)
 
 
 def test_config_invalid_input_ext(tmp_cwd):
@@ -45,5 +97,19 @@ def test_config_invalid_input_ext(tmp_cwd):
     }
     Path("config.yaml").write_text(yaml.dump(setting))
     with pytest.raises(ValidationError,
-                       match="Value error, Input file must be a text file."):
+                       match=r"Value error, Input file must be a text file \(.txt\) or a binary point cloud \(.pcb\)."):
         config = load_and_validate_config("config.yaml")
+
+
+@pytest.mark.parametrize("input_file",
+                         ["data.txt", "data.pcb", "data.txt.gz", "data.txt.zst"])
+def test_config_valid_input_ext(tmp_cwd, input_file):
+    setting = {
+        "input_file": input_file,
+        "offset_magnitude": 2.0,
+        "data_label_to_offset": 1,
+        "new_data_label": 2,
+    }
+    Path("config.yaml").write_text(yaml.dump(setting))
+    config = load_and_validate_config("config.yaml")
+    assert config.input_file == input_file
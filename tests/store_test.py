@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from point_utils.store import PointStore
+
+
+@pytest.fixture
+def points():
+    return np.arange(12, dtype=float).reshape(4, 3), np.array(['A', 'B', 'A', 'B'])
+
+
+def test_append_doubles_capacity(points):
+    all_coordinates, labels = points
+    store = PointStore(all_coordinates, labels)
+    # No copy before the first append
+    assert store.coordinates is all_coordinates
+
+    buffers = set()
+    for i in range(100):
+        store.append(np.full((2, 3), i), 'C')
+        buffers.add(id(store._coordinates))
+    # Reallocations are logarithmic in the number of appends
+    assert len(buffers) <= 8
+
+    assert len(store) == 204
+    np.testing.assert_array_equal(store.coordinates[:4], all_coordinates)
+    np.testing.assert_array_equal(store.added_coordinates[-2:], np.full((2, 3), 99))
+    assert store.labels.tolist() == labels.tolist() + ['C'] * 200
+    assert np.shares_memory(store.added_coordinates, store.coordinates)
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_append_to_integer_points(lazy):
+    store = PointStore(np.arange(6).reshape(2, 3), ['A', 'B'], lazy=lazy)
+    store.append([[0.25, 0.5, 0.75]], 'C')
+
+    assert store.coordinates.dtype == np.float64
+    np.testing.assert_array_equal(store.coordinates,
+                                  [[0, 1, 2], [3, 4, 5], [0.25, 0.5, 0.75]])
+
+
+def test_lazy_store(points):
+    all_coordinates, labels = points
+    store = PointStore(all_coordinates, labels, lazy=True)
+    store.append([[1., 2., 3.]], 'long_label')
+
+    # The original points are not copied
+    assert store.original_coordinates is all_coordinates
+    np.testing.assert_array_equal(store.added_coordinates, [[1., 2., 3.]])
+    assert store.added_labels.tolist() == ['long_label']
+
+    coordinates, labels_all = store.materialize()
+    assert store.coordinates is coordinates
+    assert coordinates.flags.c_contiguous
+    np.testing.assert_array_equal(coordinates[-1], [1., 2., 3.])
+    assert labels_all.tolist() == ['A', 'B', 'A', 'B', 'long_label']
+
+
+def test_mismatch():
+    with pytest.raises(ValueError, match="mismatch"):
+        PointStore(np.zeros((2, 3)), ['A'])
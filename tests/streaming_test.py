@@ -0,0 +1,88 @@
+import io
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from point_utils.offsetter import offset_factory
+from point_utils.streaming import iter_point_chunks, stream_offsets
+
+
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(0)
+    all_coordinates = rng.normal(size=(300, 3))
+    labels = np.where(np.arange(300) % 3 == 0, 'B', 'A')
+    return all_coordinates, labels
+
+
+def _offsetter(method, points):
+    all_coordinates, labels = points
+    return offset_factory(method,
+                          all_coordinates=all_coordinates,
+                          labels=labels,
+                          data_label_to_offset='B',
+                          offset_magnitude=0.5,
+                          new_data_label='C',
+                          seed=0)
+
+
+@pytest.mark.parametrize(
+    "method", ["KDTreeOffsets", "ConvexHullOffsets", "CentroidOffsets"])
+def test_query_offset_vecs(method, points):
+    # Querying the selected points gives the offsets of the selected points
+    offsetter = _offsetter(method, points)
+    queries = offsetter.all_coordinates[offsetter.point_indices]
+    np.testing.assert_allclose(offsetter.query_offset_vecs(queries),
+                               offsetter.get_offset_vecs(),
+                               rtol=1e-12)
+
+    # The index is rebuilt once points were added
+    state = offsetter.get_query_state()
+    assert offsetter.get_query_state() is state
+    offsetter.add_offset_points()
+    assert offsetter.get_query_state() is not state
+
+
+def test_stream_offsets(points):
+    offsetter = _offsetter('KDTreeOffsets', points)
+    queries = offsetter.all_coordinates[offsetter.point_indices]
+    lines = [f"{x} {y} {z}\n" for x, y, z in queries[:50].tolist()]
+    lines += ["\n", "# comment\n"]
+    lines += [f"B {x} {y} {z}\n" for x, y, z in queries[50:].tolist()]
+
+    output = io.StringIO()
+    stats = stream_offsets(offsetter,
+                           io.StringIO("".join(lines)),
+                           output,
+                           chunk_size=32,
+                           num_neighbors=5)
+
+    assert stats.num_points == len(queries)
+    assert stats.num_chunks == int(np.ceil(len(queries) / 32))
+    assert stats.summary()['throughput'] > 0
+
+    out_lines = output.getvalue().splitlines()
+    assert all(line.startswith("C ") for line in out_lines)
+    new_points = np.array([line.split()[1:] for line in out_lines], dtype=float)
+    np.testing.assert_allclose(
+        new_points, queries + offsetter.get_offset_vecs(num_neighbors=5))
+
+
+def test_max_latency():
+    read_fd, write_fd = os.pipe()
+    with open(read_fd, "r") as reader, open(write_fd, "w") as writer:
+        writer.write("1 2 3\n4 5 6\n")
+        writer.flush()
+
+        chunks = iter_point_chunks(reader, chunk_size=100, max_latency=0.05)
+        # The partial chunk is emitted although the stream is still open
+        coordinates, _ = next(chunks)
+        np.testing.assert_array_equal(coordinates, [[1, 2, 3], [4, 5, 6]])
+
+        writer.write("7 8 9\n")
+        writer.close()
+        coordinates, _ = next(chunks)
+        np.testing.assert_array_equal(coordinates, [[7, 8, 9]])
+        assert next(chunks, None) is None
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from point_utils.offsetter import KDTreeOffsets, PCANormalOffsets
+from point_utils.tiling import TileSet, tiled_knn_offset_vecs
+
+
+@pytest.fixture
+def clustered_cloud():
+    rng = np.random.default_rng(0)
+    # A dense blob and a sparse flat slab
+    all_coordinates = np.concatenate([
+        rng.normal(size=(1500, 3)),
+        rng.uniform(-5, 5, size=(1500, 3)) * [1., 1., 0.01]
+    ])
+    labels = np.where(rng.random(len(all_coordinates)) < 0.2, 'B', 'A')
+    return all_coordinates, labels
+
+
+def test_tile_set_partitions_points(clustered_cloud, tmp_path):
+    all_coordinates, _ = clustered_cloud
+    tiles = TileSet(all_coordinates, points_per_tile=100, directory=tmp_path)
+
+    assert tiles.counts.max() <= 100
+    indices = np.concatenate(
+        [tiles.load_tile(i)[1] for i in np.flatnonzero(tiles.counts)])
+    np.testing.assert_array_equal(np.sort(indices), np.arange(len(all_coordinates)))
+
+
+@pytest.mark.parametrize("offset_class", [KDTreeOffsets, PCANormalOffsets])
+@pytest.mark.parametrize("tile_budget", [50, 400, 10_000])
+def test_tiled_matches_in_memory(clustered_cloud, tmp_path, tile_budget,
+                                 offset_class):
+    all_coordinates, labels = clustered_cloud
+    offset_calculator = offset_class(all_coordinates=all_coordinates,
+                                     labels=labels,
+                                     data_label_to_offset='B',
+                                     offset_magnitude=2.0,
+                                     new_data_label='C')
+    expected = offset_calculator.get_offset_vecs(num_neighbors=8)
+
+    # Results are written to a memory-mapped output file
+    out = np.lib.format.open_memmap(tmp_path / "offsets.npy",
+                                    mode="w+",
+                                    shape=expected.shape)
+    offset_vectors = offset_calculator.get_offset_vecs(num_neighbors=8,
+                                                       tile_budget=tile_budget,
+                                                       out=out)
+    assert offset_vectors is out
+    np.testing.assert_array_equal(np.load(tmp_path / "offsets.npy"), expected)
+
+
+def test_tiled_too_few_points():
+    with pytest.raises(ValueError, match="fewer than 10 points"):
+        tiled_knn_offset_vecs(np.zeros((5, 3)), np.arange(5), 10, 1.)
@@ -1,7 +1,15 @@
+import logging
+import subprocess
+import sys
+from pathlib import Path
+import numpy as np
 import pytest
 from unittest.mock import patch, call, MagicMock
 
-from point_utils.utils import visualize
+import point_utils
+from point_utils.utils import (ProgressLog, get_data_from_txt,
+                               load_point_cloud, save_point_cloud, save_to_txt,
+                               visualize, voxel_downsample)
 
 
 @patch('builtins.print')
@@ -25,4 +33,203 @@ def test_visualize(mock_get_data_from_txt, mock_plt, mock_print):
     # Ensure plt methods are called
     assert mock_plt.figure.called
     assert mock_plt.savefig.called
-    assert mock_plt.show.called
\ No newline at end of file
+    assert mock_plt.show.called
+
+
+@pytest.mark.parametrize("statement", [
+    "import point_utils", "from point_utils import ConfigSettings, offset_factory",
+    "from point_utils.pipeline import run_job"
+])
+def test_imports_are_lazy(statement):
+    # Heavy dependencies are only imported by the functions using them
+    code = (f"import sys; {statement}; "
+            "print(sorted({'matplotlib', 'scipy'} & set(sys.modules)))")
+    output = subprocess.run([sys.executable, "-c", code],
+                            check=True,
+                            capture_output=True,
+                            text=True).stdout
+    assert output.strip() == "[]"
+
+
+def test_star_import():
+    code = ("import sys; from point_utils import *; "
+            "print(offset_factory.__name__, ConfigSettings.__name__, "
+            "'point_utils.settings' in sys.modules, DEFAULT_OUT_TXT, "
+            "DEFAULT_FIG_NAME, BINARY_SUFFIX, KNN_OFFSET_METHODS[0])")
+    output = subprocess.run([sys.executable, "-c", code],
+                            check=True,
+                            capture_output=True,
+                            text=True).stdout
+    assert output.split() == [
+        "offset_factory", "ConfigSettings", "True", "output.txt", "output.png",
+        ".pcb", "KDTreeOffsets"
+    ]
+    # Every exported name is defined by its submodule
+    for name in point_utils.__all__:
+        getattr(point_utils, name)
+
+
+def test_exported_names_resolve_lazily():
+    # offset_factory is found without importing settings and pydantic first
+    code = ("import sys, point_utils; point_utils.offset_factory; "
+            "print(sorted({'point_utils.settings', 'pydantic'} & set(sys.modules)))")
+    output = subprocess.run([sys.executable, "-c", code],
+                            check=True,
+                            capture_output=True,
+                            text=True).stdout
+    assert output.strip() == "[]"
+    assert set(point_utils.__all__) <= set(dir(point_utils))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 64, 2**22])
+def test_get_data_from_txt_chunks(tmp_path, chunk_size):
+    inp_file = tmp_path / "data.txt"
+    text = ("# label x y z\n"
+            "A 1.5 -2 3e-3\n"
+            "\n"
+            "B 0.1 0.2 0.3  # comment\n"
+            "long_label 4 5 6")
+    inp_file.write_text(text)
+    progress = MagicMock()
+
+    all_coordinates, labels = get_data_from_txt(inp_file,
+                                                chunk_size=chunk_size,
+                                                progress=progress)
+
+    np.testing.assert_array_equal(
+        all_coordinates, [[1.5, -2., 3e-3], [0.1, 0.2, 0.3], [4., 5., 6.]])
+    assert all_coordinates.dtype == np.float64
+    assert labels.tolist() == ["A", "B", "long_label"]
+    assert progress.call_args == call(5, len(text))
+
+
+def test_get_data_from_txt_invalid(tmp_path):
+    inp_file = tmp_path / "data.txt"
+    inp_file.write_text("A 1 2 3\nB 1 2\n")
+    with pytest.raises(ValueError, match="Error reading data from file"):
+        get_data_from_txt(inp_file)
+
+    # The columns of the two lines add up to a multiple of 4
+    inp_file.write_text("1 1 2\n2 4 5 6 7\n")
+    with pytest.raises(ValueError, match="line 1: '1 1 2'"):
+        get_data_from_txt(inp_file)
+
+    # Whitespace outside ASCII separates columns as in `str.split`
+    inp_file.write_text("A\u00a01 2 3\nB 1 2\u20033 4\n", encoding="utf-8")
+    with pytest.raises(ValueError, match="line 2"):
+        get_data_from_txt(inp_file)
+
+
+def test_load_point_cloud_logs_progress(tmp_path, caplog):
+    inp_file = tmp_path / "data.txt"
+    inp_file.write_text("A 1 2 3\n" * 100)
+
+    with caplog.at_level(logging.INFO, logger="point_utils.utils"):
+        load_point_cloud(inp_file, chunk_size=64)
+        assert f"Read 100 points from {inp_file}" in caplog.messages
+
+        caplog.clear()
+        ProgressLog(inp_file, interval=0)(100, 800)
+        assert caplog.messages == [f"Reading {inp_file}: 100 lines, 0.0 MiB"]
+
+
+def test_binary_round_trip(tmp_path):
+    data_file = Path(__file__).parent / "data" / "cdd.txt"
+    all_coordinates, labels = load_point_cloud(data_file)
+
+    binary_file = tmp_path / "cdd.pcb"
+    save_point_cloud(binary_file, all_coordinates, labels)
+    coordinates_read, labels_read = load_point_cloud(binary_file)
+
+    assert isinstance(coordinates_read, np.memmap)
+    np.testing.assert_array_equal(coordinates_read, all_coordinates)
+    np.testing.assert_array_equal(labels_read, labels)
+
+    # Convert back to text
+    text_file = tmp_path / "cdd.txt"
+    save_point_cloud(text_file, coordinates_read, labels_read)
+    coordinates_read, labels_read = load_point_cloud(text_file)
+    np.testing.assert_array_equal(coordinates_read, all_coordinates)
+    np.testing.assert_array_equal(labels_read, labels)
+
+
+def test_voxel_downsample():
+    rng = np.random.default_rng(0)
+    # A dense cluster, a sparse background and a rare label
+    coordinates = np.concatenate(
+        (rng.normal(scale=0.01, size=(20_000, 3)), rng.random((500, 3)) * 10))
+    codes = np.zeros(len(coordinates), dtype=np.uint8)
+    codes[-5:] = 1
+
+    indices = voxel_downsample(coordinates, codes, 1000)
+    assert len(indices) <= 1000
+    assert np.all(np.diff(indices) > 0)
+    assert np.count_nonzero(codes[indices] == 1) == 5
+    # The sparse background is kept rather than sampled proportionally
+    assert np.count_nonzero(indices >= 20_000) > 250
+
+
+@patch('point_utils.utils.plt')
+def test_visualize_headless(mock_plt, tmp_path):
+    inp_file = tmp_path / "data.txt"
+    rng = np.random.default_rng(0)
+    save_point_cloud(inp_file, rng.random((5000, 3)),
+                     np.where(rng.random(5000) < 0.5, 'A', 'B'))
+
+    output_file = tmp_path / "figure.png"
+    visualize(inp_file, output_file, max_points=100, show=False)
+    assert output_file.stat().st_size > 0
+    assert not mock_plt.show.called
+    assert not mock_plt.figure.called
+
+
+@pytest.mark.parametrize("suffix", [".txt", ".txt.gz", ".txt.zst"])
+def test_save_to_txt_stream(tmp_path, suffix):
+    if suffix == ".txt.zst":
+        pytest.importorskip("zstandard")
+    rng = np.random.default_rng(0)
+    all_coordinates = rng.normal(size=(1000, 3)) * 1e3
+    labels = np.where(rng.random(1000) < 0.5, 'A', 'long_label')
+
+    # Small blocks and an append of the last points
+    out_file = tmp_path / f"data{suffix}"
+    save_to_txt(out_file, all_coordinates[:600], labels[:600], chunk_size=64)
+    save_to_txt(out_file, all_coordinates[600:], labels[600:], append=True)
+
+    coordinates, read_labels = get_data_from_txt(out_file)
+    np.testing.assert_array_equal(coordinates, all_coordinates)
+    assert read_labels.tolist() == labels.tolist()
+
+    if suffix == ".txt":
+        # Same output as formatting all points as strings with savetxt
+        expected_file = tmp_path / "expected.txt"
+        np.savetxt(expected_file,
+                   np.column_stack([labels, all_coordinates]),
+                   fmt='%s')
+        assert out_file.read_text() == expected_file.read_text()
+
+
+def test_save_to_txt_precision(tmp_path):
+    out_file = tmp_path / "data.txt"
+    save_to_txt(out_file, np.array([[1., -2.5, 1 / 3]]), ['A'], precision=3)
+    assert out_file.read_text() == "A 1.000 -2.500 0.333\n"
+
+
+def test_float32_round_trip(tmp_path):
+    inp_file = tmp_path / "data.txt"
+    inp_file.write_text("A 1.001 -2.5 100.123\nB 0.1 1e-3 123456.7\n")
+    all_coordinates, labels = get_data_from_txt(inp_file, dtype=np.float32)
+    assert all_coordinates.dtype == np.float32
+
+    out_file = tmp_path / "out.txt"
+    save_to_txt(out_file, all_coordinates, labels)
+    assert out_file.read_text() == ("A 1.001 -2.5 100.123\n"
+                                    "B 0.1 0.001 123456.7\n")
+    np.testing.assert_array_equal(
+        get_data_from_txt(out_file, dtype=np.float32)[0], all_coordinates)
+
+    save_point_cloud(tmp_path / "data.pcb", all_coordinates, labels)
+    binary_coordinates, _ = load_point_cloud(tmp_path / "data.pcb")
+    assert binary_coordinates.dtype == np.float32
+    assert load_point_cloud(tmp_path / "data.pcb",
+                            dtype=np.float64)[0].dtype == np.float64